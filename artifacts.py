@@ -0,0 +1,196 @@
+import os
+import json
+import logging
+from datetime import datetime
+
+import storage
+from storage import file_sha256
+from pdf_stamp import PDF_NAME
+from storage_layout import BASE_DIR, PDF_DIR, FORMS_DIR, UPLOADS_DIR, shard, list_files
+
+logger = logging.getLogger(__name__)
+
+# Artifact kinds
+KIND_PDF = 'pdf'
+KIND_DOCUMENTATION = 'documentation'
+KIND_SIGNATURE = 'signature'
+
+
+def stored_path(path):
+    """Path as kept in the index: relative to the app directory when inside it"""
+    absolute = os.path.abspath(path)
+    if absolute.startswith(BASE_DIR + os.sep):
+        return os.path.relpath(absolute, BASE_DIR).replace(os.sep, '/')
+    return absolute
+
+
+def resolve_path(path):
+    """Absolute path of an indexed file"""
+    return path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+
+
+def register_artifact(session, artifact_model, form_type, form_id, kind, path, status=None, created_at=None):
+    """
+    Add a generated or uploaded file to the artifact index. The caller commits.
+
+    Args:
+        session: Database session
+        artifact_model: The GeneratedArtifact model
+        form_type: e.g. 'medical_withdrawal'
+        form_id: ID of the request the file belongs to
+        kind: KIND_PDF, KIND_DOCUMENTATION or KIND_SIGNATURE
+        path: Path of the file
+        status: Request status a PDF was rendered for
+        created_at: Defaults to now
+
+    Returns:
+        GeneratedArtifact: The new row, or None if the file does not exist
+    """
+    if path and os.path.isfile(path):
+        size, sha256 = os.path.getsize(path), file_sha256(path)
+    else:
+        # Written on another node: described from the stored object, not downloaded
+        described = storage.describe(path)
+        if not described:
+            logger.warning(f"Not indexing missing file for {form_type} #{form_id}: {path}")
+            return None
+        size, sha256 = described
+        path = storage.local_path(path)
+
+    artifact = artifact_model(
+        form_type=form_type,
+        form_id=form_id,
+        status=status,
+        kind=kind,
+        path=stored_path(path),
+        size=size,
+        sha256=sha256,
+        created_at=created_at or datetime.utcnow()
+    )
+    session.add(artifact)
+    return artifact
+
+
+def latest_artifact(artifact_model, form_type, form_id, kind=KIND_PDF, status=None):
+    """
+    Newest indexed file of a request that is still stored.
+
+    Returns:
+        GeneratedArtifact: The artifact, or None
+    """
+    query = artifact_model.query.filter_by(form_type=form_type, form_id=form_id, kind=kind)
+    if status:
+        query = query.filter_by(status=status)
+    artifact = query.order_by(artifact_model.created_at.desc(), artifact_model.id.desc()).first()
+
+    if artifact and storage.exists(artifact.path):
+        return artifact
+    return None
+
+
+def artifact_at(artifact_model, form_type, form_id, kind, index):
+    """The index-th file of a kind registered for a request (e.g. documentation uploads)"""
+    artifact = artifact_model.query.filter_by(form_type=form_type, form_id=form_id, kind=kind).order_by(
+        artifact_model.id).offset(index).first()
+
+    if artifact and storage.exists(artifact.path):
+        return artifact
+    return None
+
+
+def forget_path(artifact_model, path):
+    """Drop the index rows of a deleted file. The caller commits."""
+    return artifact_model.query.filter_by(path=stored_path(path)).delete(synchronize_session=False)
+
+
+# -------------------------------
+# Backfill
+# -------------------------------
+
+def find_file(path, directory):
+    """
+    Locate a file recorded in a request row. Older rows hold absolute paths
+    from another checkout or paths relative to static/, and pdf_link/sig_link
+    hold paths relative to their directory, so fall back to the file name in
+    the directory it belongs in, flat or in its shard.
+    """
+    if not path:
+        return None
+    name = os.path.basename(path)
+    candidates = [path, os.path.join(BASE_DIR, path), os.path.join(BASE_DIR, 'static', path),
+                  os.path.join(directory, path), os.path.join(directory, name),
+                  os.path.join(directory, *shard(name).split('/'), name)]
+    for candidate in candidates:
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def _json_list(value):
+    try:
+        return json.loads(value) if value else []
+    except ValueError:
+        return []
+
+
+def _mtime(path):
+    return datetime.utcfromtimestamp(os.path.getmtime(path))
+
+
+def index_existing_files(db, artifact_model, form_models):
+    """
+    Index the files referenced by existing requests, plus status PDFs in
+    static/pdfs that no request lists. Files already indexed are skipped, so
+    the backfill can be re-run.
+
+    Args:
+        db: The SQLAlchemy instance (inside an app context)
+        artifact_model: The GeneratedArtifact model
+        form_models: Dict of form type -> request model
+
+    Returns:
+        dict: Number of artifacts added per kind
+    """
+    indexed = {path for (path,) in artifact_model.query.with_entities(artifact_model.path)}
+    added = {KIND_PDF: 0, KIND_DOCUMENTATION: 0, KIND_SIGNATURE: 0}
+
+    def add(form_type, form_id, kind, path, status=None):
+        if not path or stored_path(path) in indexed:
+            return
+        if register_artifact(db.session, artifact_model, form_type, form_id, kind, path,
+                             status=status, created_at=_mtime(path)):
+            indexed.add(stored_path(path))
+            added[kind] += 1
+
+    for form_type, model in form_models.items():
+        for record in model.query.yield_per(200):
+            if hasattr(model, 'generated_pdfs'):
+                for pdf in _json_list(record.generated_pdfs):
+                    match = PDF_NAME.match(os.path.basename(pdf))
+                    add(form_type, record.id, KIND_PDF, find_file(pdf, PDF_DIR),
+                        match.group('status') if match else record.status)
+
+            if hasattr(model, 'pdf_link') and record.pdf_link:
+                add(form_type, record.id, KIND_PDF, find_file(record.pdf_link, FORMS_DIR), record.status)
+
+            if hasattr(model, 'documentation_files'):
+                for doc in _json_list(record.documentation_files):
+                    add(form_type, record.id, KIND_DOCUMENTATION,
+                        find_file(doc, os.path.join(UPLOADS_DIR, 'documentation')))
+
+            signature = getattr(record, 'sig_link', None) or getattr(record, 'signature', None)
+            if signature and not signature.startswith('data:'):
+                add(form_type, record.id, KIND_SIGNATURE, find_file(signature, os.path.join(UPLOADS_DIR, 'signatures')))
+
+        db.session.commit()
+
+    # PDFs generated on download are not listed in any request row
+    if os.path.isdir(PDF_DIR):
+        for relative in list_files(PDF_DIR):
+            match = PDF_NAME.match(os.path.basename(relative))
+            if match and match.group('form') in form_models:
+                add(match.group('form'), int(match.group('id')), KIND_PDF, os.path.join(PDF_DIR, relative),
+                    match.group('status'))
+        db.session.commit()
+
+    return added
@@ -0,0 +1,329 @@
+"""
+PDF rendering benchmarks.
+
+Renders synthetic requests of each form type and reports latency
+percentiles, throughput, peak RSS and output size:
+
+    python bench_render.py                         # all forms, serial + 4-way
+    python bench_render.py --forms ferpa -n 40 -c 1 -c 8
+    python bench_render.py --backend latex --compare instance/benchmarks/<older>.json
+
+Before/after for the precompiled LaTeX formats (latex_formats.py):
+
+    python bench_render.py --backend latex --no-formats --output instance/benchmarks/plain.json
+    python bench_render.py --backend latex --compare instance/benchmarks/plain.json
+
+"cold" renders run each request in a fresh worker process (imports done,
+nothing rendered yet); "warm" workers render one untimed request first. The
+render cache is disabled unless --cache is given, so every timed render
+does the full work. Results are written to instance/benchmarks/ as JSON.
+"""
+import os
+import sys
+import json
+import math
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import subprocess
+import multiprocessing
+from types import SimpleNamespace
+from datetime import datetime, date
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'instance', 'benchmarks')
+
+FORM_TYPES = ['medical_withdrawal', 'student_drop', 'ferpa', 'infochange']
+
+# Request IDs used by the benchmark, well away from real rows
+ID_OFFSET = 900000
+
+
+# -------------------------------
+# Synthetic requests
+# -------------------------------
+
+def synthetic_request(form_type, index):
+    """
+    A request object (medical withdrawal, student drop) or template data dict
+    (FERPA, Name/SSN change) with realistic field lengths. The index is part
+    of the content, so no two renders are identical.
+    """
+    request_id = ID_OFFSET + index
+    name = f"Benchmark Student {index}"
+
+    if form_type == 'medical_withdrawal':
+        courses = [{'subject': 'COSC', 'number': str(4351 + n), 'section': f"{n + 1:05d}",
+                    'title': f"Course Title Number {n}"} for n in range(4)]
+        return SimpleNamespace(
+            id=request_id, status='pending', first_name='Benchmark', middle_name='Q',
+            last_name=f"Student{index}", myuh_id=str(1000000 + index), college='Natural Sciences & Mathematics',
+            plan_degree='Computer Science, BS', phone='713-555-0100', address='4800 Calhoun Rd',
+            city='Houston', state='TX', zip_code='77004', user=SimpleNamespace(email_=f"student{index}@uh.edu"),
+            term_year='Spring 2025', last_date=date(2025, 3, 1), reason_type='medical',
+            details='Extended hospital stay during the second half of the term. ' * 6,
+            financial_assistance=True, health_insurance=False, campus_housing=True, visa_status=False,
+            gi_bill=False, initial='BS', signature=name, signature_date=date(2025, 3, 2),
+            created_at=datetime(2025, 3, 2, 12, 0), courses=json.dumps(courses),
+        )
+
+    if form_type == 'student_drop':
+        return SimpleNamespace(
+            id=request_id, status='pending', student_name=name, student_id=str(1000000 + index),
+            course_title='COSC 4351 - Fundamentals of Software Engineering',
+            reason='Schedule conflict with a required lab section and work hours. ' * 3,
+            date=date(2025, 3, 3), created_at=datetime(2025, 3, 3, 9, 30), signature=name,
+        )
+
+    # FERPA and Name/SSN data go through the same helpers as the render worker
+    import form_utils
+    signatures_dir = os.path.join(BASE_DIR, 'static', 'uploads', 'signatures')
+
+    if form_type == 'ferpa':
+        return form_utils.ferpa_data_from_request(SimpleNamespace(
+            name=name, campus='Main', official_choices='registrar,aid', official_other='',
+            info_choices='academics,billing', info_other='', release_choices='family', release_other='',
+            release_to='Parent or guardian', additional_names='', purpose='Billing questions',
+            password=f"pass{index}", peoplesoft_id=str(1000000 + index), date=date(2025, 3, 1), sig_link=None,
+        ), signatures_dir)
+
+    if form_type == 'infochange':
+        return form_utils.infochange_data_from_request(SimpleNamespace(
+            name=name, peoplesoft_id=str(1000000 + index), choice='name', nmchg_reason='marriage',
+            ssnchg_reason='', fname_old='Benchmark', mname_old='Q', lname_old=f"Sample{index}", sfx_old='',
+            fname_new='Benchmark', mname_new='Q', lname_new=f"Student{index}", sfx_new='',
+            ssn_old='', ssn_new='', date=date(2025, 3, 1), sig_link=None,
+        ), signatures_dir)
+
+    raise ValueError(f"Unknown form type: {form_type}")
+
+
+def render(form_type, index, output_dir):
+    """
+    Render one synthetic request with the production entry point for the form.
+
+    Returns:
+        str: Path of the PDF, or None if rendering failed
+    """
+    from form_renderers import get_renderer, render as render_request, render_fields
+    request = synthetic_request(form_type, index)
+    if form_type in ('medical_withdrawal', 'student_drop'):
+        return render_request(form_type, request)
+
+    # FERPA and Name/SSN take template data rather than a request row
+    return render_fields(form_type, request, os.path.join(output_dir, get_renderer(form_type).output_name(request, None)))
+
+
+# -------------------------------
+# Workers
+# -------------------------------
+
+def _peak_rss_kb():
+    """Peak RSS of this worker and of its largest finished child (pdflatex)"""
+    if resource is None:
+        return 0
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+def _run_batch(form_type, indexes, warm, output_dir):
+    """
+    Render the given synthetic requests in this worker process.
+
+    Returns:
+        dict: latencies (s), sizes (bytes), failures and peak_rss_kb
+    """
+    os.chdir(BASE_DIR)
+    if warm:
+        _discard(render(form_type, -1 - indexes[0], output_dir))
+
+    latencies, sizes, failures = [], [], 0
+    for index in indexes:
+        start = time.perf_counter()
+        pdf_path = render(form_type, index, output_dir)
+        elapsed = time.perf_counter() - start
+
+        if pdf_path and os.path.exists(pdf_path):
+            latencies.append(elapsed)
+            sizes.append(os.path.getsize(pdf_path))
+        else:
+            failures += 1
+        _discard(pdf_path)
+
+    return {'latencies': latencies, 'sizes': sizes, 'failures': failures, 'peak_rss_kb': _peak_rss_kb()}
+
+
+def _discard(pdf_path):
+    """Remove a benchmark PDF so static/pdfs does not fill up"""
+    if pdf_path and os.path.exists(pdf_path):
+        os.remove(pdf_path)
+
+
+# -------------------------------
+# Scenarios
+# -------------------------------
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def run_scenario(form_type, mode, concurrency, iterations, output_dir):
+    """
+    Time `iterations` renders of one form type at the given concurrency.
+
+    Cold scenarios use one fresh process per render; warm scenarios split the
+    renders over `concurrency` long-lived workers.
+    """
+    context = multiprocessing.get_context('spawn')
+    indexes = list(range(iterations))
+
+    if mode == 'cold':
+        batches = [[index] for index in indexes]
+        pool = context.Pool(processes=concurrency, maxtasksperchild=1)
+    else:
+        batches = [indexes[worker::concurrency] for worker in range(concurrency)]
+        batches = [batch for batch in batches if batch]
+        pool = context.Pool(processes=concurrency)
+
+    start = time.perf_counter()
+    with pool:
+        results = pool.starmap(_run_batch, [(form_type, batch, mode == 'warm', output_dir) for batch in batches],
+                               chunksize=1)
+    wall_time = time.perf_counter() - start
+
+    latencies = [value for result in results for value in result['latencies']]
+    sizes = [value for result in results for value in result['sizes']]
+    return {
+        'form_type': form_type,
+        'mode': mode,
+        'concurrency': concurrency,
+        'renders': len(latencies),
+        'failures': sum(result['failures'] for result in results),
+        'p50_ms': _ms(percentile(latencies, 0.50)),
+        'p95_ms': _ms(percentile(latencies, 0.95)),
+        'mean_ms': _ms(sum(latencies) / len(latencies) if latencies else None),
+        'throughput_per_s': round(len(latencies) / wall_time, 2) if wall_time else None,
+        'wall_time_s': round(wall_time, 3),
+        'peak_rss_mb': round(max(result['peak_rss_kb'] for result in results) / 1024.0, 1),
+        'mean_size_bytes': int(sum(sizes) / len(sizes)) if sizes else None,
+    }
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def environment_info(args):
+    """What the results were measured on, so runs can be compared"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True).stdout.strip()
+    except OSError:
+        commit = None
+
+    from latex_runner import find_pdflatex
+    pdflatex = find_pdflatex()
+    version = None
+    if pdflatex:
+        version = subprocess.run([pdflatex, '--version'], stdout=subprocess.PIPE, text=True).stdout.splitlines()[0]
+
+    return {
+        'commit': commit,
+        'timestamp': datetime.utcnow().isoformat(timespec='seconds') + 'Z',
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'pdflatex': version,
+        'pdf_backends': os.environ.get('PDF_BACKENDS'),
+        'render_cache': os.environ.get('RENDER_CACHE_ENABLED'),
+        'latex_formats': os.environ.get('LATEX_FORMATS_ENABLED'),
+        'iterations': args.iterations,
+    }
+
+
+def print_table(results, baseline=None):
+    previous = {(r['form_type'], r['mode'], r['concurrency']): r for r in (baseline or {}).get('results', [])}
+    print(f"{'Form':<20} {'Mode':<5} {'N':>3} {'p50 ms':>9} {'p95 ms':>9} {'renders/s':>10} "
+          f"{'RSS MB':>7} {'KB':>7} {'fail':>5}{'  p50 vs baseline' if previous else ''}")
+    for r in results:
+        line = (f"{r['form_type']:<20} {r['mode']:<5} {r['concurrency']:>3} {_cell(r['p50_ms']):>9} "
+                f"{_cell(r['p95_ms']):>9} {_cell(r['throughput_per_s']):>10} {_cell(r['peak_rss_mb']):>7} "
+                f"{_cell(r['mean_size_bytes'] and round(r['mean_size_bytes'] / 1024.0, 1)):>7} {r['failures']:>5}")
+        old = previous.get((r['form_type'], r['mode'], r['concurrency']))
+        if old and old.get('p50_ms') and r['p50_ms']:
+            line += f"  {(r['p50_ms'] - old['p50_ms']) / old['p50_ms']:+.0%}"
+        print(line)
+
+
+def _cell(value):
+    return '-' if value is None else value
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark PDF rendering for each form type')
+    parser.add_argument('--forms', nargs='+', choices=FORM_TYPES, default=FORM_TYPES)
+    parser.add_argument('-n', '--iterations', type=int, default=20, help='Timed renders per scenario')
+    parser.add_argument('-c', '--concurrency', type=int, action='append',
+                        help='Concurrency levels to run (repeatable, default 1 and 4)')
+    parser.add_argument('--modes', nargs='+', choices=['cold', 'warm'], default=['cold', 'warm'])
+    parser.add_argument('--backend', choices=['configured', 'latex', 'direct'], default='configured',
+                        help='PDF backend for forms that have a direct renderer')
+    parser.add_argument('--cache', action='store_true', help='Leave the render cache enabled')
+    parser.add_argument('--no-formats', action='store_true',
+                        help='Compile without precompiled LaTeX formats (the baseline for latex_formats.py)')
+    parser.add_argument('--output', help='Results file (default instance/benchmarks/<time>_<commit>.json)')
+    parser.add_argument('--compare', help='Earlier results file to compare p50 latency against')
+    args = parser.parse_args(argv)
+
+    # Inherited by the spawned workers
+    if not args.cache:
+        os.environ['RENDER_CACHE_ENABLED'] = '0'
+    if args.no_formats:
+        os.environ['LATEX_FORMATS_ENABLED'] = '0'
+    if args.backend != 'configured':
+        os.environ['PDF_BACKENDS'] = ','.join(f"{form}={args.backend}" for form in ('student_drop', 'infochange'))
+
+    output_dir = tempfile.mkdtemp(prefix='bench_render_')
+    results = []
+    try:
+        for form_type in args.forms:
+            for mode in args.modes:
+                for concurrency in args.concurrency or [1, 4]:
+                    print(f"Running {form_type} {mode} x{concurrency}...", file=sys.stderr)
+                    results.append(run_scenario(form_type, mode, concurrency, args.iterations, output_dir))
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+    report = {'environment': environment_info(args), 'results': results}
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        stamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+        output = os.path.join(RESULTS_DIR, f"{stamp}_{report['environment']['commit'] or 'unknown'}.json")
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    return 1 if any(r['failures'] for r in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import os
+import json
+import hashlib
+import logging
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+import click
+
+from artifacts import register_artifact, KIND_PDF
+from render_queue import render_snapshot, record_pdf, snapshot_request
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+CHECKPOINT_DIR = os.path.join(BASE_DIR, 'instance', 'render_checkpoints')
+
+# Column holding the submission time for each form type
+DATE_COLUMNS = {
+    'medical_withdrawal': 'created_at',
+    'student_drop': 'created_at',
+    'ferpa': 'time',
+    'infochange': 'time',
+}
+
+# Rows loaded from the database at a time
+BATCH_SIZE = 200
+
+
+def select_request_ids(model, form_type, statuses=None, since=None, until=None, ids=None):
+    """
+    IDs of the requests of one form type matching the filters, in ID order.
+
+    Args:
+        model: The request model for form_type
+        form_type: Key of DATE_COLUMNS
+        statuses: Only requests with one of these statuses
+        since: Only requests submitted on or after this datetime
+        until: Only requests submitted before this datetime
+        ids: Only these request IDs
+
+    Returns:
+        list: Matching request IDs
+    """
+    query = model.query.with_entities(model.id)
+    date_column = getattr(model, DATE_COLUMNS[form_type])
+
+    if statuses:
+        query = query.filter(model.status.in_(statuses))
+    if since:
+        query = query.filter(date_column >= since)
+    if until:
+        query = query.filter(date_column < until)
+    if ids:
+        query = query.filter(model.id.in_(ids))
+
+    return [row.id for row in query.order_by(model.id)]
+
+
+class Checkpoint:
+    """
+    Append-only record of the requests a bulk render has finished.
+
+    The file is named after the selection, so running the same command again
+    picks up where an interrupted run stopped.
+    """
+
+    def __init__(self, selection, checkpoint_dir=CHECKPOINT_DIR):
+        os.makedirs(checkpoint_dir, exist_ok=True)
+        digest = hashlib.sha256(json.dumps(selection, sort_keys=True, default=str).encode('utf-8'))
+        self.path = os.path.join(checkpoint_dir, f"{digest.hexdigest()[:16]}.done")
+        self.done = set()
+
+        if os.path.exists(self.path):
+            with open(self.path, 'r') as f:
+                self.done = {line.strip() for line in f if line.strip()}
+
+    def is_done(self, form_type, form_id):
+        return f"{form_type}:{form_id}" in self.done
+
+    def mark_done(self, form_type, form_id):
+        key = f"{form_type}:{form_id}"
+        self.done.add(key)
+        with open(self.path, 'a') as f:
+            f.write(key + '\n')
+
+    def clear(self):
+        self.done = set()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run_bulk_render(db, form_models, form_types, statuses=None, since=None, until=None,
+                    ids=None, workers=None, restart=False, artifact_model=None):
+    """
+    Re-render the selected requests on a process pool and point each request
+    at its new PDF.
+
+    Args:
+        db: The SQLAlchemy instance (inside an app context)
+        form_models: Dict of form type -> request model
+        form_types: Form types to render
+        statuses, since, until, ids: Filters, see select_request_ids()
+        workers: Number of worker processes (defaults to the CPU count)
+        restart: Ignore the checkpoint of an earlier run of the same selection
+        artifact_model: GeneratedArtifact model to register the new PDFs in
+
+    Returns:
+        tuple: (number rendered, list of (form_type, form_id, error) failures)
+    """
+    selection = {
+        'form_types': sorted(form_types),
+        'statuses': sorted(statuses or []),
+        'since': since,
+        'until': until,
+        'ids': sorted(ids or []),
+    }
+    checkpoint = Checkpoint(selection)
+    if restart:
+        checkpoint.clear()
+
+    # Everything still to do, as (form_type, form_id)
+    pending = []
+    for form_type in form_types:
+        for form_id in select_request_ids(form_models[form_type], form_type, statuses, since, until, ids):
+            if not checkpoint.is_done(form_type, form_id):
+                pending.append((form_type, form_id))
+
+    skipped = len(checkpoint.done)
+    if skipped:
+        click.echo(f"Resuming: {skipped} request(s) already rendered by an earlier run")
+    click.echo(f"Rendering {len(pending)} request(s) with {workers or os.cpu_count()} worker(s)")
+
+    rendered = 0
+    failures = []
+    # Keep the pool busy without loading every row up front
+    max_in_flight = (workers or os.cpu_count() or 1) * 4
+
+    with ProcessPoolExecutor(max_workers=workers) as executor, \
+            click.progressbar(length=len(pending), label='Rendering PDFs') as progress:
+        in_flight = {}
+        next_index = 0
+
+        try:
+            while next_index < len(pending) or in_flight:
+                # Submit the next batch of snapshots
+                while next_index < len(pending) and len(in_flight) < max_in_flight:
+                    batch = pending[next_index:next_index + min(BATCH_SIZE, max_in_flight - len(in_flight))]
+                    next_index += len(batch)
+                    for form_type, form_id in batch:
+                        record = db.session.get(form_models[form_type], form_id)
+                        if record is None:
+                            failures.append((form_type, form_id, 'Request no longer exists'))
+                            progress.update(1)
+                            continue
+                        # Full renders: stamping would reuse PDFs made with the old templates
+                        future = executor.submit(render_snapshot, form_type, snapshot_request(record), stamp=False)
+                        in_flight[future] = (form_type, form_id)
+
+                if not in_flight:
+                    continue
+
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    form_type, form_id = in_flight.pop(future)
+                    try:
+                        pdf_path = future.result()
+                        error = None if pdf_path and os.path.exists(pdf_path) else 'Renderer did not produce a PDF'
+                    except Exception as e:
+                        pdf_path, error = None, str(e)
+
+                    if error:
+                        failures.append((form_type, form_id, error))
+                    else:
+                        record = db.session.get(form_models[form_type], form_id)
+                        record_pdf(form_type, record, pdf_path)
+                        if artifact_model is not None:
+                            register_artifact(db.session, artifact_model, form_type, form_id, KIND_PDF,
+                                              pdf_path, status=record.status)
+                        db.session.commit()
+                        checkpoint.mark_done(form_type, form_id)
+                        rendered += 1
+                    progress.update(1)
+
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            click.echo(f"\nInterrupted after {rendered} PDF(s); run the same command again to resume")
+            raise
+
+    if not failures:
+        # Nothing left to resume
+        checkpoint.clear()
+
+    return rendered, failures
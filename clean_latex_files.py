@@ -0,0 +1,23 @@
+"""
+Scheduled storage cleanup, run by `make scheduled-cleanup` (e.g. from cron).
+
+Runs the storage janitor over every directory and request once: LaTeX
+byproducts and superseded status PDFs are removed, orphaned files are
+reported (and deleted with --delete-orphans or JANITOR_DELETE_ORPHANS=1).
+"""
+import sys
+
+from main import app, storage_janitor
+from storage_janitor import format_report
+
+
+if __name__ == '__main__':
+    dry_run = '--dry-run' in sys.argv
+    delete_orphans = True if '--delete-orphans' in sys.argv else None
+
+    with app.app_context():
+        report = storage_janitor.run_cycle(dry_run=dry_run, delete_orphans=delete_orphans)
+
+    print(("Would clean: " if dry_run else "Cleaned: ") + format_report(report))
+    for path in report['orphans']:
+        print(f"  orphan: {path}")
@@ -0,0 +1,332 @@
+import os
+import logging
+
+from pdf_canvas import PDFCanvas
+
+logger = logging.getLogger(__name__)
+
+# Page geometry matching the LaTeX templates (1in margins, US Letter)
+MARGIN = 72
+BODY_SIZE = 11
+SIGNATURE_WIDTH = 142  # 5cm, as in the templates
+
+
+class FormLayout:
+    """
+    Top-to-bottom layout helper on a PDFCanvas: keeps a cursor, starts a new
+    page when content would run into the bottom margin and adds page footers.
+    """
+
+    def __init__(self, footer=None):
+        self.canvas = PDFCanvas()
+        self.left = MARGIN
+        self.right = self.canvas.width - MARGIN
+        self.y = MARGIN
+        self.footer = footer
+
+    @property
+    def width(self):
+        return self.right - self.left
+
+    def ensure_space(self, height):
+        if self.y + height > self.canvas.height - MARGIN:
+            self.canvas.new_page()
+            self.y = MARGIN
+
+    def space(self, points):
+        self.y += points
+
+    def centered(self, text, style='regular', size=BODY_SIZE):
+        self.ensure_space(size * 1.4)
+        self.y += size
+        self.canvas.text(self.canvas.width / 2, self.y, text, style, size, align='center')
+        self.y += size * 0.4
+
+    def heading(self, text):
+        self.ensure_space(40)
+        self.y += 18
+        self.canvas.text(self.left, self.y, text, 'bold', 14)
+        self.y += 8
+
+    def rule(self):
+        self.canvas.line(self.left, self.y, self.right, self.y, width=0.4)
+
+    def row(self, label, value, value_style='bold', label_width=170):
+        """A 'Label: value' row like the two-column tabulars in the templates"""
+        lines = self.canvas.wrap(value, self.width - label_width, value_style, BODY_SIZE)
+        self.ensure_space(len(lines) * BODY_SIZE * 1.3 + 4)
+        self.y += BODY_SIZE + 2
+        self.canvas.text(self.left, self.y, label, 'regular', BODY_SIZE)
+        for index, line in enumerate(lines):
+            if index:
+                self.y += BODY_SIZE * 1.3
+            self.canvas.text(self.left + label_width, self.y, line, value_style, BODY_SIZE)
+        self.y += 3
+
+    def paragraph(self, text, style='regular', size=BODY_SIZE, indent=0):
+        lines = self.canvas.wrap(text, self.width - indent, style, size)
+        leading = size * 1.3
+        for line in lines:
+            self.ensure_space(leading)
+            self.y += leading
+            self.canvas.text(self.left + indent, self.y, line, style, size)
+        self.y += 3
+
+    def boxed_paragraph(self, text, size=BODY_SIZE):
+        """Paragraph inside a frame, like \\fbox{\\parbox{...}}"""
+        padding = 6
+        lines = self.canvas.wrap(text, self.width - 2 * padding, 'regular', size)
+        leading = size * 1.3
+        height = len(lines) * leading + 2 * padding
+        self.ensure_space(height)
+        top = self.y + 4
+        self.canvas.rect(self.left, top, self.width, height, width=0.4)
+        y = top + padding
+        for line in lines:
+            y += leading
+            self.canvas.text(self.left + padding, y - size * 0.25, line, 'regular', size)
+        self.y = top + height + 2
+
+    def checkbox_item(self, checked, text, indent=20):
+        lines = self.canvas.wrap(text, self.width - indent - 16, 'regular', BODY_SIZE)
+        self.ensure_space(len(lines) * BODY_SIZE * 1.3 + 4)
+        self.y += BODY_SIZE * 1.3 + 2
+        self.canvas.checkbox(self.left + indent, self.y, checked)
+        for index, line in enumerate(lines):
+            if index:
+                self.y += BODY_SIZE * 1.3
+            self.canvas.text(self.left + indent + 16, self.y, line, 'regular', BODY_SIZE)
+
+    def signature(self, label, signature, date_label=None, date=None, label_width=170):
+        """
+        Signature row. signature is {'image': path}, {'text': str} or None.
+        """
+        self.ensure_space(70)
+        self.y += BODY_SIZE + 2
+        self.canvas.text(self.left, self.y, label, 'regular', BODY_SIZE)
+
+        if signature and signature.get('image') and os.path.isfile(signature['image']):
+            height = self.canvas.image(signature['image'], self.left + label_width, self.y - BODY_SIZE,
+                                       SIGNATURE_WIDTH, max_height=60)
+            self.y += max(height - BODY_SIZE, 0)
+        elif signature and signature.get('text'):
+            self.canvas.text(self.left + label_width, self.y, signature['text'], 'italic', BODY_SIZE)
+        else:
+            self.canvas.text(self.left + label_width, self.y, 'No signature provided', 'regular', BODY_SIZE)
+
+        if date_label:
+            self.row(date_label, date, value_style='regular', label_width=label_width)
+
+    def save(self, pdf_path):
+        if self.footer:
+            total = self.canvas.page_count
+            for number in range(1, total + 1):
+                self.canvas.set_page(number)
+                self.canvas.text(self.canvas.width / 2, self.canvas.height - MARGIN / 2,
+                                 f"{self.footer} - Page {number} of {total}", 'regular', 10, align='center')
+
+        os.makedirs(os.path.dirname(os.path.abspath(pdf_path)), exist_ok=True)
+        partial_path = f"{pdf_path}.{os.getpid()}.part"
+        self.canvas.save(partial_path)
+        os.replace(partial_path, pdf_path)
+        return pdf_path
+
+
+def _admin_decision(layout, fields):
+    status = fields.get('ADMIN_STATUS')
+    if status == 'approved':
+        layout.heading('Administrative Approval')
+        if fields.get('ADMIN_SIGNATURE_IMAGE'):
+            layout.signature('Administrator Signature:', {'image': fields['ADMIN_SIGNATURE_IMAGE']})
+        else:
+            layout.row('Administrator:', 'Approved electronically', value_style='regular')
+        layout.row('Date:', fields.get('DECISION_DATE'), value_style='regular')
+    elif status == 'rejected':
+        layout.heading('Administrative Decision')
+        layout.row('Status:', 'REJECTED')
+        layout.row('Date:', fields.get('DECISION_DATE'), value_style='regular')
+
+
+def render_student_drop(fields, pdf_path):
+    """
+    Draw the student-initiated drop form, following the layout of the
+    LaTeX version derived from the medical withdrawal template.
+
+    Args:
+        fields: Values prepared by pdf_utils.student_drop_fields()
+        pdf_path: Where the PDF should be written
+
+    Returns:
+        str: pdf_path
+    """
+    layout = FormLayout(footer='Student-Initiated Drop Form')
+
+    layout.centered('Student-Initiated Drop Request Form', 'bold', 17)
+    layout.space(6)
+    layout.centered(f"Form ID: {fields.get('FORMID', '')}", 'bold', BODY_SIZE)
+    layout.space(6)
+    layout.centered(f"Status: {fields.get('STATUS', '')}", 'bold', BODY_SIZE)
+    layout.space(8)
+    layout.rule()
+    layout.space(10)
+
+    layout.heading('Student Information')
+    layout.row('Name:', fields.get('FULLNAME'))
+    layout.row('myUH ID:', fields.get('MYUHID'))
+
+    layout.heading('Course Information')
+    layout.row('Course Title / Number:', fields.get('COURSE_TITLE'))
+
+    layout.heading('Reason for Drop')
+    layout.paragraph(fields.get('REASON'), 'bold')
+
+    layout.heading('Drop Request Date')
+    layout.row('Date:', fields.get('DROP_DATE'))
+
+    layout.heading('Acknowledgement')
+    layout.boxed_paragraph(
+        "I understand that by submitting this request, I am asking to drop the specified course. "
+        "I understand that this may affect my academic progress, financial aid eligibility, "
+        "and enrollment status. I certify that I have consulted with my academic advisor "
+        "regarding this decision, and I authorize the University of Houston to process my request."
+    )
+
+    layout.heading('Student Signature')
+    layout.signature('Signature:', fields.get('SIGNATURE'), 'Date:', fields.get('DROP_DATE'))
+
+    layout.heading('Request Information')
+    layout.row('Date Submitted:', fields.get('CREATED_DATE'), value_style='regular')
+    layout.row('Request Status:', fields.get('STATUS'))
+
+    _admin_decision(layout, fields)
+
+    return layout.save(pdf_path)
+
+
+def render_infochange(fields, pdf_path):
+    """
+    Draw the Name and/or Social Security Number change form, following
+    static/form-templates/name_ssn_change.tex.
+
+    Args:
+        fields: The placeholder values passed to form_utils.generate_ssn_name
+        pdf_path: Where the PDF should be written
+
+    Returns:
+        str: pdf_path
+    """
+    def checked(key):
+        return fields.get(key) == 'yes'
+
+    layout = FormLayout()
+    column = layout.width / 2
+
+    layout.centered('Name and/or Social Security Number Change', 'bold', 12)
+    layout.centered('University of Houston | Office of the University Registrar')
+    layout.centered('Houston, Texas 77204-2027 | (713) 743-1010, option 7')
+    layout.space(12)
+
+    layout.ensure_space(30)
+    layout.y += BODY_SIZE
+    layout.canvas.text(layout.left, layout.y, 'Student Name (as listed on university record)')
+    layout.canvas.text(layout.left + column, layout.y, 'myUH ID Number')
+    layout.y += BODY_SIZE * 1.3
+    layout.canvas.text(layout.left, layout.y, fields.get('NAME') or '')
+    layout.canvas.text(layout.left + column, layout.y, fields.get('PEOPLESOFT') or '')
+    layout.space(12)
+
+    layout.paragraph('*What are you requesting to add or update?', 'bold')
+    layout.checkbox_item(checked('EDIT_NAME'), 'Update Name (Complete Section A)')
+    layout.checkbox_item(checked('EDIT_SSN'), 'Update/Add Social Security Number (Complete Section B)')
+    layout.space(12)
+
+    layout.paragraph('Section A: Student Name Change', 'bold')
+    layout.paragraph('The University of Houston record of your name was originally taken from your '
+                     'application for admission and may be changed if:')
+    for number, reason in enumerate([
+        'You have married, remarried, or divorced (a copy of marriage license or portion of divorce '
+        'decree indicating new name must be provided)',
+        'You have changed your name by court order (a copy of the court order must be provided)',
+        'Your legal name is listed incorrectly and satisfactory evidence exists for its correction '
+        '(driver license, state ID, birth certificate, valid passport, etc., must be provided)',
+    ], start=1):
+        layout.paragraph(f"{number}. {reason}", indent=20)
+    layout.paragraph('NOTE: A request to omit a first or middle name or to reverse the order of the first '
+                     'and middle names cannot be honored unless accompanied by appropriate documentation. '
+                     'All documents must also be submitted with a valid government-issued photo ID (such as '
+                     'a driver license, passport, or military ID).')
+    layout.space(12)
+
+    layout.paragraph('Please print and complete the following information:')
+    layout.paragraph('I request that my legal name be changed and reflected on University of Houston '
+                     'records as listed below:')
+    layout.space(6)
+
+    # FROM / TO name table
+    label_width = layout.width * 0.15
+    layout.ensure_space(6 * BODY_SIZE * 1.6)
+    layout.y += BODY_SIZE * 1.3
+    layout.canvas.text(layout.left, layout.y, 'FROM:')
+    layout.canvas.text(layout.left + column + 6, layout.y, 'TO:')
+    table_top = layout.y - BODY_SIZE
+    for label, old_key, new_key in [('First name', 'FN_OLD', 'FN_NEW'), ('Middle name', 'MN_OLD', 'MN_NEW'),
+                                    ('Last name', 'LN_OLD', 'LN_NEW'), ('Suffix', 'SUF_OLD', 'SUF_NEW')]:
+        layout.y += BODY_SIZE * 1.6
+        for offset, key in [(0, old_key), (column + 6, new_key)]:
+            x = layout.left + offset
+            layout.canvas.text(x, layout.y, label)
+            layout.canvas.text(x + label_width, layout.y, fields.get(key) or '', 'bold')
+            layout.canvas.line(x + label_width, layout.y + 2, x + column - 12, layout.y + 2, width=0.4)
+    layout.canvas.line(layout.left + column, table_top, layout.left + column, layout.y + 4, width=0.4)
+    layout.space(12)
+
+    layout.paragraph('Check reason for name change request:')
+    layout.checkbox_item(checked('OPT_MARITAL'), 'Marriage/Divorce')
+    layout.checkbox_item(checked('OPT_COURT'), 'Court Order')
+    layout.checkbox_item(checked('OPT_ERROR_NAME'), 'Correction of Error')
+    layout.space(12)
+
+    layout.paragraph('Section B: Student Social Security Number Change', 'bold')
+    layout.paragraph("The University of Houston record of your Social Security Number was originally taken "
+                     "from your application for admission and may be changed only if the student has "
+                     "obtained a new social security number or an error was made. In either case, the "
+                     "student must provide a copy of the Social Security Card. The Social Security card must "
+                     "include the student's signature and must be submitted with a valid government-issued "
+                     "photo ID (such as a driver license, passport, or military ID).")
+    layout.space(12)
+    layout.paragraph('Please print and complete the following information: I request that my Social Security '
+                     'Number be changed and reflected on University of Houston records as listed below:')
+    layout.space(6)
+    layout.paragraph(f"FROM: {fields.get('SSN_OLD') or ''}")
+    layout.space(6)
+    layout.paragraph(f"TO: {fields.get('SSN_NEW') or ''}")
+    layout.space(6)
+    # Labels as printed by the LaTeX template
+    layout.checkbox_item(checked('OPT_ERROR_SSN'), 'Marriage/Divorce')
+    layout.checkbox_item(checked('OPT_ADD_SSN'), 'Court Order')
+    layout.space(12)
+
+    layout.paragraph('I authorize the University of Houston Main Campus to make the updates/changes to my '
+                     'student record as requested above.')
+    layout.space(12)
+
+    signature_path = fields.get('SIGNATURE')
+    layout.signature('*SIGNATURE (REQUIRED)', {'image': signature_path} if signature_path else None,
+                     'Date', fields.get('DATE'), label_width=140)
+    layout.space(12)
+
+    layout.paragraph('*State law requires that you be informed of the following: (1) with few exceptions, you '
+                     'are entitled on request to be informed about the information the University collects '
+                     'about you by use of this form; (2) under sections 552.021 and 552.023 of the Government '
+                     'Code, you are entitled to receive and review the information; and (3) under section '
+                     '559.004 of the Government Code, you are entitled to have the University correct '
+                     'information about you that is incorrect.', size=8)
+
+    return layout.save(pdf_path)
+
+
+# Form types this backend can draw
+RENDERERS = {
+    'student_drop': render_student_drop,
+    'infochange': render_infochange,
+}
@@ -5,6 +5,11 @@ set -e
 echo "Running database migrations..."
 python migrations.py
 
+# The renderer pool is not started here: run it as its own supervised
+# process (make render-pool) or use the render service image
+# (Dockerfile.render), which owns its pool. Without a pool, or with
+# RENDERER_POOL=0, renders run in the app process.
+
 # Start the application
 echo "Starting the application..."
-python main.py
\ No newline at end of file
+python main.py
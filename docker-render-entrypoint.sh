@@ -0,0 +1,21 @@
+#!/bin/bash
+set -e
+
+# With RENDERER_POOL=0 the service renders in its own process
+if [ "${RENDERER_POOL:-1}" != "1" ]; then
+    exec python render_service.py --host 0.0.0.0 --port 8000
+fi
+
+# Pre-forked renderer pool plus the HTTP service in front of it. If either
+# one exits, stop the other and exit so the container restarts both.
+python render_pool.py &
+pool=$!
+python render_service.py --host 0.0.0.0 --port 8000 &
+service=$!
+trap 'kill -TERM $pool $service 2>/dev/null' TERM INT
+
+status=0
+wait -n $pool $service || status=$?
+kill -TERM $pool $service 2>/dev/null || true
+wait
+exit $status
@@ -0,0 +1,117 @@
+import os
+import hashlib
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import current_app, request, send_file
+
+logger = logging.getLogger(__name__)
+
+# Modes for FILE_OFFLOAD. For nginx, map X_ACCEL_LOCATION to X_ACCEL_ROOT:
+#
+#     location /protected/ {
+#         internal;
+#         alias /app/static/;
+#     }
+OFFLOAD_X_ACCEL = 'x-accel'  # nginx: X-Accel-Redirect to an internal location
+OFFLOAD_X_SENDFILE = 'x-sendfile'  # Apache/lighttpd: X-Sendfile with the file path
+
+# Content hashes of recently served files, keyed by (path, size, mtime)
+ETAG_CACHE_SIZE = 2048
+_etags = OrderedDict()
+_etags_lock = threading.Lock()
+
+
+def file_etag(path, stat_result=None):
+    """
+    Strong ETag for a file: the SHA-256 of its content. Hashes are cached
+    until the file's size or modification time changes.
+    """
+    info = stat_result or os.stat(path)
+    key = (path, info.st_size, info.st_mtime_ns)
+
+    with _etags_lock:
+        if key in _etags:
+            _etags.move_to_end(key)
+            return _etags[key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+
+    with _etags_lock:
+        _etags[key] = etag
+        while len(_etags) > ETAG_CACHE_SIZE:
+            _etags.popitem(last=False)
+    return etag
+
+
+def accel_location(path):
+    """
+    Internal nginx URI for a file under X_ACCEL_ROOT, or None if the file
+    lives elsewhere and has to be sent by Flask.
+    """
+    root = os.path.abspath(current_app.config['X_ACCEL_ROOT'])
+    path = os.path.abspath(path)
+    if not path.startswith(root + os.sep):
+        return None
+    relative = os.path.relpath(path, root).replace(os.sep, '/')
+    return current_app.config['X_ACCEL_LOCATION'].rstrip('/') + '/' + relative
+
+
+def send_download(path, etag=None, download_name=None, as_attachment=None, mimetype=None):
+    """
+    Send a stored file with validators so repeat downloads are cheap.
+
+    The response carries a strong ETag (content SHA-256) and Last-Modified,
+    answers If-None-Match / If-Modified-Since with 304 and serves byte
+    ranges (If-Range aware). With FILE_OFFLOAD set, the body is left to the
+    front proxy (X-Accel-Redirect or X-Sendfile) and the worker returns at
+    once.
+
+    Args:
+        path: Path of the file
+        etag: Known SHA-256 of the file (e.g. GeneratedArtifact.sha256)
+        download_name: File name for Content-Disposition (defaults to the file's)
+        as_attachment: Force a download; by default files are attachments
+                       unless the URL has ?inline=1 (for in-browser viewers)
+        mimetype: Content type (guessed from the name by default)
+
+    Returns:
+        Response: The file response (200, 206 or 304)
+    """
+    path = os.path.abspath(path)
+    info = os.stat(path)
+    etag = etag or file_etag(path, info)
+    last_modified = datetime.fromtimestamp(info.st_mtime, tz=timezone.utc)
+    download_name = download_name or os.path.basename(path)
+    if as_attachment is None:
+        as_attachment = request.args.get('inline') != '1'
+    mimetype = mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+
+    if current_app.config.get('FILE_OFFLOAD') == OFFLOAD_X_ACCEL:
+        location = accel_location(path)
+        if location:
+            response = current_app.response_class(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = location
+            response.headers['Content-Disposition'] = (
+                f"{'attachment' if as_attachment else 'inline'}; filename=\"{download_name}\"")
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            # 304s are answered here; nginx serves ranges for the redirect
+            return response.make_conditional(request)
+
+    # send_file handles Range/If-Range and 304s; with USE_X_SENDFILE it only
+    # sets the X-Sendfile header and leaves the body to the server
+    response = send_file(path, mimetype=mimetype, as_attachment=as_attachment, download_name=download_name,
+                         conditional=True, etag=etag, last_modified=last_modified, max_age=0)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,453 @@
+"""
+One renderer per form type.
+
+Each FormRenderer declares how its form is filled in: the LaTeX template,
+how a request row maps to field values, which values are inserted as raw
+LaTeX and how the output PDF is named. Every form then goes through the
+same path: backend selection (PDF_BACKENDS), compile_tex (result cache,
+resource limits, circuit breaker) and the render metrics below. With
+RENDER_SERVICE_URL set, LaTeX compiles go to the render service instead
+(see render_service.py and render_client.py).
+
+    render('medical_withdrawal', record)          # a request row or snapshot
+    render_fields('ferpa', data, pdf_path)        # field values built already
+
+To add a form, subclass FormRenderer and register() an instance.
+"""
+import os
+import time
+import uuid
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+import latex_limits
+from artifacts import PDF_DIR, FORMS_DIR
+from storage_layout import sharded_path, pdf_name
+from latex_runner import compile_tex
+from latex_templates import load_template, latex_escape, BRACE_PLACEHOLDER
+from signature_utils import print_signature
+from pdf_utils import (find_medical_template, find_student_drop_template, medical_withdrawal_fields,
+                       student_drop_fields, signature_to_latex, admin_signature_section, discard_signature)
+from form_utils import (ferpa_template_path, name_ssn_template_path, ferpa_data_from_request,
+                        infochange_data_from_request)
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+SIGNATURES_DIR = os.path.join(BASE_DIR, 'static', 'uploads', 'signatures')
+
+# Backend per form type, e.g. "student_drop=direct,infochange=latex".
+# Form types not listed use LaTeX.
+DEFAULT_PDF_BACKENDS = "student_drop=direct,infochange=direct"
+
+RENDERERS = {}
+
+_metrics = {}  # (form_type, backend) -> counters
+_metrics_lock = threading.Lock()
+
+
+class FormRenderer(ABC):
+    """
+    How one form type is rendered. Subclasses set form_type and implement
+    template() and fields(); one that doesn't can't be instantiated.
+    """
+    form_type = None
+    # Directory new PDFs are written to
+    output_dir = PDF_DIR
+    # pdflatex passes (two for templates with page references)
+    passes = 2
+    # Template values inserted without LaTeX escaping
+    raw = ()
+
+    @abstractmethod
+    def template(self):
+        """Parsed LaTeX template (CompiledTemplate), or None if there is none"""
+
+    @abstractmethod
+    def fields(self, record, admin_signature=None, file_id=None):
+        """
+        Backend-independent field values for a request.
+
+        Args:
+            record: The request row (or a snapshot of it)
+            admin_signature: Path to admin signature image file (if approved)
+            file_id: Timestamp shared by the files of this render
+        """
+
+    def prepare(self, fields):
+        """Adjust field values before any backend sees them"""
+        return fields
+
+    def cleanup(self, fields):
+        """Remove scratch files fields() made, once the render is done"""
+
+    def latex_values(self, fields):
+        """Template values for the LaTeX backend"""
+        return fields
+
+    def output_name(self, record, file_id):
+        """File name for a new PDF of the request"""
+        return pdf_name(self.form_type, record.id, record.status, file_id)
+
+    def compile_latex(self, fields, pdf_path):
+        """Fill the template and compile it; returns pdf_path or None"""
+        template = self.template()
+        if template is None:
+            logger.error(f"No LaTeX template found for {self.form_type}")
+            return None
+        content = template.render(self.latex_values(fields), raw=self.raw)
+
+        # Compile in a private scratch directory; only the PDF lands next to pdf_path
+        return compile_tex(content, pdf_path, passes=self.passes, template=self.form_type)
+
+
+def register(renderer):
+    """Add a renderer to the registry under its form_type"""
+    if not isinstance(renderer, FormRenderer) or not renderer.form_type:
+        raise TypeError(f"Not a FormRenderer with a form_type: {renderer!r}")
+    RENDERERS[renderer.form_type] = renderer
+    return renderer
+
+
+def get_renderer(form_type):
+    try:
+        return RENDERERS[form_type]
+    except KeyError:
+        raise ValueError(f"Unknown form type for rendering: {form_type}")
+
+
+# -------------------------------
+# Form types
+# -------------------------------
+
+class RequestFormRenderer(FormRenderer):
+    """Requests whose PDFs are listed in generated_pdfs and carry an admin decision"""
+    raw = ('SIGNATURE', 'ADMIN_SIGNATURE_SECTION')
+
+    def cleanup(self, fields):
+        discard_signature(fields.get('SIGNATURE'))
+
+    def latex_values(self, fields):
+        values = dict(fields)
+        values['SIGNATURE'] = signature_to_latex(fields['SIGNATURE'])
+        values['ADMIN_SIGNATURE_SECTION'] = admin_signature_section(fields['ADMIN_STATUS'],
+                                                                    fields['ADMIN_SIGNATURE_IMAGE'])
+        return values
+
+
+class MedicalWithdrawalRenderer(RequestFormRenderer):
+    form_type = 'medical_withdrawal'
+    raw = ('COURSES', 'SIGNATURE', 'ADMIN_SIGNATURE_SECTION')
+
+    def template(self):
+        return find_medical_template()
+
+    def fields(self, record, admin_signature=None, file_id=None):
+        return medical_withdrawal_fields(record, admin_signature, file_id)
+
+    def latex_values(self, fields):
+        values = super().latex_values(fields)
+        courses = fields['COURSES']
+        if isinstance(courses, str):
+            # Course data that could not be parsed
+            values['COURSES'] = latex_escape(courses)
+        else:
+            values['COURSES'] = ''.join(f"{latex_escape(subject)} & {latex_escape(number)} & "
+                                        f"{latex_escape(section)} \\\\\n" for subject, number, section in courses)
+        return values
+
+
+class StudentDropRenderer(RequestFormRenderer):
+    form_type = 'student_drop'
+
+    def template(self):
+        return find_student_drop_template()
+
+    def fields(self, record, admin_signature=None, file_id=None):
+        return student_drop_fields(record, admin_signature, file_id)
+
+
+class LinkedFormRenderer(FormRenderer):
+    """Forms with a single pdf_link under static/forms and a signature image path"""
+    output_dir = FORMS_DIR
+    passes = 1
+    raw = ('SIGNATURE',)
+    # Prefix of the PDF file names
+    file_prefix = None
+
+    @abstractmethod
+    def template_path(self):
+        """Path of the form's .tex template"""
+
+    def template(self):
+        return load_template(self.template_path(), BRACE_PLACEHOLDER)
+
+    def prepare(self, fields):
+        # Embed the cropped, downsampled copy of the signature
+        return dict(fields, SIGNATURE=print_signature(fields.get('SIGNATURE')))
+
+    def output_name(self, record, file_id):
+        return f"{self.file_prefix}_{uuid.uuid4()}.pdf"
+
+
+class FerpaRenderer(LinkedFormRenderer):
+    form_type = 'ferpa'
+    file_prefix = 'ferpa_form'
+
+    def template_path(self):
+        return ferpa_template_path()
+
+    def fields(self, record, admin_signature=None, file_id=None):
+        return ferpa_data_from_request(record, SIGNATURES_DIR)
+
+
+class InfoChangeRenderer(LinkedFormRenderer):
+    form_type = 'infochange'
+    file_prefix = 'name_form'
+
+    def template_path(self):
+        return name_ssn_template_path()
+
+    def fields(self, record, admin_signature=None, file_id=None):
+        return infochange_data_from_request(record, SIGNATURES_DIR)
+
+
+register(MedicalWithdrawalRenderer())
+register(StudentDropRenderer())
+register(FerpaRenderer())
+register(InfoChangeRenderer())
+
+
+# -------------------------------
+# Rendering backends
+# -------------------------------
+
+class PDFBackend(ABC):
+    """
+    A way of turning a form's field values into a PDF.
+
+    Backends implement render(form_type, fields, pdf_path), returning
+    pdf_path on success and None on failure.
+    """
+    name = None
+
+    @abstractmethod
+    def supports(self, form_type):
+        """Whether this backend can render the form type"""
+
+    @abstractmethod
+    def render(self, form_type, fields, pdf_path):
+        """Render field values to pdf_path; returns pdf_path or None"""
+
+
+class LatexBackend(PDFBackend):
+    """Fills the form's LaTeX template and compiles it with pdflatex"""
+    name = 'latex'
+
+    def supports(self, form_type):
+        return form_type in RENDERERS
+
+    def render(self, form_type, fields, pdf_path):
+        return RENDERERS[form_type].compile_latex(fields, pdf_path)
+
+
+class DirectBackend(PDFBackend):
+    """Draws the form straight to PDF in-process (see direct_pdf.py)"""
+    name = 'direct'
+
+    def supports(self, form_type):
+        import direct_pdf
+        return form_type in direct_pdf.RENDERERS
+
+    def render(self, form_type, fields, pdf_path):
+        import direct_pdf
+        return direct_pdf.RENDERERS[form_type](fields, pdf_path)
+
+
+LATEX_BACKEND = LatexBackend()
+
+BACKENDS = {
+    'latex': LATEX_BACKEND,
+    'direct': DirectBackend(),
+}
+
+
+def configured_backends():
+    """Form type -> backend name, from the PDF_BACKENDS environment variable"""
+    setting = os.environ.get('PDF_BACKENDS', DEFAULT_PDF_BACKENDS)
+    backends = {}
+    for entry in setting.split(','):
+        if '=' not in entry:
+            continue
+        form_type, name = (part.strip() for part in entry.split('=', 1))
+        if name not in BACKENDS:
+            logger.warning(f"Unknown PDF backend '{name}' for {form_type}, using LaTeX")
+            continue
+        backends[form_type] = name
+    return backends
+
+
+# -------------------------------
+# Render path
+# -------------------------------
+
+def _run_backend(name, form_type, fields, pdf_path):
+    """Render with one backend, timing it. Returns pdf_path or None."""
+    start = time.perf_counter()
+    result = None
+    try:
+        result = BACKENDS[name].render(form_type, fields, pdf_path)
+        if result and not os.path.exists(result):
+            logger.error(f"The {name} backend reported {result} for {form_type} but wrote no file")
+            result = None
+    except Exception as e:
+        logger.error(f"The {name} backend failed for {form_type}: {str(e)}")
+    elapsed = time.perf_counter() - start
+
+    _count(form_type, name, bool(result), elapsed)
+    if result:
+        logger.info(f"Rendered {form_type} with the {name} backend in {elapsed * 1000:.1f} ms: {pdf_path}")
+    return result
+
+
+def _run_remote(form_type, fields, pdf_path):
+    """
+    Render with LaTeX on the render service, timing it. Returns pdf_path or None.
+
+    Raises:
+        RenderServiceUnavailable: The service could not be reached
+    """
+    import render_client
+
+    start = time.perf_counter()
+    result = render_client.render_to_file(form_type, fields, pdf_path)
+    elapsed = time.perf_counter() - start
+
+    _count(form_type, 'service', bool(result), elapsed)
+    if result:
+        logger.info(f"Rendered {form_type} on the render service in {elapsed * 1000:.1f} ms: {pdf_path}")
+    return result
+
+
+def render_fields(form_type, fields, pdf_path, backend=None, remote=True):
+    """
+    Render field values with the form's configured backend, falling back to
+    LaTeX if that backend cannot draw the form or fails. LaTeX runs on the
+    render service when RENDER_SERVICE_URL is set and it can be reached.
+
+    Args:
+        form_type: A registered form type
+        fields: Backend-independent field values (see FormRenderer.fields)
+        pdf_path: Where the PDF should be written
+        backend: Backend name overriding the configuration
+        remote: Allow sending LaTeX renders to the render service
+
+    Returns:
+        str: Absolute path of the PDF, or None if it could not be produced
+    """
+    renderer = get_renderer(form_type)
+    pdf_path = os.path.abspath(pdf_path)
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    fields = renderer.prepare(fields)
+
+    name = backend or configured_backends().get(form_type, 'latex')
+    if name != LATEX_BACKEND.name and BACKENDS[name].supports(form_type):
+        result = _run_backend(name, form_type, fields, pdf_path)
+        if result:
+            return result
+        logger.error(f"The {name} backend produced no PDF for {form_type}, falling back to LaTeX")
+
+    if remote:
+        import render_client
+        if render_client.enabled():
+            try:
+                return _run_remote(form_type, fields, pdf_path)
+            except render_client.RenderServiceUnavailable:
+                pass  # render it here instead
+
+    return _run_backend(LATEX_BACKEND.name, form_type, fields, pdf_path)
+
+
+def render_prepared(form_type, fields, pdf_path, backend=LATEX_BACKEND.name):
+    """
+    Render field values that already went through prepare() with one
+    backend, in this process. Entry point of the render service.
+
+    Returns:
+        str: Absolute path of the PDF, or None if it could not be produced
+
+    Raises:
+        CompileFailure: LaTeX failed for a known reason (see latex_limits)
+    """
+    get_renderer(form_type)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown PDF backend: {backend}")
+
+    latex_limits.clear_failure()
+    result = _run_backend(backend, form_type, fields, os.path.abspath(pdf_path))
+    if not result and latex_limits.last_failure():
+        raise latex_limits.CompileFailure(latex_limits.last_failure())
+    return result
+
+
+def render(form_type, record, admin_signature=None):
+    """
+    Render a new PDF for a request into the form's output directory.
+
+    Args:
+        form_type: A registered form type
+        record: The request row (or a snapshot of it)
+        admin_signature: Path to admin signature image file (if approved)
+
+    Returns:
+        str: Absolute path of the PDF, or None on failure
+    """
+    renderer = get_renderer(form_type)
+    file_id = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    try:
+        fields = renderer.fields(record, admin_signature, file_id)
+    except Exception as e:
+        logger.error(f"Could not collect the {form_type} fields for request {getattr(record, 'id', None)}: "
+                     f"{str(e)}", exc_info=True)
+        return None
+
+    pdf_path = sharded_path(renderer.output_dir, renderer.output_name(record, file_id))
+    try:
+        return render_fields(form_type, fields, pdf_path)
+    finally:
+        renderer.cleanup(fields)
+
+
+# -------------------------------
+# Metrics
+# -------------------------------
+
+def _count(form_type, backend, ok, elapsed):
+    with _metrics_lock:
+        counters = _metrics.setdefault((form_type, backend),
+                                       {'renders': 0, 'failures': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        counters['renders' if ok else 'failures'] += 1
+        counters['seconds'] += elapsed
+        counters['max_seconds'] = max(counters['max_seconds'], elapsed)
+
+
+def render_metrics():
+    """
+    Render counts and timings of this process.
+
+    Returns:
+        dict: {form_type: {backend: {'renders', 'failures', 'avg_ms', 'max_ms'}}}
+    """
+    metrics = {}
+    with _metrics_lock:
+        for (form_type, backend), counters in sorted(_metrics.items()):
+            total = counters['renders'] + counters['failures']
+            metrics.setdefault(form_type, {})[backend] = {
+                'renders': counters['renders'],
+                'failures': counters['failures'],
+                'avg_ms': round(counters['seconds'] * 1000 / total, 1) if total else 0.0,
+                'max_ms': round(counters['max_seconds'] * 1000, 1),
+            }
+    return metrics
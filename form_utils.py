@@ -1,8 +1,7 @@
 import os
-import uuid
-import subprocess
-from datetime import datetime
-import traceback
+
+# Templates of the FERPA and Name/SSN forms
+TEMPLATES_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static', 'form-templates')
 
 def allowed_file(filename, allowed_extensions):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
@@ -12,268 +11,167 @@ def return_choice(choices, keyword):
         return "yes"
     return "no"
 
-def generate_ferpa(data, form_folder, upload_folder):
-    try:
-        # Import debugging functions
-        from debug_utils import debug_pdf_generation, ensure_directory_exists
-    except ImportError:
-        # Define them locally if import fails
-        def debug_pdf_generation(function_name, data, output_path, error=None):
-            import logging
-            logging.basicConfig(level=logging.DEBUG, filename='pdf_generation.log')
-            logger = logging.getLogger('pdf_debug')
-            logger.debug(f"Debug for {function_name}: Path={output_path}, Error={error}")
-
-        def ensure_directory_exists(directory_path):
-            if not os.path.exists(directory_path):
-                os.makedirs(directory_path, exist_ok=True)
-
-    try:
-        # Define template paths - ensure these are absolute paths
-        current_dir = os.path.abspath(os.getcwd())
-        templates_folder = os.path.join(current_dir, 'static', 'form-templates')
-        ensure_directory_exists(templates_folder)
-
-        ferpa_template_path = os.path.join(templates_folder, 'ferpa.tex')
-
-        # Create template file if it doesn't exist
-        if not os.path.exists(ferpa_template_path):
-            with open(ferpa_template_path, "w") as file:
-                file.write(FERPA_TEMPLATE)
-
-        # Generate unique ID for the PDF
-        unique_id = str(uuid.uuid4())
-
-        # Create absolute paths for the output files
-        full_form_folder = os.path.join(current_dir, form_folder)
-        ensure_directory_exists(full_form_folder)
-
-        tex_file_path = os.path.join(full_form_folder, f"ferpa_form_{unique_id}.tex")
-        pdf_file_path = f"ferpa_form_{unique_id}.pdf"
-        full_pdf_path = os.path.join(full_form_folder, pdf_file_path)
-
-        # Read the LaTeX template and replace placeholders
-        with open(ferpa_template_path, "r") as file:
-            latex_content = file.read()
-
-        for key, value in data.items():
-            latex_content = latex_content.replace(f"{{{{{key}}}}}", str(value))
-
-        # Save the modified LaTeX file
-        with open(tex_file_path, "w") as file:
-            file.write(latex_content)
-
-        # Compile - use full paths and capture output for debugging
-        process = subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", f"-output-directory={full_form_folder}", tex_file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        # Check if compilation was successful
-        if process.returncode != 0:
-            debug_pdf_generation("generate_ferpa", data, full_pdf_path,
-                                f"pdflatex error: {process.stderr}")
-
-            # Try running pdflatex a second time
-            process = subprocess.run(
-                ["pdflatex", "-interaction=nonstopmode", f"-output-directory={full_form_folder}", tex_file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-
-        # Verify the PDF was created
-        if os.path.exists(full_pdf_path):
-            debug_pdf_generation("generate_ferpa", data, full_pdf_path, "PDF generated successfully")
-        else:
-            debug_pdf_generation("generate_ferpa", data, full_pdf_path, "PDF file not found after compilation")
-
-        # Return path to PDF
-        return pdf_file_path
-
-    except Exception as e:
-        debug_pdf_generation("generate_ferpa", data, None, str(e))
-        import traceback
-        debug_pdf_generation("generate_ferpa", data, None, traceback.format_exc())
-        return None
+def ferpa_template_path():
+    """Path of the FERPA release template, written from FERPA_TEMPLATE if missing"""
+    os.makedirs(TEMPLATES_DIR, exist_ok=True)
 
-def generate_ferpa(data, form_folder, upload_folder):
-    try:
-        # Import debugging functions
-        from debug_utils import debug_pdf_generation, ensure_directory_exists
-    except ImportError:
-        # Define them locally if import fails
-        def debug_pdf_generation(function_name, data, output_path, error=None):
-            import logging
-            logging.basicConfig(level=logging.DEBUG, filename='pdf_generation.log')
-            logger = logging.getLogger('pdf_debug')
-            logger.debug(f"Debug for {function_name}: Path={output_path}, Error={error}")
-
-        def ensure_directory_exists(directory_path):
-            if not os.path.exists(directory_path):
-                os.makedirs(directory_path, exist_ok=True)
-    try:
-        # Define template paths - ensure these are absolute paths
-        current_dir = os.path.abspath(os.getcwd())
-        templates_folder = os.path.join(current_dir, 'static', 'form-templates')
-        ensure_directory_exists(templates_folder)
-
-        ferpa_template_path = os.path.join(templates_folder, 'ferpa.tex')
-
-        # Create template file if it doesn't exist
-        if not os.path.exists(ferpa_template_path):
-            with open(ferpa_template_path, "w") as file:
-                file.write(FERPA_TEMPLATE)
-
-        # Generate unique ID for the PDF
-        unique_id = str(uuid.uuid4())
-
-        # Create absolute paths for the output files
-        full_form_folder = os.path.join(current_dir, form_folder)
-        ensure_directory_exists(full_form_folder)
-
-        tex_file_path = os.path.join(full_form_folder, f"ferpa_form_{unique_id}.tex")
-        pdf_file_path = f"ferpa_form_{unique_id}.pdf"
-        full_pdf_path = os.path.join(full_form_folder, pdf_file_path)
-
-        # Read the LaTeX template and replace placeholders
-        with open(ferpa_template_path, "r") as file:
-            latex_content = file.read()
-
-        for key, value in data.items():
-            latex_content = latex_content.replace(f"{{{{{key}}}}}", str(value))
-
-        # Save the modified LaTeX file
-        with open(tex_file_path, "w") as file:
-            file.write(latex_content)
-
-        # Compile - use full paths and capture output for debugging
-        process = subprocess.run(
-            ["pdflatex", "-interaction=nonstopmode", f"-output-directory={full_form_folder}", tex_file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
-
-        # Check if compilation was successful
-        if process.returncode != 0:
-            debug_pdf_generation("generate_ferpa", data, full_pdf_path,
-                                f"pdflatex error: {process.stderr}")
-
-            # Try running pdflatex a second time
-            process = subprocess.run(
-                ["pdflatex", "-interaction=nonstopmode", f"-output-directory={full_form_folder}", tex_file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True
-            )
-
-        # Verify the PDF was created
-        if os.path.exists(full_pdf_path):
-            debug_pdf_generation("generate_ferpa", data, full_pdf_path, "PDF generated successfully")
-            # FIX: Use pdf_file_path instead of pdf_file
-            print(f"FERPA PDF generation complete: {pdf_file_path}")
-            return pdf_file_path
-        else:
-            debug_pdf_generation("generate_ferpa", data, full_pdf_path, "PDF file not found after compilation")
-            return None
-
-    except Exception as e:
-        debug_pdf_generation("generate_ferpa", data, None, str(e))
-        import traceback
-        debug_pdf_generation("generate_ferpa", data, None, traceback.format_exc())
-        return None
+    path = os.path.join(TEMPLATES_DIR, 'ferpa.tex')
 
-def generate_ssn_name(data, form_folder, upload_folder):
-    # Define template paths
-    templates_folder = os.path.join('static', 'form-templates')
-    os.makedirs(templates_folder, exist_ok=True)
+    # Create template file if it doesn't exist
+    if not os.path.exists(path):
+        with open(path, "w") as file:
+            file.write(FERPA_TEMPLATE)
+    return path
 
-    name_ssn_template_path = os.path.join(templates_folder, 'name_ssn_change.tex')
+def name_ssn_template_path():
+    """Path of the Name/SSN change template, written from NAME_SSN_TEMPLATE if missing"""
+    os.makedirs(TEMPLATES_DIR, exist_ok=True)
+
+    path = os.path.join(TEMPLATES_DIR, 'name_ssn_change.tex')
 
     # Create template file if it doesn't exist
-    if not os.path.exists(name_ssn_template_path):
-        with open(name_ssn_template_path, "w") as file:
+    if not os.path.exists(path):
+        with open(path, "w") as file:
             file.write(NAME_SSN_TEMPLATE)
+    return path
+
+def _render_to_folder(form_type, data, form_folder):
+    """Render template data into form_folder; returns the PDF's path relative to form_folder or None"""
+    from form_renderers import get_renderer, render_fields
+    from pdf_optimize import optimize_if_enabled
+    from storage import publish
+    from storage_layout import sharded_path, relative_path
+    folder = os.path.abspath(form_folder)
+    pdf_file_path = sharded_path(folder, get_renderer(form_type).output_name(data, None))
+    if not publish(optimize_if_enabled(render_fields(form_type, data, pdf_file_path))):
+        return None
+    return relative_path(folder, pdf_file_path)
 
-    # Generate unique ID for the PDF
-    unique_id = str(uuid.uuid4())
+def generate_ferpa(data, form_folder, upload_folder):
+    """
+    Render a FERPA release PDF (see form_renderers.py)
 
-    # Unique file paths
-    tex_file_path = os.path.join(form_folder, f"name_form_{unique_id}.tex")
-    pdf_file_path = f"name_form_{unique_id}.pdf"
+    Args:
+        data: Placeholder values, as built by ferpa_data_from_request
+        form_folder: Directory the PDF is written to
+        upload_folder: Directory of the uploaded signatures (unused; SIGNATURE is a path)
 
-    # Read the LaTeX template and replace placeholders
-    with open(name_ssn_template_path, "r") as file:
-        latex_content = file.read()
+    Returns:
+        str: Path of the PDF relative to form_folder, or None on failure
+    """
+    return _render_to_folder('ferpa', data, form_folder)
 
-    for key, value in data.items():
-        latex_content = latex_content.replace(f"{{{{{key}}}}}", str(value))
+def generate_ssn_name(data, form_folder, upload_folder):
+    """
+    Render a Name/SSN change PDF (see form_renderers.py)
 
-    # Save the modified LaTeX file
-    with open(tex_file_path, "w") as file:
-        file.write(latex_content)
+    Args:
+        data: Placeholder values, as built by infochange_data_from_request
+        form_folder: Directory the PDF is written to
+        upload_folder: Directory of the uploaded signatures (unused; SIGNATURE is a path)
 
-    # Ensure output directory exists
-    os.makedirs(form_folder, exist_ok=True)
+    Returns:
+        str: Path of the PDF relative to form_folder, or None on failure
+    """
+    return _render_to_folder('infochange', data, form_folder)
 
-    # Compile
-    subprocess.run(["pdflatex", "-interaction=nonstopmode", "-output-directory", form_folder, tex_file_path],
-                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+def ferpa_data_from_request(ferpa_request, signatures_dir):
+    """
+    Rebuild the FERPA template data from a saved FERPARequest
 
-    # Return the generated PDF
-    return pdf_file_path
+    Args:
+        ferpa_request: The FERPARequest object (or a snapshot of it)
+        signatures_dir: Directory holding the request's signature image
 
-def debug_pdf_generation(function_name, data, output_path, error=None):
+    Returns:
+        dict: Placeholder values for generate_ferpa
     """
-    Log debugging information about PDF generation
+    sig_path = os.path.join(signatures_dir, ferpa_request.sig_link or '')
+
+    # Extract data from the request object
+    official_choices = ferpa_request.official_choices.split(',') if ferpa_request.official_choices else []
+    info_choices = ferpa_request.info_choices.split(',') if ferpa_request.info_choices else []
+    release_choices = ferpa_request.release_choices.split(',') if ferpa_request.release_choices else []
+
+    return {
+        "NAME": ferpa_request.name,
+        "CAMPUS": ferpa_request.campus,
+        "OPT_REGISTRAR": return_choice(official_choices, 'registrar'),
+        "OPT_AID": return_choice(official_choices, 'aid'),
+        "OPT_FINANCIAL": return_choice(official_choices, 'financial'),
+        "OPT_UNDERGRAD": return_choice(official_choices, 'undergrad'),
+        "OPT_ADVANCEMENT": return_choice(official_choices, 'advancement'),
+        "OPT_DEAN": return_choice(official_choices, 'dean'),
+        "OPT_OTHER_OFFICIALS": return_choice(official_choices, 'other'),
+        "OTHEROFFICIALS": ferpa_request.official_other,
+        "OPT_ACADEMIC_INFO": return_choice(info_choices, 'advising'),
+        "OPT_UNIVERSITY_RECORDS": return_choice(info_choices, 'all_records'),
+        "OPT_ACADEMIC_RECORDS": return_choice(info_choices, 'academics'),
+        "OPT_BILLING": return_choice(info_choices, 'billing'),
+        "OPT_DISCIPLINARY": return_choice(info_choices, 'disciplinary'),
+        "OPT_TRANSCRIPTS": return_choice(info_choices, 'transcripts'),
+        "OPT_HOUSING": return_choice(info_choices, 'housing'),
+        "OPT_PHOTOS": return_choice(info_choices, 'photos'),
+        "OPT_SCHOLARSHIP": return_choice(info_choices, 'scholarship'),
+        "OPT_OTHER_INFO": return_choice(info_choices, 'other'),
+        "OTHERINFO": ferpa_request.info_other,
+        "RELEASE": ferpa_request.release_to,
+        "PURPOSE": ferpa_request.purpose,
+        "ADDITIONALS": ferpa_request.additional_names,
+        "OPT_FAMILY": return_choice(release_choices, 'family'),
+        "OPT_INSTITUTION": return_choice(release_choices, 'institution'),
+        "OPT_HONOR": return_choice(release_choices, 'award'),
+        "OPT_EMPLOYER": return_choice(release_choices, 'employer'),
+        "OPT_PUBLIC": return_choice(release_choices, 'media'),
+        "OPT_OTHER_RELEASE": return_choice(release_choices, 'other'),
+        "OTHERRELEASE": ferpa_request.release_other,
+        "PASSWORD": ferpa_request.password,
+        "PEOPLESOFT": ferpa_request.peoplesoft_id,
+        "SIGNATURE": sig_path,
+        "DATE": str(ferpa_request.date)
+    }
+
+def infochange_data_from_request(infochange_request, signatures_dir):
     """
-    import logging
-    import os
-
-    # Setup basic logging if not already configured
-    logging.basicConfig(level=logging.DEBUG,
-                        filename='pdf_generation_debug.log',
-                        format='%(asctime)s - %(levelname)s - %(message)s')
-
-    logger = logging.getLogger('pdf_debug')
-
-    logger.debug(f"===== Starting debug for {function_name} =====")
-    logger.debug(f"Current working directory: {os.getcwd()}")
+    Rebuild the Name/SSN change template data from a saved InfoChangeRequest
 
-    # Log important paths
-    templates_folder = os.path.join('static', 'form-templates')
-    form_folder = os.path.join('static', 'forms')
+    Args:
+        infochange_request: The InfoChangeRequest object (or a snapshot of it)
+        signatures_dir: Directory holding the request's signature image
 
-    logger.debug(f"Templates folder path: {os.path.abspath(templates_folder)}")
-    logger.debug(f"Form folder path: {os.path.abspath(form_folder)}")
-
-    # Check if directories exist
-    logger.debug(f"Templates folder exists: {os.path.exists(templates_folder)}")
-    logger.debug(f"Form folder exists: {os.path.exists(form_folder)}")
-
-    # Log output path
-    if output_path:
-        logger.debug(f"Output path: {output_path}")
-        logger.debug(f"Output path exists: {os.path.exists(output_path)}")
-
-    # Log error if any
-    if error:
-        logger.error(f"Error in {function_name}: {str(error)}")
-
-    logger.debug(f"===== End debug for {function_name} =====")
-
-def ensure_directory_exists(directory_path):
-    """
-    Ensure that a directory exists, creating it if necessary
+    Returns:
+        dict: Placeholder values for generate_ssn_name
     """
-    import os
-    if not os.path.exists(directory_path):
-        os.makedirs(directory_path, exist_ok=True)
-        return True
-    return False
+    sig_path = os.path.join(signatures_dir, infochange_request.sig_link or '')
+
+    # Extract data from the request object
+    choice = infochange_request.choice.split(',') if infochange_request.choice else []
+    nmchg_reason = infochange_request.nmchg_reason.split(',') if infochange_request.nmchg_reason else []
+    ssnchg_reason = infochange_request.ssnchg_reason.split(',') if infochange_request.ssnchg_reason else []
+
+    return {
+        "NAME": infochange_request.name,
+        "PEOPLESOFT": infochange_request.peoplesoft_id,
+        "EDIT_NAME": return_choice(choice, 'name'),
+        "EDIT_SSN": return_choice(choice, 'ssn'),
+        "FN_OLD": infochange_request.fname_old or "",
+        "MN_OLD": infochange_request.mname_old or "",
+        "LN_OLD": infochange_request.lname_old or "",
+        "SUF_OLD": infochange_request.sfx_old or "",
+        "FN_NEW": infochange_request.fname_new or "",
+        "MN_NEW": infochange_request.mname_new or "",
+        "LN_NEW": infochange_request.lname_new or "",
+        "SUF_NEW": infochange_request.sfx_new or "",
+        "OPT_MARITAL": return_choice(nmchg_reason, 'marriage'),
+        "OPT_COURT": return_choice(nmchg_reason, 'court'),
+        "OPT_ERROR_NAME": return_choice(nmchg_reason, 'error'),
+        "SSN_OLD": infochange_request.ssn_old or "",
+        "SSN_NEW": infochange_request.ssn_new or "",
+        "OPT_ERROR_SSN": return_choice(ssnchg_reason, 'error'),
+        "OPT_ADD_SSN": return_choice(ssnchg_reason, 'addition'),
+        "SIGNATURE": sig_path,
+        "DATE": str(infochange_request.date)
+    }
 
 # LaTeX Templates
 FERPA_TEMPLATE = r"""
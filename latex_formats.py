@@ -0,0 +1,316 @@
+"""
+Precompiled LaTeX formats for the form templates.
+
+The preamble of a template (everything before \\begin{document}: the
+documentclass and the package loads) is dumped once into a .fmt with
+`pdflatex -ini`, and each request's document is compiled against it with
+-fmt, so the packages are not loaded again on every render. A format that
+fails to build or load is dropped and the document compiles the plain way.
+
+The gain depends on the TeX installation and has not been measured in this
+tree. Measure it per template with `make format-timing` (python
+latex_formats.py), or end to end with bench_render.py --no-formats as the
+baseline (see its docstring).
+"""
+import os
+import re
+import sys
+import time
+import shutil
+import hashlib
+import logging
+import subprocess
+
+import render_cache
+from latex_limits import run_limited, remaining
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# Precompiled formats (.fmt), one per distinct preamble
+FORMAT_DIR = os.environ.get('LATEX_FORMAT_DIR', os.path.join(BASE_DIR, 'instance', 'latex_formats'))
+
+ENABLED = os.environ.get('LATEX_FORMATS_ENABLED', '1') == '1'
+
+# Templates whose formats are built ahead of time by warm_formats()
+FORM_TEMPLATES = [
+    os.path.join(BASE_DIR, 'static', 'templates', 'medical_withdrawal_template.tex'),
+    os.path.join(BASE_DIR, 'static', 'form-templates', 'ferpa.tex'),
+    os.path.join(BASE_DIR, 'static', 'form-templates', 'name_ssn_change.tex'),
+]
+
+BEGIN_DOCUMENT = '\\begin{document}'
+
+# Dump the format at the end of the preamble. LaTeX keeps the primitive as
+# \@@dump on current kernels; older ones leave \dump itself untouched.
+DUMP_COMMAND = "\n\\makeatletter\\ifdefined\\@@dump\\expandafter\\@@dump\\else\\expandafter\\dump\\fi\n"
+
+# What TeX prints when a format can't be loaded (missing, corrupt, or dumped
+# by another TeX installation). Only then is the format thrown away.
+FORMAT_ERRORS = re.compile(r"Fatal format file error|can't find the format file|"
+                           r"^---! .*\.fmt (?:was written by|doesn't match)", re.MULTILINE)
+
+# pdflatex versions and formats that failed to build, per process
+_versions = {}
+_failed_formats = set()
+
+
+def split_preamble(tex_source):
+    """
+    Split a LaTeX document into the part that can be precompiled and the rest.
+
+    The reproducibility settings from render_cache stay with the body so they
+    apply to every run and never get baked into a shared format.
+
+    Returns:
+        tuple: (preamble, body) or None if the source has no \\begin{document}
+    """
+    index = tex_source.find(BEGIN_DOCUMENT)
+    if index == -1:
+        return None
+
+    preamble, body = tex_source[:index], tex_source[index:]
+    if preamble.startswith(render_cache.DETERMINISTIC_PREAMBLE):
+        preamble = preamble[len(render_cache.DETERMINISTIC_PREAMBLE):]
+        body = render_cache.DETERMINISTIC_PREAMBLE + body
+    return preamble, body
+
+
+def _pdflatex_version(pdflatex):
+    """First line of `pdflatex --version`; formats only load in the binary that built them"""
+    if pdflatex not in _versions:
+        try:
+            result = subprocess.run([pdflatex, '--version'], capture_output=True, text=True, timeout=10)
+            _versions[pdflatex] = result.stdout.splitlines()[0] if result.stdout else ''
+        except Exception as e:
+            logger.error(f"Could not get pdflatex version: {str(e)}")
+            _versions[pdflatex] = ''
+    return _versions[pdflatex]
+
+
+def format_name(pdflatex, preamble):
+    """Name of the format for a preamble, built with a particular pdflatex"""
+    digest = hashlib.sha256(f"{_pdflatex_version(pdflatex)}\n{preamble}".encode('utf-8'))
+    return f"form_{digest.hexdigest()[:16]}"
+
+
+def ensure_format(pdflatex, preamble):
+    """
+    Build the precompiled format for a preamble if it does not exist yet.
+
+    Args:
+        pdflatex: Path of the pdflatex executable
+        preamble: Everything before \\begin{document}
+
+    Returns:
+        str: Format name to pass to -fmt, or None if no format is available
+    """
+    if not ENABLED:
+        return None
+
+    name = format_name(pdflatex, preamble)
+    if name in _failed_formats:
+        return None
+    if os.path.exists(os.path.join(FORMAT_DIR, f"{name}.fmt")):
+        return name
+
+    os.makedirs(FORMAT_DIR, exist_ok=True)
+
+    # Build under a per-process job name and rename, so concurrent builders
+    # never load a half-written format
+    build_name = f"{name}.{os.getpid()}"
+    source_path = os.path.join(FORMAT_DIR, f"{build_name}.tex")
+    with open(source_path, 'w', encoding='utf-8') as f:
+        f.write(preamble + DUMP_COMMAND)
+
+    cmd = [pdflatex, '-ini', '-interaction=nonstopmode', f'-jobname={build_name}',
+           '&pdflatex', os.path.basename(source_path)]
+    logger.info(f"Building LaTeX format {name}")
+    start = time.perf_counter()
+    try:
+        process = run_limited(cmd, cwd=FORMAT_DIR)
+    except Exception as e:
+        logger.error(f"Could not run pdflatex to build format {name}: {str(e)}")
+        _failed_formats.add(name)
+        os.remove(source_path)
+        return None
+
+    built_path = os.path.join(FORMAT_DIR, f"{build_name}.fmt")
+    try:
+        if process.returncode == 0 and os.path.exists(built_path):
+            os.replace(built_path, os.path.join(FORMAT_DIR, f"{name}.fmt"))
+            logger.info(f"Built LaTeX format {name} in {time.perf_counter() - start:.2f}s")
+            return name
+
+        logger.error(f"Failed to build LaTeX format {name} (exit code {process.returncode})")
+        logger.error(process.stdout[-2000:])
+        _failed_formats.add(name)
+        return None
+    finally:
+        for ext in ['.tex', '.log', '.fmt']:
+            leftover = os.path.join(FORMAT_DIR, f"{build_name}{ext}")
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+def discard_format(name):
+    """Delete a format that could not be loaded and stop using it in this process"""
+    _failed_formats.add(name)
+    fmt_path = os.path.join(FORMAT_DIR, f"{name}.fmt")
+    if os.path.exists(fmt_path):
+        os.remove(fmt_path)
+        logger.warning(f"Removed unusable LaTeX format {name}")
+
+
+def format_failed(process):
+    """Whether a pdflatex run failed because its format could not be loaded"""
+    return bool(FORMAT_ERRORS.search((process.stdout or '') + (process.stderr or '')))
+
+
+def format_env(env=None):
+    """Environment that lets pdflatex find formats in FORMAT_DIR as well as the defaults"""
+    env = dict(env if env is not None else os.environ)
+    # The trailing separator keeps kpathsea's default search path
+    env['TEXFORMATS'] = FORMAT_DIR + os.pathsep + env.get('TEXFORMATS', '')
+    return env
+
+
+def run_pdflatex(pdflatex, tex_path, output_dir, passes=2, env=None, use_format=True, deadline=None):
+    """
+    Compile a .tex file, against a precompiled format when one is available.
+
+    Falls back to a plain compile when the format cannot be built or loaded
+    (e.g. it was dumped by a different TeX installation).
+
+    Args:
+        pdflatex: Path of the pdflatex executable
+        tex_path: The LaTeX source file
+        output_dir: Directory the PDF (and .aux/.log) are written to
+        passes: Number of pdflatex runs (2 resolves page references)
+        env: Environment for pdflatex
+        use_format: Set to False to force the plain path
+        deadline: time.monotonic() by which all passes must be done; runs
+                  past it are killed (see latex_limits)
+
+    Returns:
+        CompletedProcess: Result of the last pdflatex run (timed_out is set
+                          when it was killed)
+    """
+    jobname = os.path.splitext(os.path.basename(tex_path))[0]
+    # pdflatex runs in the directory of the source; nothing relies on the process cwd
+    work_dir = os.path.dirname(os.path.abspath(tex_path))
+    pdf_path = os.path.join(output_dir, f"{jobname}.pdf")
+
+    with open(tex_path, 'r', encoding='utf-8') as f:
+        tex_source = f.read()
+
+    parts = split_preamble(tex_source) if use_format else None
+    name = ensure_format(pdflatex, parts[0]) if parts else None
+
+    if name:
+        body_path = os.path.join(work_dir, f"{jobname}.body.tex")
+        with open(body_path, 'w', encoding='utf-8') as f:
+            f.write(parts[1])
+
+        cmd = [pdflatex, f'-fmt={name}', '-interaction=nonstopmode',
+               f'-output-directory={output_dir}', f'-jobname={jobname}', body_path]
+        try:
+            for _ in range(passes):
+                process = run_limited(cmd, cwd=work_dir, env=format_env(env), timeout=remaining(deadline))
+                if process.returncode != 0:
+                    break
+        finally:
+            os.remove(body_path)
+
+        if process.returncode == 0 and os.path.exists(pdf_path):
+            return process
+        if process.timed_out or not format_failed(process):
+            # The document is the problem, not the format (a user value, a
+            # bad image, ...); running it again without the format would
+            # fail the same way
+            return process
+
+        logger.warning(f"LaTeX format {name} could not be loaded, falling back to plain pdflatex")
+        logger.warning(process.stdout[-2000:])
+        discard_format(name)
+
+    cmd = [pdflatex, '-interaction=nonstopmode', f'-output-directory={output_dir}', tex_path]
+    for _ in range(passes):
+        process = run_limited(cmd, cwd=work_dir, env=env, timeout=remaining(deadline))
+        if process.returncode != 0:
+            break
+    return process
+
+
+def warm_formats(pdflatex='pdflatex'):
+    """Build the formats for the form templates, e.g. at startup or after a template edit"""
+    for template_path in FORM_TEMPLATES:
+        if not os.path.exists(template_path):
+            continue
+        try:
+            with open(template_path, 'r', encoding='utf-8') as f:
+                parts = split_preamble(render_cache.make_deterministic(f.read()))
+            if parts:
+                ensure_format(pdflatex, parts[0])
+        except Exception as e:
+            logger.error(f"Error warming format for {template_path}: {str(e)}")
+
+
+def time_templates(pdflatex='pdflatex', runs=5):
+    """
+    Compare plain and precompiled-format compile times for each form template.
+
+    Placeholders are filled with their own names and the signature image is
+    swapped for a blank box.
+
+    Returns:
+        list: (template name, plain seconds, format seconds) per template
+    """
+    import tempfile
+
+    results = []
+    for template_path in FORM_TEMPLATES:
+        if not os.path.exists(template_path):
+            continue
+
+        with open(template_path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        source = source.replace('\\includegraphics[width=5cm]{SIGNATURE_PATH}', '\\rule{5cm}{1cm}')
+        source = source.replace('\\includegraphics[width=5cm]{{{SIGNATURE}}}', '\\rule{5cm}{1cm}')
+        source = re.sub(r'##([A-Z_]+)##|\{\{([A-Z_]+)\}\}', lambda m: m.group(1) or m.group(2), source)
+        source = render_cache.make_deterministic(source)
+
+        work_dir = tempfile.mkdtemp(prefix='fmt_timing_')
+        try:
+            tex_path = os.path.join(work_dir, 'timing.tex')
+            with open(tex_path, 'w', encoding='utf-8') as f:
+                f.write(source)
+
+            # Build the format first so it is not part of the measurement
+            ensure_format(pdflatex, split_preamble(source)[0])
+
+            timings = {}
+            for use_format in (False, True):
+                start = time.perf_counter()
+                for _ in range(runs):
+                    run_pdflatex(pdflatex, tex_path, work_dir, use_format=use_format)
+                timings[use_format] = (time.perf_counter() - start) / runs
+
+            results.append((os.path.basename(template_path), timings[False], timings[True]))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+if __name__ == '__main__':
+    # python latex_formats.py [pdflatex] -- prints per-template timings
+    pdflatex = sys.argv[1] if len(sys.argv) > 1 else 'pdflatex'
+    print(f"{'template':<36} {'plain (s)':>10} {'format (s)':>11} {'speedup':>8}")
+    for name, plain, with_format in time_templates(pdflatex):
+        print(f"{name:<36} {plain:>10.3f} {with_format:>11.3f} {plain / with_format:>7.1f}x")
@@ -0,0 +1,303 @@
+import os
+import re
+import json
+import time
+import signal
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Wall-clock budget for one document, all pdflatex passes together
+TIMEOUT = float(os.environ.get('LATEX_TIMEOUT', 60))
+# Per-process limits applied to pdflatex
+CPU_SECONDS = int(os.environ.get('LATEX_CPU_SECONDS', 30))
+MEMORY_MB = int(os.environ.get('LATEX_MEMORY_MB', 1024))
+OUTPUT_MB = int(os.environ.get('LATEX_OUTPUT_MB', 200))
+
+# Consecutive failures of one template before it is circuit-broken, and how
+# long to wait before letting a single trial render through again
+BREAKER_THRESHOLD = int(os.environ.get('LATEX_BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.environ.get('LATEX_BREAKER_COOLDOWN', 300))
+# Breaker state is shared by every process that renders (app, render pool,
+# render queue workers) through this file; point it at a shared volume to
+# share it between machines too
+BREAKER_STATE = os.environ.get('LATEX_BREAKER_STATE', os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'instance', 'latex_breakers.json'))
+
+# Failure reasons (RenderJob.failure_reason)
+REASON_TIMEOUT = 'timeout'
+REASON_CPU_LIMIT = 'cpu_limit'
+REASON_MEMORY_LIMIT = 'memory_limit'
+REASON_KILLED = 'killed'
+REASON_CAPACITY = 'tex_capacity'
+REASON_MISSING_FILE = 'missing_file'
+REASON_IMAGE = 'image_error'
+REASON_LATEX = 'latex_error'
+REASON_NO_LATEX = 'pdflatex_missing'
+REASON_CIRCUIT_OPEN = 'circuit_open'
+
+# Reasons that point at the template or the machine and count towards the
+# breaker. The others come from the request's own values (a bad signature
+# image, a character the template can't take, ...) or say nothing about the
+# template, and are only recorded on the job.
+BREAKER_REASONS = {REASON_TIMEOUT, REASON_CPU_LIMIT, REASON_MEMORY_LIMIT, REASON_KILLED, REASON_CAPACITY}
+# Reasons that will fail the same way on every retry (CPU time and memory use
+# don't depend on load, unlike wall-clock time)
+PERMANENT_REASONS = {REASON_CPU_LIMIT, REASON_MEMORY_LIMIT, REASON_MISSING_FILE, REASON_IMAGE, REASON_LATEX,
+                     REASON_CAPACITY, REASON_NO_LATEX}
+
+MEMORY_ERRORS = re.compile(r"memory exhausted|out of memory|Cannot allocate memory|MemoryError", re.IGNORECASE)
+IMAGE_ERRORS = re.compile(r"Unable to load picture|Cannot determine size of graphic|libpng error|"
+                          r"Unknown graphics extension|PDF inclusion")
+
+_local = threading.local()
+_breakers_lock = threading.Lock()
+
+
+class CompileFailure(Exception):
+    """A render that failed for a known reason; carries the record saved on the job"""
+
+    def __init__(self, failure):
+        # failure is the only argument so the exception pickles across the render pool
+        super().__init__(failure)
+        self.failure = failure
+
+    def __str__(self):
+        return f"{self.failure['reason']}: {self.failure.get('detail') or ''}".strip(': ')
+
+    @property
+    def reason(self):
+        return self.failure['reason']
+
+    @property
+    def permanent(self):
+        return self.reason in PERMANENT_REASONS
+
+
+def _limited_command(cmd):
+    """
+    cmd run through sh with the rlimits set by ulimit before it execs. This
+    replaces a preexec_fn, which can deadlock the child when the parent has
+    threads (the render dispatcher, the render service and the web routes
+    all do).
+    """
+    if resource is None:
+        return cmd
+    # The CPU hard limit sits a little above the soft one so SIGXCPU arrives first
+    settings = []
+    if CPU_SECONDS > 0:
+        settings += [f"ulimit -St {CPU_SECONDS}", f"ulimit -Ht {CPU_SECONDS + 5}"]
+    if MEMORY_MB > 0:
+        settings.append(f"ulimit -v {MEMORY_MB * 1024}")  # KiB
+    if OUTPUT_MB > 0:
+        settings.append(f"ulimit -f {OUTPUT_MB * 2048}")  # 512-byte blocks
+    if not settings:
+        return cmd
+    # A limit that can't be set (e.g. above the hard limit) is skipped, as before
+    script = ''.join(f"{setting} 2>/dev/null; " for setting in settings) + 'exec "$@"'
+    return ['/bin/sh', '-c', script, 'sh'] + list(cmd)
+
+
+def run_limited(cmd, cwd=None, env=None, timeout=None):
+    """
+    Run a TeX command with rlimits (CPU, address space, output file size) in
+    its own process group. On timeout the whole group is killed, so helpers
+    pdflatex started (e.g. for image conversion) go too.
+
+    Args:
+        cmd: Command line
+        cwd: Working directory
+        env: Environment
+        timeout: Seconds to wait (None for TIMEOUT)
+
+    Returns:
+        CompletedProcess: With an extra timed_out attribute
+    """
+    timeout = TIMEOUT if timeout is None else max(timeout, 0.1)
+    posix = os.name == 'posix'
+    process = subprocess.Popen(_limited_command(cmd) if posix else cmd, cwd=cwd, env=env,
+                               stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               text=True, errors='replace', start_new_session=posix)
+    timed_out = False
+    try:
+        stdout, stderr = process.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        timed_out = True
+        if posix:
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        else:
+            process.kill()
+        stdout, stderr = process.communicate()
+        logger.error(f"Killed {os.path.basename(cmd[0])} after {timeout:.0f}s")
+
+    result = subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+    result.timed_out = timed_out
+    return result
+
+
+def remaining(deadline):
+    """Seconds left until a time.monotonic() deadline (None means TIMEOUT)"""
+    return TIMEOUT if deadline is None else deadline - time.monotonic()
+
+
+# -------------------------------
+# Failure records
+# -------------------------------
+
+def _first_error(log):
+    """The first '!' error of a TeX log and the line after it"""
+    lines = (log or '').splitlines()
+    for index, line in enumerate(lines):
+        if line.startswith('!'):
+            return ' '.join(part.strip() for part in lines[index:index + 2])[:300]
+    return None
+
+
+def classify(process):
+    """Failure reason and detail for a pdflatex run that produced no PDF"""
+    log = (process.stdout or '') + (process.stderr or '')
+    detail = _first_error(log)
+    if getattr(process, 'timed_out', False):
+        return REASON_TIMEOUT, detail
+    # Killed by the signal, or a wrapper script reporting its child was
+    if resource is not None and process.returncode in (-signal.SIGXCPU, 128 + signal.SIGXCPU):
+        return REASON_CPU_LIMIT, detail
+    if MEMORY_ERRORS.search(log):
+        return REASON_MEMORY_LIMIT, detail or MEMORY_ERRORS.search(log).group(0)
+    if process.returncode is not None and process.returncode < 0:
+        return REASON_KILLED, f"signal {-process.returncode}"
+    if 'TeX capacity exceeded' in log:
+        return REASON_CAPACITY, detail
+    if IMAGE_ERRORS.search(log):
+        return REASON_IMAGE, detail
+    if re.search(r"! LaTeX Error: File `[^']*' not found", log):
+        return REASON_MISSING_FILE, detail
+    return REASON_LATEX, detail
+
+
+def record_failure(template, reason, detail=None, exit_code=None, elapsed=None, count=True):
+    """
+    Remember why the last compile on this thread failed and, for
+    BREAKER_REASONS, count it against the template. Pass count=False for a
+    failure another process already counted (e.g. the render service).
+    """
+    failure = {
+        'reason': reason,
+        'template': template,
+        'detail': detail,
+        'exit_code': exit_code,
+        'elapsed': round(elapsed, 2) if elapsed is not None else None,
+    }
+    _local.failure = failure
+    if count and reason in BREAKER_REASONS:
+        _count(template, failed=True)
+    logger.error(f"LaTeX compile failed for {template}: {failure}")
+    return failure
+
+
+def record_success(template):
+    _local.failure = None
+    _count(template, failed=False)
+
+
+def clear_failure():
+    _local.failure = None
+
+
+def last_failure():
+    """Failure record of the last compile on this thread, or None if it succeeded"""
+    return getattr(_local, 'failure', None)
+
+
+# -------------------------------
+# Circuit breaker
+# -------------------------------
+
+@contextmanager
+def _shared_breakers():
+    """
+    Breaker state of every template, {template: {'failures': int, 'opened_at':
+    epoch seconds or None}}, locked while held and saved when changed.
+    """
+    with _breakers_lock:
+        os.makedirs(os.path.dirname(BREAKER_STATE), exist_ok=True)
+        with os.fdopen(os.open(BREAKER_STATE, os.O_RDWR | os.O_CREAT, 0o644), 'r+') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            content = f.read()
+            try:
+                breakers = json.loads(content) if content else {}
+            except ValueError:
+                breakers = {}
+            yield breakers
+            updated = json.dumps(breakers, sort_keys=True)
+            if updated != content:
+                f.seek(0)
+                f.truncate()
+                f.write(updated)
+
+
+def _count(template, failed):
+    with _shared_breakers() as breakers:
+        breaker = breakers.get(template)
+        if not failed:
+            if breaker:
+                if breaker['opened_at']:
+                    logger.info(f"Template {template} rendered again, closing its circuit")
+                del breakers[template]
+            return
+        breaker = breakers.setdefault(template, {'failures': 0, 'opened_at': None})
+        breaker['failures'] += 1
+        if breaker['failures'] >= BREAKER_THRESHOLD:
+            if not breaker['opened_at']:
+                logger.error(f"Template {template} failed {breaker['failures']} times in a row, "
+                             f"pausing it for {BREAKER_COOLDOWN:.0f}s")
+            breaker['opened_at'] = time.time()
+
+
+def allow(template):
+    """
+    Whether a compile of this template may run. Once the cooldown has passed
+    one trial is let through (in any process); its result closes or re-opens
+    the circuit.
+    """
+    with _shared_breakers() as breakers:
+        breaker = breakers.get(template)
+        if not breaker or not breaker['opened_at']:
+            return True
+        if time.time() - breaker['opened_at'] >= BREAKER_COOLDOWN:
+            # Half-open: hold the others off for another cooldown while the trial runs
+            breaker['opened_at'] = time.time()
+            return True
+        return False
+
+
+def paused_templates():
+    """Templates whose circuit is open and not due for a trial yet"""
+    with _shared_breakers() as breakers:
+        now = time.time()
+        return sorted(template for template, breaker in breakers.items()
+                      if breaker['opened_at'] and now - breaker['opened_at'] < BREAKER_COOLDOWN)
+
+
+def breaker_status():
+    """{template: {'failures', 'open'}} of the templates that failed last time"""
+    with _shared_breakers() as breakers:
+        return {template: {'failures': breaker['failures'], 'open': bool(breaker['opened_at'])}
+                for template, breaker in breakers.items()}
@@ -0,0 +1,132 @@
+import os
+import time
+import shutil
+import logging
+import tempfile
+import subprocess
+from functools import lru_cache
+
+import render_cache
+import latex_formats
+import latex_limits
+
+logger = logging.getLogger(__name__)
+
+# Places pdflatex is looked for, in order
+PDFLATEX_PATHS = [
+    "pdflatex",  # Try system PATH first
+    r"C:\Program Files\MiKTeX\miktex\bin\x64\pdflatex.exe",
+    r"C:\Program Files (x86)\MiKTeX\miktex\bin\pdflatex.exe",
+    r"/usr/bin/pdflatex",  # Linux
+    r"/usr/local/bin/pdflatex",  # macOS
+    r"C:\texlive\2022\bin\win32\pdflatex.exe",  # TexLive on Windows
+]
+
+# Scratch directories go on tmpfs when the host has one
+SCRATCH_CANDIDATES = [os.environ.get('LATEX_SCRATCH_DIR'), '/dev/shm']
+
+
+@lru_cache(maxsize=1)
+def find_pdflatex():
+    """
+    Locate the pdflatex executable. The result is cached for the life of the
+    process instead of probing every path on each render.
+
+    Returns:
+        str: Path of pdflatex, or None if LaTeX is not installed
+    """
+    for path in PDFLATEX_PATHS:
+        try:
+            result = subprocess.run([path, "--version"], stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10)
+            if result.returncode == 0:
+                logger.info(f"Found pdflatex at: {path}")
+                return path
+        except Exception as e:
+            logger.debug(f"Failed to execute {path}: {str(e)}")
+
+    logger.error("pdflatex not found. Make sure LaTeX is installed.")
+    return None
+
+
+@lru_cache(maxsize=1)
+def scratch_root():
+    """Directory that private per-job scratch directories are created in"""
+    for candidate in SCRATCH_CANDIDATES:
+        if candidate and os.path.isdir(candidate) and os.access(candidate, os.W_OK):
+            return candidate
+    return tempfile.gettempdir()
+
+
+def compile_tex(tex_source, pdf_path, passes=2, template='latex'):
+    """
+    Compile a LaTeX document to pdf_path.
+
+    Each call works in its own scratch directory and passes it to pdflatex as
+    its working directory, so the process-wide cwd is never touched and any
+    number of renders can run side by side. Only the finished PDF is moved
+    out; the .tex/.aux/.log files are dropped with the scratch directory.
+
+    pdflatex runs under the limits in latex_limits (wall-clock budget for all
+    passes, CPU/memory rlimits). When the compile fails, the reason is kept in
+    latex_limits.last_failure() and counted against the template; a template
+    that keeps failing is skipped until its cooldown has passed.
+
+    Args:
+        tex_source: The fully filled-in LaTeX source
+        pdf_path: Where the PDF should be written
+        passes: Number of pdflatex runs (2 resolves page references)
+        template: Name the failures are counted under (e.g. 'ferpa')
+
+    Returns:
+        str: pdf_path on success, None if the PDF could not be produced
+    """
+    latex_limits.clear_failure()
+    tex_source = render_cache.make_deterministic(tex_source)
+    cache_key = render_cache.cache_key(tex_source)
+    if render_cache.fetch(cache_key, pdf_path):
+        return pdf_path
+
+    if not latex_limits.allow(template):
+        latex_limits.record_failure(template, latex_limits.REASON_CIRCUIT_OPEN,
+                                    'Template disabled after repeated failures')
+        return None
+
+    pdflatex = find_pdflatex()
+    if not pdflatex:
+        latex_limits.record_failure(template, latex_limits.REASON_NO_LATEX)
+        return None
+
+    scratch_dir = tempfile.mkdtemp(prefix='latex_', dir=scratch_root())
+    try:
+        tex_path = os.path.join(scratch_dir, 'document.tex')
+        with open(tex_path, 'w', encoding='utf-8') as f:
+            f.write(tex_source)
+
+        start = time.monotonic()
+        process = latex_formats.run_pdflatex(pdflatex, tex_path, scratch_dir, passes=passes,
+                                             env=render_cache.deterministic_env(),
+                                             deadline=start + latex_limits.TIMEOUT)
+
+        built_pdf = os.path.join(scratch_dir, 'document.pdf')
+        if process.returncode != 0 or not os.path.exists(built_pdf):
+            logger.error(f"Error compiling LaTeX for {pdf_path} (exit code {process.returncode})")
+            logger.error(process.stdout[-2000:])
+            if process.stderr:
+                logger.error(process.stderr)
+            reason, detail = latex_limits.classify(process)
+            latex_limits.record_failure(template, reason, detail, exit_code=process.returncode,
+                                        elapsed=time.monotonic() - start)
+            return None
+        latex_limits.record_success(template)
+
+        # Copy next to the destination, then rename so the PDF appears atomically
+        os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+        partial_path = f"{pdf_path}.{os.getpid()}.part"
+        shutil.move(built_pdf, partial_path)
+        os.replace(partial_path, pdf_path)
+        logger.info(f"PDF generated successfully at: {pdf_path} ({os.path.getsize(pdf_path)} bytes)")
+
+        render_cache.store(cache_key, pdf_path)
+        return pdf_path
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
@@ -0,0 +1,123 @@
+import os
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Placeholder styles used by the templates
+HASH_PLACEHOLDER = re.compile(r'##([A-Z_]+)##')  # static/templates/*.tex
+BRACE_PLACEHOLDER = re.compile(r'\{\{([A-Z_]+)\}\}')  # static/form-templates/*.tex
+
+# Characters with a special meaning in LaTeX, mapped for str.translate so the
+# whole value is escaped in one pass (and backslashes are never re-escaped)
+LATEX_SPECIAL_CHARS = str.maketrans({
+    '\\': '\\textbackslash{}',
+    '&': '\\&',
+    '%': '\\%',
+    '$': '\\$',
+    '#': '\\#',
+    '_': '\\_',
+    '{': '\\{',
+    '}': '\\}',
+    '~': '\\textasciitilde{}',
+    '^': '\\textasciicircum{}',
+})
+
+
+def latex_escape(text):
+    """Escape special LaTeX characters in a value"""
+    if text is None:
+        return ""
+    return str(text).translate(LATEX_SPECIAL_CHARS)
+
+
+class CompiledTemplate:
+    """
+    A template split once into literal text and named slots.
+
+    render() fills every slot in a single pass over the segment list instead
+    of one full-string replace per placeholder.
+    """
+
+    def __init__(self, source, pattern=HASH_PLACEHOLDER):
+        self.literals = []
+        self.slots = []
+
+        position = 0
+        for match in pattern.finditer(source):
+            self.literals.append(source[position:match.start()])
+            self.slots.append(match.group(1))
+            position = match.end()
+        self.literals.append(source[position:])
+
+    @property
+    def fields(self):
+        """Names of all placeholders in the template"""
+        return set(self.slots)
+
+    def render(self, values, raw=()):
+        """
+        Fill the template.
+
+        Args:
+            values: Dict of placeholder name -> value. Missing placeholders
+                    are left empty.
+            raw: Names whose values are LaTeX already (image paths, generated
+                 sections) and must not be escaped
+
+        Returns:
+            str: The filled-in LaTeX source
+        """
+        parts = []
+        for literal, name in zip(self.literals, self.slots):
+            parts.append(literal)
+            value = values.get(name)
+            if value is None:
+                continue
+            parts.append(str(value) if name in raw else latex_escape(value))
+        parts.append(self.literals[-1])
+        return ''.join(parts)
+
+
+_templates = {}
+_lock = threading.Lock()
+
+
+def load_template(path, pattern=HASH_PLACEHOLDER, derive=None):
+    """
+    Return the compiled template for a file, parsing it only when the file
+    is new or its modification time has changed.
+
+    Args:
+        path: Path of the .tex template
+        pattern: Placeholder style (HASH_PLACEHOLDER or BRACE_PLACEHOLDER)
+        derive: Optional function applied to the source before it is compiled,
+                used to build one template from another. Its result is cached
+                together with the file.
+
+    Returns:
+        CompiledTemplate: The parsed template
+    """
+    path = os.path.abspath(path)
+    key = (path, pattern.pattern, derive)
+    mtime = os.stat(path).st_mtime_ns
+
+    cached = _templates.get(key)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _lock:
+        cached = _templates.get(key)
+        if cached and cached[0] == mtime:
+            return cached[1]
+
+        with open(path, 'r', encoding='utf-8') as f:
+            source = f.read()
+        if derive:
+            source = derive(source)
+
+        template = CompiledTemplate(source, pattern)
+        _templates[key] = (mtime, template)
+        logger.info(f"Loaded template {path}{' (' + derive.__name__ + ')' if derive else ''}")
+        return template
@@ -1,5 +1,5 @@
 # Imports
-from flask import Flask, render_template, url_for, request, redirect, session, send_file, flash
+from flask import Flask, render_template, url_for, request, redirect, session, flash
 from flask_sqlalchemy import SQLAlchemy
 from flask_wtf import FlaskForm
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -9,10 +9,22 @@ from wtforms.validators import DataRequired, Length, Email, Optional
 from O365 import Account
 from datetime import datetime, timedelta, date
 from config import client_id, client_secret, SECRET_KEY
-from form_utils import allowed_file, return_choice, generate_ferpa, generate_ssn_name
+from form_utils import allowed_file, return_choice
+from render_queue import RenderQueue, snapshot_request, record_pdf
+import render_pool
+import latex_limits
+import single_flight
+import storage
+from previews import preview_response
+from storage_janitor import StorageJanitor, format_report
+from signature_utils import normalize_async
+from storage_layout import sharded_path, relative_path, upload_name, documentation_name
+from artifacts import (register_artifact, latest_artifact, artifact_at, resolve_path,
+                       KIND_PDF, KIND_DOCUMENTATION, KIND_SIGNATURE)
 from sqlalchemy.orm import joinedload
 import json
 import os
+import click
 import re
 import uuid
 import jwt
@@ -22,6 +34,30 @@ app.config['SECRET_KEY'] = SECRET_KEY
 app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
 app.config['UPLOAD_FOLDER'] = 'static/uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+
+# Background PDF rendering (see render_queue.py)
+app.config['RENDER_POOL_SIZE'] = int(os.environ.get('RENDER_POOL_SIZE', 2))
+app.config['RENDER_MAX_ATTEMPTS'] = 3
+# Pre-render saved drafts in the background so an unchanged submit attaches the PDF at once
+app.config['RENDER_SPECULATIVE'] = os.environ.get('RENDER_SPECULATIVE', '1') == '1'
+# Build the merged packet PDF (form + documentation) when a request's PDF is rendered
+app.config['RENDER_PACKETS'] = os.environ.get('RENDER_PACKETS', '0') == '1'
+# Set to 0 when a separate `flask render-worker` process consumes the queue
+app.config['RENDER_QUEUE_EMBEDDED'] = os.environ.get('RENDER_QUEUE_EMBEDDED', '1') == '1'
+
+# File downloads (see file_serving.py). FILE_OFFLOAD hands the transfer to the
+# front proxy: 'x-accel' (nginx X-Accel-Redirect) or 'x-sendfile'.
+app.config['FILE_OFFLOAD'] = os.environ.get('FILE_OFFLOAD', '')
+app.config['USE_X_SENDFILE'] = app.config['FILE_OFFLOAD'] == 'x-sendfile'
+# Internal nginx location that maps to X_ACCEL_ROOT
+app.config['X_ACCEL_LOCATION'] = os.environ.get('X_ACCEL_LOCATION', '/protected/')
+app.config['X_ACCEL_ROOT'] = os.environ.get('X_ACCEL_ROOT', os.path.join(os.path.abspath(os.path.dirname(__file__)), 'static'))
+
+# Storage cleanup (see storage_janitor.py)
+app.config['JANITOR_EMBEDDED'] = os.environ.get('JANITOR_EMBEDDED', '1') == '1'
+app.config['JANITOR_INTERVAL'] = int(os.environ.get('JANITOR_INTERVAL', 300))
+app.config['JANITOR_RETENTION_DAYS'] = int(os.environ.get('JANITOR_RETENTION_DAYS', 30))
+app.config['JANITOR_DELETE_ORPHANS'] = os.environ.get('JANITOR_DELETE_ORPHANS', '0') == '1'
 db = SQLAlchemy(app)
 
 # Create upload directories
@@ -661,6 +697,109 @@ class UserRole(db.Model):
     department = db.relationship('Department')
     user = db.relationship('Profile', back_populates='user_roles')
 
+# Queued PDF renders, consumed by the render dispatcher in render_queue.py
+class RenderJob(db.Model):
+    __tablename__ = 'render_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    form_type = db.Column(db.String(50), nullable=False)  # 'medical_withdrawal', 'student_drop'
+    form_id = db.Column(db.Integer, nullable=False)  # ID of the form record
+    form_status = db.Column(db.String(20), nullable=False)  # Request status the PDF is rendered for
+    state = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, default=0)
+    pdf_path = db.Column(db.String(300), nullable=True)
+    error = db.Column(db.Text, nullable=True)  # JSON failure record for LaTeX failures (see latex_limits.py)
+    failure_reason = db.Column(db.String(30), nullable=True)  # timeout, cpu_limit, latex_error, circuit_open...
+    kind = db.Column(db.String(20), nullable=False, default='final')  # final, speculative (draft pre-render)
+    content_hash = db.Column(db.String(64), nullable=True)  # Request content a speculative render was made from
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_render_jobs_state_created', 'state', 'created_at'),
+        db.Index('ix_render_jobs_form', 'form_type', 'form_id'),
+    )
+
+    def __repr__(self):
+        return f"<RenderJob {self.form_type}:{self.form_id} {self.state}>"
+
+# Index of generated PDFs and uploaded files (see artifacts.py)
+class GeneratedArtifact(db.Model):
+    __tablename__ = 'generated_artifacts'
+    id = db.Column(db.Integer, primary_key=True)
+    form_type = db.Column(db.String(50), nullable=False)  # 'medical_withdrawal', 'student_drop', 'ferpa', 'infochange'
+    form_id = db.Column(db.Integer, nullable=False)  # ID of the form record
+    status = db.Column(db.String(20), nullable=True)  # Request status a PDF was rendered for
+    kind = db.Column(db.String(20), nullable=False)  # pdf, documentation, signature
+    path = db.Column(db.String(500), nullable=False)  # Relative to the app directory
+    size = db.Column(db.Integer, nullable=True)
+    sha256 = db.Column(db.String(64), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.Index('ix_generated_artifacts_lookup', 'form_type', 'form_id', 'kind', 'status', 'created_at'),
+        db.Index('ix_generated_artifacts_path', 'path'),
+    )
+
+    def __repr__(self):
+        return f"<GeneratedArtifact {self.form_type}:{self.form_id} {self.kind} {self.path}>"
+
+# Request model for each form type that has a generated PDF
+RENDERABLE_FORMS = {
+    'medical_withdrawal': MedicalWithdrawalRequest,
+    'student_drop': StudentInitiatedDrop,
+    'ferpa': FERPARequest,
+    'infochange': InfoChangeRequest,
+}
+
+def approver_names(record):
+    """Names of the admins in a request's admin_approvals, for stamped PDFs"""
+    if not record.admin_approvals:
+        return []
+    names = []
+    for admin_id in json.loads(record.admin_approvals):
+        admin = db.session.get(Profile, int(admin_id))
+        if admin:
+            names.append(f"{admin.first_name or ''} {admin.last_name or ''}".strip() or admin.email_)
+    return names
+
+def mark_admin_viewed(record, user_id):
+    """Add an admin to a request's admin_viewed list if not already there"""
+    admin_viewed = json.loads(record.admin_viewed) if record.admin_viewed else []
+    if str(user_id) not in admin_viewed:
+        admin_viewed.append(str(user_id))
+        record.admin_viewed = json.dumps(admin_viewed)
+
+def render_pdf_now(form_type, record):
+    """
+    Render a request's PDF synchronously, in the renderer pool when it is
+    running (see render_pool.py). The outcome is kept as a finished
+    RenderJob, so a LaTeX failure shows on the status page; the caller
+    commits after a success.
+
+    Returns:
+        str: Path of the PDF, or None if it could not be rendered
+    """
+    snapshot = snapshot_request(record, approvers=approver_names(record))
+    try:
+        pdf_path = render_pool.render_snapshot(form_type, snapshot)
+    except latex_limits.CompileFailure as e:
+        # Keep the reason where the status page shows it, as for queued renders
+        print(f"Error rendering {form_type} #{record.id}: {str(e)}")
+        render_queue.record_render(form_type, record, failure=e)
+        db.session.commit()
+        return None
+    except Exception as e:
+        print(f"Error rendering {form_type} #{record.id}: {str(e)}")
+        return None
+    if pdf_path and os.path.exists(pdf_path):
+        render_queue.record_render(form_type, record, pdf_path=pdf_path)
+    return pdf_path
+
+render_queue = RenderQueue(app, db, RenderJob, RENDERABLE_FORMS, approver_names=approver_names,
+                           artifact_model=GeneratedArtifact)
+storage_janitor = StorageJanitor(app, db, RENDERABLE_FORMS, job_model=RenderJob, artifact_model=GeneratedArtifact)
+
 
 @app.before_request
 def check_user_active():
@@ -671,6 +810,115 @@ def check_user_active():
             session.clear()  # Clear session to prevent further access
             return redirect(url_for('deactivated'))  # Redirect to a deactivated page
 
+@app.before_request
+def start_render_dispatcher():
+    # Started lazily so it runs in the serving process (not the reloader parent)
+    if app.config['RENDER_QUEUE_EMBEDDED']:
+        render_queue.ensure_started()
+    if app.config['JANITOR_EMBEDDED']:
+        storage_janitor.ensure_started()
+
+@app.cli.command('render-worker')
+def render_worker():
+    """Consume the PDF render queue in the foreground"""
+    render_queue.run_forever()
+
+@app.cli.command('render-pdfs')
+@click.option('--form-type', 'form_types', multiple=True, type=click.Choice(list(RENDERABLE_FORMS)),
+              help='Form type to render (repeatable, default: all)')
+@click.option('--status', 'statuses', multiple=True, help='Only requests with this status (repeatable)')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), help='Submitted on or after YYYY-MM-DD')
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), help='Submitted before YYYY-MM-DD')
+@click.option('--ids', help='Comma-separated request IDs')
+@click.option('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+@click.option('--restart', is_flag=True, help='Ignore progress saved by an interrupted run')
+def render_pdfs(form_types, statuses, since, until, ids, workers, restart):
+    """Re-render stored request PDFs in parallel (resumable)"""
+    from bulk_render import run_bulk_render
+
+    id_list = [int(i) for i in ids.split(',') if i.strip()] if ids else None
+    rendered, failures = run_bulk_render(
+        db, RENDERABLE_FORMS, list(form_types) or list(RENDERABLE_FORMS),
+        statuses=list(statuses), since=since, until=until, ids=id_list,
+        workers=workers, restart=restart, artifact_model=GeneratedArtifact
+    )
+
+    click.echo(f"Rendered {rendered} PDF(s), {len(failures)} failure(s)")
+    for form_type, form_id, error in failures:
+        click.echo(f"  {form_type} #{form_id}: {error}")
+
+@app.cli.command('index-artifacts')
+def index_artifacts():
+    """Add existing PDFs, documentation and signatures to the artifact index"""
+    from artifacts import index_existing_files
+
+    added = index_existing_files(db, GeneratedArtifact, RENDERABLE_FORMS)
+    click.echo(f"Indexed {added[KIND_PDF]} PDF(s), {added[KIND_DOCUMENTATION]} documentation file(s) "
+               f"and {added[KIND_SIGNATURE]} signature(s)")
+
+@app.cli.command('normalize-signatures')
+def normalize_signatures():
+    """Make print copies (cropped, downsampled, grayscale) of existing signature images"""
+    from signature_utils import backfill_signatures
+
+    counts = backfill_signatures()
+    click.echo(f"Normalized {counts['normalized']} signature(s), {counts['skipped']} already done, "
+               f"{counts['failed']} unreadable")
+
+@app.cli.command('optimize-pdfs')
+@click.option('--dry-run', is_flag=True, help='Only list the PDFs that would be rewritten')
+def optimize_pdfs(dry_run):
+    """Shrink and linearize existing PDFs in place, recording their checksums"""
+    from pdf_optimize import optimize_existing, format_delta, MANIFEST_PATH
+
+    reports = optimize_existing(db, GeneratedArtifact, dry_run=dry_run)
+    for report in reports:
+        click.echo(f"  {os.path.relpath(report['path'])}: " +
+                   (f"{report['before'] / 1024:.1f} KB" if dry_run else format_delta(report)))
+
+    before = sum(report['before'] for report in reports)
+    after = sum(report['after'] for report in reports)
+    if dry_run:
+        click.echo(f"Would optimize {len(reports)} PDF(s), {before / 1024:.1f} KB")
+    else:
+        click.echo(f"Optimized {len(reports)} PDF(s): {before / 1024:.1f} KB -> {after / 1024:.1f} KB; "
+                   f"checksums recorded in {os.path.relpath(MANIFEST_PATH)}")
+
+@app.cli.command('migrate-storage')
+@click.option('--dry-run', is_flag=True, help='Only count the files that would be moved')
+def migrate_storage(dry_run):
+    """Move stored files into hash-prefix shard directories and update their paths (stop the app first)"""
+    from storage_layout import migrate
+
+    counts = migrate(db, RENDERABLE_FORMS, artifact_model=GeneratedArtifact, job_model=RenderJob, dry_run=dry_run)
+    if dry_run:
+        click.echo(f"Would move {counts['files']} file(s)")
+    else:
+        click.echo(f"Moved {counts['files']} file(s) and updated {counts['rows']} row(s)")
+
+@app.cli.command('publish-storage')
+def publish_storage():
+    """Upload files missing from the configured storage backend (failed uploads, or after switching to S3)"""
+    counts = storage.publish_existing(GeneratedArtifact)
+    click.echo(f"Uploaded {counts['uploaded']} file(s), {counts['present']} already stored, "
+               f"{counts['missing']} missing locally, {counts['failed']} failed")
+
+@app.cli.command('clean-storage')
+@click.option('--full', is_flag=True, help='Keep going until every file and request has been checked')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed')
+@click.option('--delete-orphans', is_flag=True, default=None,
+              help='Also delete files no request references (default: JANITOR_DELETE_ORPHANS)')
+def clean_storage(full, dry_run, delete_orphans):
+    """Remove LaTeX byproducts, superseded PDFs and (optionally) orphaned files"""
+    if full:
+        report = storage_janitor.run_cycle(dry_run=dry_run, delete_orphans=delete_orphans)
+    else:
+        report, _, _ = storage_janitor.run_pass(dry_run=dry_run, delete_orphans=delete_orphans)
+
+    click.echo(("Would clean: " if dry_run else "Cleaned: ") + format_report(report))
+    for path in report['orphans']:
+        click.echo(f"  orphan: {path}")
+
 
 # -------------------------------
 # V3 Routes
@@ -702,13 +950,11 @@ def ferpa_form():
                 # Generate a unique name for the image
                 unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
 
-                # Create the signatures directory if it doesn't exist
+                # Save file with new name in its shard directory and start making its print copy
                 signatures_dir = os.path.join('static', 'uploads', 'signatures')
-                os.makedirs(signatures_dir, exist_ok=True)
-
-                # Save file with new name
-                filepath = os.path.join(signatures_dir, unique_filename)
-                file.save(filepath)
+                filepath = sharded_path(signatures_dir, unique_filename)
+                storage.save_upload(file, filepath)
+                normalize_async(filepath)
 
                 # Use forward slashes for LaTeX compatibility
                 latex_path = filepath.replace("\\", "/")
@@ -767,7 +1013,7 @@ def ferpa_form():
 
                 # Generate PDF with debug output
                 print(f"Generating FERPA PDF with data: {data}")
-                pdf_file = generate_ferpa(data, forms_dir, signatures_dir)
+                pdf_file = render_pool.call('generate_ferpa', data, forms_dir, signatures_dir)
                 print(f"Generated PDF file: {pdf_file}")
 
                 if not pdf_file:
@@ -793,7 +1039,7 @@ def ferpa_form():
                     user_id=user_id,
                     status=status,
                     pdf_link=pdf_file,
-                    sig_link=unique_filename,
+                    sig_link=relative_path(signatures_dir, filepath),
                     name=data['NAME'],
                     campus=data['CAMPUS'],
                     official_choices=official_choices_str,
@@ -814,7 +1060,12 @@ def ferpa_form():
                 db.session.add(new_ferpa_request)
                 db.session.commit()
 
-
+                # Index the PDF and signature for downloads
+                if pdf_file:
+                    register_artifact(db.session, GeneratedArtifact, 'ferpa', new_ferpa_request.id, KIND_PDF,
+                                      os.path.join('static', 'forms', pdf_file), status=status)
+                register_artifact(db.session, GeneratedArtifact, 'ferpa', new_ferpa_request.id, KIND_SIGNATURE, filepath)
+                db.session.commit()
 
                 print(f"Created FERPA request with ID: {new_ferpa_request.id}")
 
@@ -872,13 +1123,11 @@ def name_ssn_change():
                 # Generate a unique name for the image
                 unique_filename = str(uuid.uuid4()) + '.' + file.filename.rsplit('.', 1)[1].lower()
 
-                # Create the signatures directory if it doesn't exist
+                # Save file with new name in its shard directory and start making its print copy
                 signatures_dir = os.path.join('static', 'uploads', 'signatures')
-                os.makedirs(signatures_dir, exist_ok=True)
-
-                # Save file with new name
-                filepath = os.path.join(signatures_dir, unique_filename)
-                file.save(filepath)
+                filepath = sharded_path(signatures_dir, unique_filename)
+                storage.save_upload(file, filepath)
+                normalize_async(filepath)
 
                 # Use forward slashes for LaTeX compatibility
                 latex_path = filepath.replace("\\", "/")
@@ -918,7 +1167,7 @@ def name_ssn_change():
 
                 # Generate PDF with debug output
                 print(f"Generating Name/SSN Change PDF with data: {data}")
-                pdf_file = generate_ssn_name(data, forms_dir, signatures_dir)
+                pdf_file = render_pool.call('generate_ssn_name', data, forms_dir, signatures_dir)
                 print(f"Generated PDF file: {pdf_file}")
 
                 if not pdf_file:
@@ -944,7 +1193,7 @@ def name_ssn_change():
                     user_id=user_id,
                     status=status,
                     pdf_link=pdf_file,
-                    sig_link=unique_filename,
+                    sig_link=relative_path(signatures_dir, filepath),
                     name=data['NAME'],
                     peoplesoft_id=data['PEOPLESOFT'],
                     choice=choice_str,
@@ -967,6 +1216,14 @@ def name_ssn_change():
                 db.session.add(new_infochange_request)
                 db.session.commit()
 
+                # Index the PDF and signature for downloads
+                if pdf_file:
+                    register_artifact(db.session, GeneratedArtifact, 'infochange', new_infochange_request.id, KIND_PDF,
+                                      os.path.join('static', 'forms', pdf_file), status=status)
+                register_artifact(db.session, GeneratedArtifact, 'infochange', new_infochange_request.id,
+                                  KIND_SIGNATURE, filepath)
+                db.session.commit()
+
                 print(f"Created Info Change request with ID: {new_infochange_request.id}")
 
                 if form.is_draft.data:
@@ -1031,215 +1288,89 @@ def status():
     print(f"FERPA requests: {len(ferpa_requests)}")
     print(f"Name/SSN change requests: {len(infochange_requests)}")
 
+    # Latest PDF render job for each request, shown next to its status
+    medical_render_jobs = render_queue.latest_jobs('medical_withdrawal', [r.id for r in medical_requests])
+    student_drop_render_jobs = render_queue.latest_jobs('student_drop', [r.id for r in student_drop_requests])
+    ferpa_render_jobs = render_queue.latest_jobs('ferpa', [r.id for r in ferpa_requests])
+    infochange_render_jobs = render_queue.latest_jobs('infochange', [r.id for r in infochange_requests])
+
     return render_template(
         'status.html',
         medical_requests=medical_requests,
         student_drop_requests=student_drop_requests,
         ferpa_requests=ferpa_requests,
-        infochange_requests=infochange_requests
+        infochange_requests=infochange_requests,
+        medical_render_jobs=medical_render_jobs,
+        student_drop_render_jobs=student_drop_render_jobs,
+        ferpa_render_jobs=ferpa_render_jobs,
+        infochange_render_jobs=infochange_render_jobs
     )
 
 # Modified routes for FERPA and Name/SSN PDF downloads
 
-@app.route('/download_ferpa_pdf/<int:request_id>')
-def download_ferpa_pdf(request_id):
+def send_form_pdf(form_type, form_request):
+    """
+    Send the PDF of a FERPA or Name/SSN request, rendering it again from the
+    saved request if the file is missing
+    """
     user_id = session.get('user_id')
-    if not user_id:
-        return redirect(url_for('login'))
-
-    ferpa_request = FERPARequest.query.get_or_404(request_id)
 
     # Check if user is owner of the request or an admin
     user = Profile.query.get(user_id)
-    if ferpa_request.user_id != user_id and user.privilages_ != 'admin':
+    if form_request.user_id != user_id and user.privilages_ != 'admin':
         flash('You do not have permission to access this file.', 'danger')
         return redirect(url_for('status'))
 
-    # Get the absolute path to the forms directory
-    current_dir = os.path.abspath(os.getcwd())
-    forms_dir = os.path.join(current_dir, 'static', 'forms')
-    pdf_path = os.path.join(forms_dir, ferpa_request.pdf_link)
-
-    # Debug output
-    print(f"Looking for FERPA PDF at: {pdf_path}")
-    print(f"File exists: {os.path.exists(pdf_path)}")
-
-    if not os.path.exists(pdf_path):
-        # Try to regenerate the PDF if it doesn't exist
-        try:
-            # Get signature path
-            sig_path = os.path.join(current_dir, 'static', 'uploads', 'signatures', ferpa_request.sig_link)
-
-            # Extract data from the request object
-            official_choices = ferpa_request.official_choices.split(',') if ferpa_request.official_choices else []
-            info_choices = ferpa_request.info_choices.split(',') if ferpa_request.info_choices else []
-            release_choices = ferpa_request.release_choices.split(',') if ferpa_request.release_choices else []
-
-            # Rebuild data dictionary
-            data = {
-                "NAME": ferpa_request.name,
-                "CAMPUS": ferpa_request.campus,
-                "OPT_REGISTRAR": return_choice(official_choices, 'registrar'),
-                "OPT_AID": return_choice(official_choices, 'aid'),
-                "OPT_FINANCIAL": return_choice(official_choices, 'financial'),
-                "OPT_UNDERGRAD": return_choice(official_choices, 'undergrad'),
-                "OPT_ADVANCEMENT": return_choice(official_choices, 'advancement'),
-                "OPT_DEAN": return_choice(official_choices, 'dean'),
-                "OPT_OTHER_OFFICIALS": return_choice(official_choices, 'other'),
-                "OTHEROFFICIALS": ferpa_request.official_other,
-                "OPT_ACADEMIC_INFO": return_choice(info_choices, 'advising'),
-                "OPT_UNIVERSITY_RECORDS": return_choice(info_choices, 'all_records'),
-                "OPT_ACADEMIC_RECORDS": return_choice(info_choices, 'academics'),
-                "OPT_BILLING": return_choice(info_choices, 'billing'),
-                "OPT_DISCIPLINARY": return_choice(info_choices, 'disciplinary'),
-                "OPT_TRANSCRIPTS": return_choice(info_choices, 'transcripts'),
-                "OPT_HOUSING": return_choice(info_choices, 'housing'),
-                "OPT_PHOTOS": return_choice(info_choices, 'photos'),
-                "OPT_SCHOLARSHIP": return_choice(info_choices, 'scholarship'),
-                "OPT_OTHER_INFO": return_choice(info_choices, 'other'),
-                "OTHERINFO": ferpa_request.info_other,
-                "RELEASE": ferpa_request.release_to,
-                "PURPOSE": ferpa_request.purpose,
-                "ADDITIONALS": ferpa_request.additional_names,
-                "OPT_FAMILY": return_choice(release_choices, 'family'),
-                "OPT_INSTITUTION": return_choice(release_choices, 'institution'),
-                "OPT_HONOR": return_choice(release_choices, 'award'),
-                "OPT_EMPLOYER": return_choice(release_choices, 'employer'),
-                "OPT_PUBLIC": return_choice(release_choices, 'media'),
-                "OPT_OTHER_RELEASE": return_choice(release_choices, 'other'),
-                "OTHERRELEASE": ferpa_request.release_other,
-                "PASSWORD": ferpa_request.password,
-                "PEOPLESOFT": ferpa_request.peoplesoft_id,
-                "SIGNATURE": sig_path,
-                "DATE": str(ferpa_request.date)
-            }
-
-            # Regenerate PDF
-            os.makedirs(forms_dir, exist_ok=True)
-            new_pdf_file = generate_ferpa(data, forms_dir, os.path.join('static', 'uploads', 'signatures'))
-
-            if new_pdf_file:
-                # Update the database with the new PDF path
-                ferpa_request.pdf_link = new_pdf_file
-                db.session.commit()
-
-                # Update the pdf_path to the new file
-                pdf_path = os.path.join(forms_dir, new_pdf_file)
-                print(f"Regenerated PDF at: {pdf_path}")
-
-                if not os.path.exists(pdf_path):
-                    flash('PDF file could not be regenerated.', 'danger')
-                    return redirect(url_for('status'))
-            else:
-                flash('PDF file not found and could not be regenerated.', 'danger')
-                return redirect(url_for('status'))
-
-        except Exception as e:
-            import traceback
-            print(f"Error regenerating FERPA PDF: {str(e)}")
-            print(traceback.format_exc())
-            flash('PDF file not found and regeneration failed.', 'danger')
+    forms_dir = os.path.join(os.path.abspath(os.getcwd()), 'static', 'forms')
+    pdf_path = os.path.join(forms_dir, form_request.pdf_link)
+
+    if not storage.exists(pdf_path):
+        def existing_pdf():
+            # Regenerated by another worker while we waited
+            db.session.refresh(form_request)
+            path = os.path.join(forms_dir, form_request.pdf_link)
+            return path if storage.exists(path) else None
+
+        def regenerate():
+            # Render it again through the form's renderer (see form_renderers.py)
+            print(f"PDF for {form_type} request {form_request.id} missing at {pdf_path}, regenerating")
+            new_pdf_path = render_pdf_now(form_type, form_request)
+            if not new_pdf_path or not os.path.exists(new_pdf_path):
+                return None
+
+            # Update the database with the new PDF path
+            record_pdf(form_type, form_request, new_pdf_path)
+            register_artifact(db.session, GeneratedArtifact, form_type, form_request.id, KIND_PDF, new_pdf_path,
+                              status=form_request.status)
+            db.session.commit()
+            print(f"Regenerated PDF at: {new_pdf_path}")
+            return new_pdf_path
+
+        # Concurrent downloads of the same missing PDF share one render
+        pdf_path = single_flight.run((form_type, form_request.id, form_request.status), regenerate,
+                                     check=existing_pdf)
+        if not pdf_path:
+            flash('PDF file not found and could not be regenerated.', 'danger')
             return redirect(url_for('status'))
 
     try:
-        return send_file(pdf_path, as_attachment=True)
+        return storage.send(pdf_path)
     except Exception as e:
         print(f"Error sending file: {str(e)}")
         flash('Error accessing the PDF file.', 'danger')
         return redirect(url_for('status'))
 
+@app.route('/download_ferpa_pdf/<int:request_id>')
+def download_ferpa_pdf(request_id):
+    if not session.get('user_id'):
+        return redirect(url_for('login'))
+    return send_form_pdf('ferpa', FERPARequest.query.get_or_404(request_id))
+
 @app.route('/download_infochange_pdf/<int:request_id>')
 def download_infochange_pdf(request_id):
-    user_id = session.get('user_id')
-    if not user_id:
+    if not session.get('user_id'):
         return redirect(url_for('login'))
-
-    infochange_request = InfoChangeRequest.query.get_or_404(request_id)
-
-    # Check if user is owner of the request or an admin
-    user = Profile.query.get(user_id)
-    if infochange_request.user_id != user_id and user.privilages_ != 'admin':
-        flash('You do not have permission to access this file.', 'danger')
-        return redirect(url_for('status'))
-
-    # Get the absolute path to the forms directory
-    current_dir = os.path.abspath(os.getcwd())
-    forms_dir = os.path.join(current_dir, 'static', 'forms')
-    pdf_path = os.path.join(forms_dir, infochange_request.pdf_link)
-
-    # Debug output
-    print(f"Looking for Name/SSN PDF at: {pdf_path}")
-    print(f"File exists: {os.path.exists(pdf_path)}")
-
-    if not os.path.exists(pdf_path):
-        # Try to regenerate the PDF if it doesn't exist
-        try:
-            # Get signature path
-            sig_path = os.path.join(current_dir, 'static', 'uploads', 'signatures', infochange_request.sig_link)
-
-            # Extract data from the request object
-            choice = infochange_request.choice.split(',') if infochange_request.choice else []
-            nmchg_reason = infochange_request.nmchg_reason.split(',') if infochange_request.nmchg_reason else []
-            ssnchg_reason = infochange_request.ssnchg_reason.split(',') if infochange_request.ssnchg_reason else []
-
-            # Rebuild data dictionary
-            data = {
-                "NAME": infochange_request.name,
-                "PEOPLESOFT": infochange_request.peoplesoft_id,
-                "EDIT_NAME": return_choice(choice, 'name'),
-                "EDIT_SSN": return_choice(choice, 'ssn'),
-                "FN_OLD": infochange_request.fname_old or "",
-                "MN_OLD": infochange_request.mname_old or "",
-                "LN_OLD": infochange_request.lname_old or "",
-                "SUF_OLD": infochange_request.sfx_old or "",
-                "FN_NEW": infochange_request.fname_new or "",
-                "MN_NEW": infochange_request.mname_new or "",
-                "LN_NEW": infochange_request.lname_new or "",
-                "SUF_NEW": infochange_request.sfx_new or "",
-                "OPT_MARITAL": return_choice(nmchg_reason, 'marriage'),
-                "OPT_COURT": return_choice(nmchg_reason, 'court'),
-                "OPT_ERROR_NAME": return_choice(nmchg_reason, 'error'),
-                "SSN_OLD": infochange_request.ssn_old or "",
-                "SSN_NEW": infochange_request.ssn_new or "",
-                "OPT_ERROR_SSN": return_choice(ssnchg_reason, 'error'),
-                "OPT_ADD_SSN": return_choice(ssnchg_reason, 'addition'),
-                "SIGNATURE": sig_path,
-                "DATE": str(infochange_request.date)
-            }
-
-            # Regenerate PDF
-            os.makedirs(forms_dir, exist_ok=True)
-            new_pdf_file = generate_ssn_name(data, forms_dir, os.path.join('static', 'uploads', 'signatures'))
-
-            if new_pdf_file:
-                # Update the database with the new PDF path
-                infochange_request.pdf_link = new_pdf_file
-                db.session.commit()
-
-                # Update the pdf_path to the new file
-                pdf_path = os.path.join(forms_dir, new_pdf_file)
-                print(f"Regenerated PDF at: {pdf_path}")
-
-                if not os.path.exists(pdf_path):
-                    flash('PDF file could not be regenerated.', 'danger')
-                    return redirect(url_for('status'))
-            else:
-                flash('PDF file not found and could not be regenerated.', 'danger')
-                return redirect(url_for('status'))
-
-        except Exception as e:
-            import traceback
-            print(f"Error regenerating Name/SSN PDF: {str(e)}")
-            print(traceback.format_exc())
-            flash('PDF file not found and regeneration failed.', 'danger')
-            return redirect(url_for('status'))
-
-    try:
-        return send_file(pdf_path, as_attachment=True)
-    except Exception as e:
-        print(f"Error sending file: {str(e)}")
-        flash('Error accessing the PDF file.', 'danger')
-        return redirect(url_for('status'))
+    return send_form_pdf('infochange', InfoChangeRequest.query.get_or_404(request_id))
 
 
 # Add admin routes for approving/rejecting FERPA and Info Change requests
@@ -1519,15 +1650,7 @@ def mark_ferpa_viewed(request_id):
     if not req_record:
         return "Request not found", 404
 
-    # Add admin to the viewed list if not already there
-    if not req_record.admin_viewed:
-        admin_viewed = [str(user_id)]
-    else:
-        admin_viewed = json.loads(req_record.admin_viewed)
-        if str(user_id) not in admin_viewed:
-            admin_viewed.append(str(user_id))
-
-    req_record.admin_viewed = json.dumps(admin_viewed)
+    mark_admin_viewed(req_record, user_id)
     db.session.commit()
 
     return {"success": True}
@@ -1547,19 +1670,38 @@ def mark_infochange_viewed(request_id):
     if not req_record:
         return "Request not found", 404
 
-    # Add admin to the viewed list if not already there
-    if not req_record.admin_viewed:
-        admin_viewed = [str(user_id)]
-    else:
-        admin_viewed = json.loads(req_record.admin_viewed)
-        if str(user_id) not in admin_viewed:
-            admin_viewed.append(str(user_id))
-
-    req_record.admin_viewed = json.dumps(admin_viewed)
+    mark_admin_viewed(req_record, user_id)
     db.session.commit()
 
     return {"success": True}
 
+@app.route('/admin/preview/<form_type>/<int:request_id>')
+def preview_request(form_type, request_id):
+    """
+    HTML preview of a request for triage, rendered from its row instead of
+    the PDF. Opening it counts as viewing the request.
+    """
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('login'))
+
+    user = Profile.query.get(user_id)
+    if not user or user.privilages_ != 'admin':
+        return "Unauthorized", 403
+
+    model = RENDERABLE_FORMS.get(form_type)
+    if model is None:
+        return "Unknown form type", 404
+    req_record = db.session.get(model, request_id)
+    if not req_record:
+        return "Request not found", 404
+
+    if not req_record.has_admin_viewed(user_id):
+        mark_admin_viewed(req_record, user_id)
+        db.session.commit()
+
+    return preview_response(form_type, req_record)
+
 # -------------------------------
 # V3 Routes
 # -------------------------------
@@ -2118,11 +2260,9 @@ def submit_medical_withdrawal():
             files = request.files.getlist('documentation')
             for file in files:
                 if file and file.filename:
-                    filename = secure_filename(f"{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{file.filename}")
                     upload_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'documentation')
-                    os.makedirs(upload_dir, exist_ok=True)
-                    file_path = os.path.join(upload_dir, filename)
-                    file.save(file_path)
+                    file_path = sharded_path(upload_dir, documentation_name(file.filename))
+                    storage.save_upload(file, file_path)
                     documentation_files.append(file_path)
 
         # Process signature based on chosen method
@@ -2132,13 +2272,9 @@ def submit_medical_withdrawal():
         if signature_type == 'draw':
             signature_data = request.form.get('signature_data')
             if signature_data:
-                # Create signature directory
+                # Generate a unique filename in its shard directory
                 signature_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'signatures')
-                os.makedirs(signature_dir, exist_ok=True)
-
-                # Generate filename
-                signature_filename = f"sig_{user_id}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.png"
-                signature_path = os.path.join(signature_dir, signature_filename)
+                signature_path = sharded_path(signature_dir, upload_name(f"sig_{user_id}", 'signature.png'))
 
                 # Save signature image by parsing data URL
                 if signature_data.startswith('data:image'):
@@ -2146,18 +2282,17 @@ def submit_medical_withdrawal():
                     img_data = signature_data.split(',')[1]
                     with open(signature_path, "wb") as f:
                         f.write(base64.b64decode(img_data))
-                    signature = signature_path
+                    signature = storage.publish(signature_path)
+                    normalize_async(signature_path)
 
         elif signature_type == 'upload' and 'signature_upload' in request.files:
             sig_file = request.files['signature_upload']
             if sig_file and sig_file.filename:
                 signature_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'signatures')
-                os.makedirs(signature_dir, exist_ok=True)
-
-                sig_filename = secure_filename(f"sig_{user_id}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{sig_file.filename}")
-                sig_path = os.path.join(signature_dir, sig_filename)
-                sig_file.save(sig_path)
+                sig_path = sharded_path(signature_dir, upload_name(f"sig_{user_id}", sig_file.filename))
+                storage.save_upload(sig_file, sig_path)
                 signature = sig_path
+                normalize_async(sig_path)
 
         elif signature_type == 'text':
             # Just store the text as the signature
@@ -2197,21 +2332,25 @@ def submit_medical_withdrawal():
         db.session.add(new_request)
         db.session.commit()
 
-        # Generate PDF if the form is being submitted (not saved as draft)
-        if request.form.get('action') == 'submit':
-            # Import the PDF generation function
-            from pdf_utils import generate_medical_withdrawal_pdf
-
-            # Generate the PDF
-            pdf_path = generate_medical_withdrawal_pdf(new_request)
+        # Index the uploads so downloads do not have to probe for them
+        for file_path in documentation_files:
+            register_artifact(db.session, GeneratedArtifact, 'medical_withdrawal', new_request.id,
+                              KIND_DOCUMENTATION, file_path)
+        if signature and os.path.isfile(signature):
+            register_artifact(db.session, GeneratedArtifact, 'medical_withdrawal', new_request.id,
+                              KIND_SIGNATURE, signature)
+        db.session.commit()
 
-            # Store the PDF path in the database
-            if pdf_path:
-                new_request.generated_pdfs = json.dumps([pdf_path])
-                db.session.commit()
+        # Queue the PDF if the form is being submitted (not saved as draft)
+        if request.form.get('action') == 'submit':
+            render_queue.enqueue('medical_withdrawal', new_request)
+            db.session.commit()
 
             return redirect(url_for('status'))
         else:
+            # Pre-render the draft so submitting it unchanged is instant
+            render_queue.speculate('medical_withdrawal', new_request)
+            db.session.commit()
             return redirect(url_for('drafts'))
 
     except Exception as e:
@@ -2295,18 +2434,8 @@ def approve_medical_withdrawal(request_id):
         )
         db.session.add(history_entry)
         
-        # Generate PDF with LaTeX
-        from pdf_utils import generate_medical_withdrawal_pdf
-        pdf_path = generate_medical_withdrawal_pdf(req_record)
-
-        # Store the PDF path
-        if pdf_path:
-            if not req_record.generated_pdfs:
-                req_record.generated_pdfs = json.dumps([pdf_path])
-            else:
-                pdfs = json.loads(req_record.generated_pdfs)
-                pdfs.append(pdf_path)
-                req_record.generated_pdfs = json.dumps(pdfs)
+        # Queue the approved PDF; generated_pdfs is filled in when it finishes
+        render_queue.enqueue('medical_withdrawal', req_record)
                 
         flash('Medical withdrawal request has been fully approved.', 'success')
     else:
@@ -2348,27 +2477,11 @@ def reject_medical_withdrawal(request_id):
     )
     db.session.add(history_entry)
 
-    # Change status to rejected
+    # Change status to rejected and queue the rejection PDF
     req_record.status = 'rejected'
+    render_queue.enqueue('medical_withdrawal', req_record)
     db.session.commit()
 
-    # Generate PDF with LaTeX
-    from pdf_utils import generate_medical_withdrawal_pdf
-    pdf_path = generate_medical_withdrawal_pdf(req_record)
-
-    # Store the PDF path
-    if pdf_path:
-        # If this is the first generated PDF
-        if not req_record.generated_pdfs:
-            req_record.generated_pdfs = json.dumps([pdf_path])
-        else:
-            # Otherwise append to existing list
-            pdfs = json.loads(req_record.generated_pdfs)
-            pdfs.append(pdf_path)
-            req_record.generated_pdfs = json.dumps(pdfs)
-
-        db.session.commit()
-
     return redirect(url_for('notifications'))
 
 @app.route('/simple_approve_withdrawal/<int:request_id>', methods=['POST'])
@@ -2485,34 +2598,41 @@ def download_pdf(request_id, status):
         request_record.admin_viewed = json.dumps(admin_viewed)
         db.session.commit()
 
-    # Rest of existing code remains the same
-    # Find the most recent PDF with the given status
-    pdf_dir = os.path.join('static', 'pdfs')
-    search_pattern = f"medical_withdrawal_{request_id}_{status}_"
-
-    matching_files = []
-    if os.path.exists(pdf_dir):
-        for filename in os.listdir(pdf_dir):
-            if filename.startswith(search_pattern) and filename.endswith('.pdf'):
-                matching_files.append(os.path.join(pdf_dir, filename))
-
-    if matching_files:
-        # Sort by creation time, newest first
-        latest_pdf = max(matching_files, key=os.path.getctime)
-        return send_file(latest_pdf, as_attachment=True)
+    # Find the most recent PDF with the given status in the artifact index
+    artifact = latest_artifact(GeneratedArtifact, 'medical_withdrawal', request_id, status=status)
+    if artifact:
+        return storage.send(artifact.path, etag=artifact.sha256)
     elif request_record.generated_pdfs:
+        # Not indexed yet (see `flask index-artifacts`)
         # Check if we have stored paths in the database
         pdfs = json.loads(request_record.generated_pdfs)
         # Find PDFs containing the status in their path
         status_pdfs = [pdf for pdf in pdfs if status in pdf]
         if status_pdfs:
-            return send_file(status_pdfs[-1], as_attachment=True)
+            return storage.send(status_pdfs[-1])
+
+    def existing_pdf():
+        # Rendered by another worker while we waited
+        artifact = latest_artifact(GeneratedArtifact, 'medical_withdrawal', request_id, status=request_record.status)
+        path = resolve_path(artifact.path) if artifact else None
+        return path if path and storage.exists(path) else None
+
+    def regenerate():
+        # Generate one on the fly (in the renderer pool when it is running)
+        pdf_path = render_pdf_now('medical_withdrawal', request_record)
+        if not pdf_path or not os.path.exists(pdf_path):
+            return None
+        record_pdf('medical_withdrawal', request_record, pdf_path)
+        register_artifact(db.session, GeneratedArtifact, 'medical_withdrawal', request_id, KIND_PDF,
+                          pdf_path, status=request_record.status)
+        db.session.commit()
+        return pdf_path
 
-    # If no PDF found, generate one on the fly
-    from pdf_utils import generate_medical_withdrawal_pdf
-    pdf_path = generate_medical_withdrawal_pdf(request_record)
-    if pdf_path and os.path.exists(pdf_path):
-        return send_file(pdf_path, as_attachment=True)
+    # If no PDF found, render it once however many requests are asking for it
+    pdf_path = single_flight.run(('medical_withdrawal', request_id, request_record.status), regenerate,
+                                 check=existing_pdf)
+    if pdf_path:
+        return storage.send(pdf_path)
 
     return "PDF file not found", 404
 
@@ -2541,6 +2661,12 @@ def download_documentation(request_id, file_index):
     if file_index >= len(files):
         return "File not found", 404
 
+    # Indexed uploads resolve with a single lookup
+    artifact = artifact_at(GeneratedArtifact, 'medical_withdrawal', request_id, KIND_DOCUMENTATION, file_index)
+    if artifact:
+        return storage.send(artifact.path, etag=artifact.sha256)
+
+    # Not indexed yet (see `flask index-artifacts`)
     file_path = files[file_index]
 
     # Fix file path - ensure it has the correct path structure
@@ -2560,7 +2686,108 @@ def download_documentation(request_id, file_index):
     if not os.path.exists(file_path):
         return "File not found at path: " + file_path, 404
 
-    return send_file(file_path, as_attachment=True)
+    return storage.send(file_path)
+
+def packet_response(entries, download_name):
+    """Stream a ZIP of (archive name, path) entries as a download"""
+    from flask import Response
+    from packets import stream_zip
+
+    response = Response(stream_zip(entries), mimetype='application/zip')
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    response.cache_control.private = True
+    response.cache_control.no_store = True
+    return response
+
+@app.route('/download_packet/<int:request_id>')
+def download_packet(request_id):
+    """Download a medical withdrawal's PDFs, documentation and signature as one ZIP"""
+    from packets import packet_entries
+
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('login'))
+
+    user = Profile.query.get(user_id)
+    request_record = MedicalWithdrawalRequest.query.get(request_id)
+
+    if not request_record:
+        return "Request not found", 404
+
+    # Check if user is admin or owner of the request
+    if user.privilages_ != 'admin' and request_record.user_id != user_id:
+        return "Unauthorized", 403
+
+    entries = packet_entries(GeneratedArtifact, 'medical_withdrawal', request_record)
+    if not entries:
+        return "No files found for this request", 404
+
+    return packet_response(entries, f"medical_withdrawal_{request_id}.zip")
+
+@app.route('/download_packet_pdf/<int:request_id>')
+def download_packet_pdf(request_id):
+    """Download a medical withdrawal's form and documentation merged into one PDF"""
+    from packets import packet_pdf
+
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('login'))
+
+    user = Profile.query.get(user_id)
+    request_record = MedicalWithdrawalRequest.query.get(request_id)
+
+    if not request_record:
+        return "Request not found", 404
+
+    # Check if user is admin or owner of the request
+    if user.privilages_ != 'admin' and request_record.user_id != user_id:
+        return "Unauthorized", 403
+
+    pdf_path = packet_pdf(GeneratedArtifact, 'medical_withdrawal', request_record)
+    if not pdf_path:
+        return "No PDF has been generated for this request yet", 404
+
+    return storage.send(pdf_path, download_name=f"medical_withdrawal_{request_id}_packet.pdf")
+
+@app.route('/admin/export_packets')
+def export_packets():
+    """
+    Download the packets of many requests as one ZIP, one folder per request.
+
+    Query args: form (default medical_withdrawal), status, term_year
+    (medical withdrawals only), e.g. ?status=approved&term_year=Fall%202025
+    """
+    from packets import packet_entries
+
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('login'))
+
+    user = Profile.query.get(user_id)
+    if user.privilages_ != 'admin':
+        return "Unauthorized", 403
+
+    form_type = request.args.get('form', 'medical_withdrawal')
+    model = RENDERABLE_FORMS.get(form_type)
+    if model is None:
+        return "Unknown form type", 400
+
+    query = model.query
+    if request.args.get('status'):
+        query = query.filter_by(status=request.args['status'])
+    if request.args.get('term_year') and hasattr(model, 'term_year'):
+        query = query.filter_by(term_year=request.args['term_year'])
+
+    # Only paths are collected up front; file contents are read while streaming
+    entries = []
+    for record in query.order_by(model.id).yield_per(200):
+        entries.extend(packet_entries(GeneratedArtifact, form_type, record, prefix=f"{form_type}_{record.id}/"))
+    if not entries:
+        return "No files found for the selected requests", 404
+
+    parts = [form_type, request.args.get('term_year', ''), request.args.get('status', '')]
+    download_name = secure_filename('_'.join(part for part in parts if part)) + '.zip'
+    return packet_response(entries, download_name)
 
 @app.route('/submit_student_drop', methods=['POST'])
 def submit_student_drop():
@@ -2598,12 +2825,11 @@ def submit_student_drop():
         if not signature_upload:
             return "Signature file is required for the selected option", 400
         # Save the uploaded file
-        filename = secure_filename(f"sig_{user_id}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{signature_upload.filename}")
         signature_dir = os.path.join(app.config['UPLOAD_FOLDER'], 'signatures')
-        os.makedirs(signature_dir, exist_ok=True)
-        filepath = os.path.join(signature_dir, filename)
-        signature_upload.save(filepath)
+        filepath = sharded_path(signature_dir, upload_name(f"sig_{user_id}", signature_upload.filename))
+        storage.save_upload(signature_upload, filepath)
         signature = filepath
+        normalize_async(filepath)
     elif signature_type == 'text':
         signature_text = request.form.get('signature_text')
         if not signature_text:
@@ -2623,6 +2849,14 @@ def submit_student_drop():
     db.session.add(drop_request)
     db.session.commit()
 
+    if signature_type == 'upload':
+        register_artifact(db.session, GeneratedArtifact, 'student_drop', drop_request.id, KIND_SIGNATURE, signature)
+        db.session.commit()
+
+    # Queue the pending PDF; decisions are stamped onto it (see pdf_stamp.py)
+    render_queue.enqueue('student_drop', drop_request)
+    db.session.commit()
+
     return redirect(url_for('status'))  # Redirect to the status page
 
 # Now let's add a route for viewing form history for all users
@@ -2873,15 +3107,7 @@ def mark_student_drop_viewed(request_id):
     if not req_record:
         return "Request not found", 404
 
-    # Add admin to the viewed list if not already there
-    if not req_record.admin_viewed:
-        admin_viewed = [str(user_id)]
-    else:
-        admin_viewed = json.loads(req_record.admin_viewed)
-        if str(user_id) not in admin_viewed:
-            admin_viewed.append(str(user_id))
-
-    req_record.admin_viewed = json.dumps(admin_viewed)
+    mark_admin_viewed(req_record, user_id)
     db.session.commit()
 
     return {"success": True}
@@ -2924,20 +3150,8 @@ def approve_student_drop(request_id):
     if len(admin_approvals) >= 2:
         req_record.status = 'approved'
         
-        # Generate PDF with the updated function
-        from pdf_utils import generate_student_drop_pdf
-        pdf_path = generate_student_drop_pdf(req_record)
-
-        # Store the PDF path in the request record
-        if pdf_path:
-            # If this is the first generated PDF
-            if not req_record.generated_pdfs:
-                req_record.generated_pdfs = json.dumps([pdf_path])
-            else:
-                # Otherwise append to existing list
-                pdfs = json.loads(req_record.generated_pdfs)
-                pdfs.append(pdf_path)
-                req_record.generated_pdfs = json.dumps(pdfs)
+        # Queue the approved PDF; generated_pdfs is filled in when it finishes
+        render_queue.enqueue('student_drop', req_record)
                 
         flash('Student drop request has been fully approved.', 'success')
     else:
@@ -2998,27 +3212,11 @@ def reject_student_drop(request_id):
     if not req_record.has_admin_viewed(user_id):
         return "You must view the request PDF before rejecting", 400
 
-    # Change status to rejected
+    # Change status to rejected and queue the rejection PDF
     req_record.status = 'rejected'
+    render_queue.enqueue('student_drop', req_record)
     db.session.commit()
 
-    # Generate PDF with the updated function
-    from pdf_utils import generate_student_drop_pdf
-    pdf_path = generate_student_drop_pdf(req_record)
-
-    # Store the PDF path in the request record
-    if pdf_path:
-        # If this is the first generated PDF
-        if not req_record.generated_pdfs:
-            req_record.generated_pdfs = json.dumps([pdf_path])
-        else:
-            # Otherwise append to existing list
-            pdfs = json.loads(req_record.generated_pdfs)
-            pdfs.append(pdf_path)
-            req_record.generated_pdfs = json.dumps(pdfs)
-
-        db.session.commit()
-
     return redirect(url_for('notifications'))
 
 @app.route('/simple_reject_student_drop/<int:request_id>', methods=['POST'])
@@ -3087,33 +3285,41 @@ def download_student_drop_pdf(request_id, status):
         request_record.admin_viewed = json.dumps(admin_viewed)
         db.session.commit()
 
-    # Find the most recent PDF with the given status
-    pdf_dir = os.path.join('static', 'pdfs')
-    search_pattern = f"student_drop_{request_id}_{status}_"
-
-    matching_files = []
-    if os.path.exists(pdf_dir):
-        for filename in os.listdir(pdf_dir):
-            if filename.startswith(search_pattern) and filename.endswith('.pdf'):
-                matching_files.append(os.path.join(pdf_dir, filename))
-
-    if matching_files:
-        # Sort by creation time, newest first
-        latest_pdf = max(matching_files, key(os.path.getctime))
-        return send_file(latest_pdf, as_attachment=True)
+    # Find the most recent PDF with the given status in the artifact index
+    artifact = latest_artifact(GeneratedArtifact, 'student_drop', request_id, status=status)
+    if artifact:
+        return storage.send(artifact.path, etag=artifact.sha256)
     elif request_record.generated_pdfs:
+        # Not indexed yet (see `flask index-artifacts`)
         # Check if we have stored paths in the database
         pdfs = json.loads(request_record.generated_pdfs)
         # Find PDFs containing the status in their path
         status_pdfs = [pdf for pdf in pdfs if status in pdf]
         if status_pdfs:
-            return send_file(status_pdfs[-1], as_attachment=True)
+            return storage.send(status_pdfs[-1])
+
+    def existing_pdf():
+        # Rendered by another worker while we waited
+        artifact = latest_artifact(GeneratedArtifact, 'student_drop', request_id, status=request_record.status)
+        path = resolve_path(artifact.path) if artifact else None
+        return path if path and storage.exists(path) else None
+
+    def regenerate():
+        # Generate one on the fly (in the renderer pool when it is running)
+        pdf_path = render_pdf_now('student_drop', request_record)
+        if not pdf_path or not os.path.exists(pdf_path):
+            return None
+        record_pdf('student_drop', request_record, pdf_path)
+        register_artifact(db.session, GeneratedArtifact, 'student_drop', request_id, KIND_PDF,
+                          pdf_path, status=request_record.status)
+        db.session.commit()
+        return pdf_path
 
-    # If no PDF found, generate one on the fly
-    from pdf_utils import generate_student_drop_pdf
-    pdf_path = generate_student_drop_pdf(request_record)
-    if pdf_path and os.path.exists(pdf_path):
-        return send_file(pdf_path, as_attachment=True)
+    # If no PDF found, render it once however many requests are asking for it
+    pdf_path = single_flight.run(('student_drop', request_id, request_record.status), regenerate,
+                                 check=existing_pdf)
+    if pdf_path:
+        return storage.send(pdf_path)
 
     return "PDF file not found", 404
 
@@ -3138,6 +3344,26 @@ def drafts():
     draft_requests = MedicalWithdrawalRequest.query.filter_by(user_id=user_id, status='draft').all()
     return render_template('drafts.html', draft_requests=draft_requests)
 
+@app.route('/submit_draft/<int:request_id>', methods=['POST'])
+def submit_draft(request_id):
+    """Submit a saved medical withdrawal draft"""
+    user_id = session.get('user_id')
+    if not user_id:
+        return redirect(url_for('login'))
+
+    draft = MedicalWithdrawalRequest.query.get_or_404(request_id)
+    if draft.user_id != user_id or draft.status != 'draft':
+        flash('This draft cannot be submitted.', 'danger')
+        return redirect(url_for('drafts'))
+
+    draft.status = 'pending'
+    # Takes over the PDF pre-rendered when the draft was saved, if it still matches
+    render_queue.enqueue('medical_withdrawal', draft)
+    db.session.commit()
+
+    flash('Medical withdrawal request submitted.', 'success')
+    return redirect(url_for('status'))
+
 # Helper functions for multi-level approval workflows
 def get_workflow_for_form(form_type, org_unit_id=None, department_id=None):
     """
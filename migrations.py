@@ -4,6 +4,8 @@
 from main import db, app, MedicalWithdrawalRequest, StudentInitiatedDrop
 import sqlalchemy as sa
 import os
+import shutil
+import render_cache
 
 with app.app_context():
     # Create all tables if they don't exist
@@ -143,4 +145,33 @@ with app.app_context():
                 print("Added created_at column to departments table")
 
     db.session.commit()
-    print("Migrations completed successfully!")
\ No newline at end of file
+
+# Add failure_reason, kind and content_hash columns to render_jobs table if they don't exist
+with app.app_context():
+    with db.engine.connect() as conn:
+        inspector = sa.inspect(db.engine)
+        tables = inspector.get_table_names()
+
+        if 'render_jobs' in tables:
+            columns = inspector.get_columns('render_jobs')
+            if 'failure_reason' not in [col['name'] for col in columns]:
+                conn.execute(sa.text('ALTER TABLE render_jobs ADD COLUMN failure_reason VARCHAR(30)'))
+                conn.commit()
+                print("Added failure_reason column to render_jobs table")
+            if 'kind' not in [col['name'] for col in columns]:
+                conn.execute(sa.text("ALTER TABLE render_jobs ADD COLUMN kind VARCHAR(20) NOT NULL DEFAULT 'final'"))
+                conn.commit()
+                print("Added kind column to render_jobs table")
+            if 'content_hash' not in [col['name'] for col in columns]:
+                conn.execute(sa.text('ALTER TABLE render_jobs ADD COLUMN content_hash VARCHAR(64)'))
+                conn.commit()
+                print("Added content_hash column to render_jobs table")
+
+    db.session.commit()
+
+# The render cache moved from static/render_cache (served to anyone) to instance/render_cache
+if os.path.isdir(render_cache.LEGACY_CACHE_DIR) and render_cache.LEGACY_CACHE_DIR != os.path.abspath(render_cache.CACHE_DIR):
+    shutil.rmtree(render_cache.LEGACY_CACHE_DIR, ignore_errors=True)
+    print("Removed the old public render cache in static/render_cache")
+
+print("Migrations completed successfully!")
\ No newline at end of file
@@ -0,0 +1,318 @@
+import io
+import os
+import json
+import time
+import hashlib
+import logging
+import zipfile
+
+import storage
+import single_flight
+from artifacts import (KIND_PDF, KIND_DOCUMENTATION, KIND_SIGNATURE, BASE_DIR, PDF_DIR, FORMS_DIR, UPLOADS_DIR,
+                       find_file, resolve_path, latest_artifact)
+from file_serving import file_etag
+from pdf_canvas import PDFCanvas, LETTER
+from pdf_optimize import optimize_if_enabled
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Already compressed; deflating them again only costs CPU
+STORED_EXTENSIONS = {'.pdf', '.png', '.jpg', '.jpeg', '.gif', '.zip', '.docx', '.xlsx'}
+
+# Folder of each artifact kind inside a packet
+KIND_FOLDERS = {
+    KIND_PDF: 'pdfs',
+    KIND_DOCUMENTATION: 'documentation',
+    KIND_SIGNATURE: 'signature',
+}
+
+
+class _ZipSink:
+    """
+    Write-only target for ZipFile. Bytes written are held until the
+    generator in stream_zip() takes them, so at most one chunk plus a
+    header is in memory. ZipFile sees no seek/tell and writes data
+    descriptors instead of going back to patch the local headers.
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _row_files(form_type, record):
+    """(kind, path) of the files a request row lists, for requests not indexed yet"""
+    def json_list(value):
+        try:
+            return json.loads(value) if value else []
+        except ValueError:
+            return []
+
+    files = []
+    for pdf in json_list(getattr(record, 'generated_pdfs', None)):
+        files.append((KIND_PDF, find_file(pdf, PDF_DIR)))
+    if getattr(record, 'pdf_link', None):
+        files.append((KIND_PDF, find_file(record.pdf_link, FORMS_DIR)))
+    for doc in json_list(getattr(record, 'documentation_files', None)):
+        files.append((KIND_DOCUMENTATION, find_file(doc, os.path.join(UPLOADS_DIR, 'documentation'))))
+    signature = getattr(record, 'sig_link', None) or getattr(record, 'signature', None)
+    if signature and not signature.startswith('data:'):
+        files.append((KIND_SIGNATURE, find_file(signature, os.path.join(UPLOADS_DIR, 'signatures'))))
+    return [(kind, path) for kind, path in files if path]
+
+
+def _request_files(artifact_model, form_type, record):
+    """(kind, absolute path) of a request's files on disk, indexed ones first, without duplicates"""
+    files = []
+    artifacts = artifact_model.query.filter_by(form_type=form_type, form_id=record.id).order_by(
+        artifact_model.kind, artifact_model.created_at, artifact_model.id)
+    for artifact in artifacts:
+        files.append((artifact.kind, os.path.abspath(resolve_path(artifact.path))))
+    files.extend((kind, os.path.abspath(path)) for kind, path in _row_files(form_type, record))
+
+    unique, seen_paths = [], set()
+    for kind, path in files:
+        # Files stored by another node are fetched to local disk (see storage.py)
+        if path in seen_paths or not (os.path.isfile(path) or storage.fetch(path)):
+            continue
+        seen_paths.add(path)
+        unique.append((kind, path))
+    return unique
+
+
+def packet_entries(artifact_model, form_type, record, prefix=''):
+    """
+    Files that make up one request's packet.
+
+    Indexed artifacts come first; files the row lists that were never
+    indexed are added after them, so older requests export completely.
+
+    Args:
+        artifact_model: The GeneratedArtifact model
+        form_type: e.g. 'medical_withdrawal'
+        record: The request row
+        prefix: Folder to put the packet in (for multi-request exports)
+
+    Returns:
+        list: (name in the archive, absolute path) pairs
+    """
+    entries, seen_names = [], set()
+    for kind, path in _request_files(artifact_model, form_type, record):
+        name = f"{prefix}{KIND_FOLDERS.get(kind, kind)}/{os.path.basename(path)}"
+        stem, extension = os.path.splitext(name)
+        counter = 1
+        while name in seen_names:
+            counter += 1
+            name = f"{stem}_{counter}{extension}"
+        seen_names.add(name)
+        entries.append((name, path))
+    return entries
+
+
+def stream_zip(entries, chunk_size=CHUNK_SIZE):
+    """
+    Build a ZIP on the fly, yielding it in pieces as files are read.
+    Nothing is written to disk and memory use does not grow with the
+    size of the files.
+
+    Args:
+        entries: (name in the archive, path) pairs
+        chunk_size: Bytes read from each file at a time
+
+    Yields:
+        bytes: The next piece of the archive
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', allowZip64=True) as archive:
+        for name, path in entries:
+            try:
+                source = open(path, 'rb')
+            except OSError as e:
+                # Removed since the packet was listed; leave it out
+                logger.warning(f"Skipping {path} in packet: {str(e)}")
+                continue
+
+            with source:
+                info = zipfile.ZipInfo.from_file(path, name)
+                if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+                    info.compress_type = zipfile.ZIP_STORED
+                else:
+                    info.compress_type = zipfile.ZIP_DEFLATED
+
+                with archive.open(info, 'w', force_zip64=True) as target:
+                    for chunk in iter(lambda: source.read(chunk_size), b''):
+                        target.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+
+            # Data descriptor of the finished entry
+            data = sink.drain()
+            if data:
+                yield data
+
+    # Central directory
+    yield sink.drain()
+
+
+# -------------------------------
+# Merged packet PDF
+# -------------------------------
+
+# Merged packets are cached here, one file per request and input set
+PACKETS_DIR = os.environ.get('PACKETS_DIR', os.path.join(BASE_DIR, 'instance', 'packets'))
+# Bump when the layout of merged packets changes so cached ones are rebuilt
+PACKET_VERSION = 1
+# Longest side, in pixels, of an uploaded image placed on a packet page
+PAGE_IMAGE_MAX_PIXELS = 1700
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tif', '.tiff', '.webp'}
+
+
+def packet_pdf_inputs(artifact_model, form_type, record):
+    """
+    Files merged into a request's packet PDF: its current form PDF, then
+    each documentation upload in the order it was added.
+
+    Returns:
+        list: Absolute paths (empty if the request has no form PDF yet)
+    """
+    files = _request_files(artifact_model, form_type, record)
+
+    form_pdf = (latest_artifact(artifact_model, form_type, record.id, status=record.status)
+                or latest_artifact(artifact_model, form_type, record.id))
+    if form_pdf is not None:
+        form_pdf = os.path.abspath(resolve_path(form_pdf.path))
+    else:
+        pdfs = [path for kind, path in files if kind == KIND_PDF]
+        form_pdf = pdfs[-1] if pdfs else None
+    if form_pdf is None:
+        return []
+
+    return [form_pdf] + [path for kind, path in files if kind == KIND_DOCUMENTATION]
+
+
+def packet_pdf_key(inputs):
+    """Combined content hash of a packet's input files"""
+    digest = hashlib.sha256(f"{PACKET_VERSION}\n".encode('utf-8'))
+    for path in inputs:
+        digest.update(f"{os.path.basename(path)}\n{file_etag(path)}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def _note_page(message):
+    """A one-page PDF with a line of text, for uploads that can't be merged"""
+    canvas = PDFCanvas()
+    canvas.text(72, 96, message, size=12)
+    return io.BytesIO(canvas.to_bytes())
+
+
+def _image_pages(path):
+    """Letter-size PDF with an uploaded image on each page (one per frame)"""
+    from PIL import Image, ImageSequence
+
+    canvas = PDFCanvas()
+    width, height = LETTER
+    with Image.open(path) as img:
+        for number, frame in enumerate(ImageSequence.Iterator(img)):
+            if number:
+                canvas.new_page()
+            frame = frame.copy()
+            frame.thumbnail((PAGE_IMAGE_MAX_PIXELS, PAGE_IMAGE_MAX_PIXELS))
+            buffer = io.BytesIO()
+            frame.save(buffer, 'PNG')
+            buffer.seek(0)
+
+            canvas.text(36, 40, os.path.basename(path), size=9, gray=0.4)
+            canvas.image(buffer, 36, 54, width - 72, max_height=height - 90)
+    return io.BytesIO(canvas.to_bytes())
+
+
+def build_packet_pdf(inputs, pdf_path):
+    """
+    Merge the form PDF and documentation into one PDF. Image uploads become
+    pages; files that can't be read get a page saying so.
+
+    Args:
+        inputs: Paths from packet_pdf_inputs()
+        pdf_path: Where the packet is written (atomically)
+
+    Returns:
+        str: pdf_path
+    """
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter()
+    for path in inputs:
+        name = os.path.basename(path)
+        extension = os.path.splitext(path)[1].lower()
+        try:
+            if extension == '.pdf':
+                writer.append(PdfReader(path))
+            elif extension in IMAGE_EXTENSIONS:
+                writer.append(PdfReader(_image_pages(path)))
+            else:
+                writer.append(PdfReader(_note_page(f"{name} is not a PDF or image; download the packet ZIP to see it.")))
+        except Exception as e:
+            logger.warning(f"Could not merge {path} into packet: {str(e)}")
+            writer.append(PdfReader(_note_page(f"{name} could not be included in this packet.")))
+
+    os.makedirs(os.path.dirname(pdf_path), exist_ok=True)
+    partial_path = f"{pdf_path}.{os.getpid()}.part"
+    with open(partial_path, 'wb') as f:
+        writer.write(f)
+    os.replace(partial_path, pdf_path)
+    return optimize_if_enabled(pdf_path)
+
+
+def packet_pdf(artifact_model, form_type, record):
+    """
+    Cached merged packet PDF of a request, rebuilt only when one of its
+    input files changes. New packets are published to the storage backend,
+    so a packet built by the render queue can be sent from any node; older
+    packets of the request are removed.
+
+    Returns:
+        str: Path of the packet PDF, or None if the request has no form PDF
+    """
+    inputs = packet_pdf_inputs(artifact_model, form_type, record)
+    if not inputs:
+        return None
+
+    prefix = f"{form_type}_{record.id}_packet_"
+    pdf_path = os.path.join(PACKETS_DIR, f"{prefix}{packet_pdf_key(inputs)[:32]}.pdf")
+
+    def cached():
+        return pdf_path if storage.exists(pdf_path) else None
+
+    def build():
+        start = time.perf_counter()
+        build_packet_pdf(inputs, pdf_path)
+        storage.publish(pdf_path)
+        logger.info(f"Built packet of {form_type} #{record.id} from {len(inputs)} file(s) "
+                    f"in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        for name in os.listdir(PACKETS_DIR):
+            if name.startswith(prefix) and name.endswith('.pdf') and name != os.path.basename(pdf_path):
+                try:
+                    storage.delete(os.path.join(PACKETS_DIR, name))
+                except OSError:
+                    pass
+        return pdf_path
+
+    if cached():
+        return pdf_path
+    return single_flight.run(('packet', form_type, record.id, pdf_path), build, check=cached)
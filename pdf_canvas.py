@@ -0,0 +1,284 @@
+import io
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# US Letter in points (1/72 inch)
+LETTER = (612, 792)
+
+# Standard 14 fonts used by the canvas. They are built into every PDF
+# viewer, so nothing has to be embedded.
+FONTS = {
+    'regular': ('F1', 'Helvetica'),
+    'bold': ('F2', 'Helvetica-Bold'),
+    'italic': ('F3', 'Helvetica-Oblique'),
+}
+
+# Advance widths (1/1000 em) of printable ASCII, from the Adobe AFM files
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+WIDTHS = {
+    'regular': _HELVETICA_WIDTHS,
+    'bold': _HELVETICA_BOLD_WIDTHS,
+    'italic': _HELVETICA_WIDTHS,
+}
+
+
+def _escape_text(text):
+    """Encode text for a PDF literal string in WinAnsiEncoding"""
+    data = str(text).encode('cp1252', errors='replace')
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _number(value):
+    """Format a coordinate compactly and deterministically"""
+    return f"{value:.2f}".rstrip('0').rstrip('.')
+
+
+class PDFCanvas:
+    """
+    Minimal PDF writer for simple forms: text in the standard Helvetica
+    fonts, lines, boxes and raster images (e.g. signatures).
+
+    Coordinates are in points with the origin at the top-left corner of the
+    page; text is positioned by its baseline. The output contains no
+    timestamps or random IDs, so the same drawing always gives the same bytes.
+    """
+
+    def __init__(self, pagesize=LETTER):
+        self.width, self.height = pagesize
+        self.pages = []
+        self.current = 0  # index of the page being drawn on
+        self.images = []  # (name, width, height, colorspace, data)
+        self._image_names = {}
+        self.new_page()
+
+    # -------------------------------
+    # Pages and text
+    # -------------------------------
+
+    def new_page(self):
+        self.pages.append([])
+        self.current = len(self.pages) - 1
+        return len(self.pages)
+
+    def set_page(self, number):
+        """Continue drawing on an earlier page (1-based), e.g. to add footers"""
+        self.current = number - 1
+
+    @property
+    def page_count(self):
+        return len(self.pages)
+
+    def _emit(self, operators):
+        self.pages[self.current].append(operators)
+
+    def text_width(self, text, style='regular', size=11):
+        widths = WIDTHS[style]
+        total = 0
+        for char in str(text):
+            code = ord(char)
+            total += widths[code - 32] if 32 <= code <= 126 else 556
+        return total * size / 1000.0
+
+    def text(self, x, y, text, style='regular', size=11, align='left', gray=0):
+        """Draw one line of text with its baseline at y"""
+        if text is None or text == '':
+            return
+        if align == 'center':
+            x -= self.text_width(text, style, size) / 2
+        elif align == 'right':
+            x -= self.text_width(text, style, size)
+
+        font = FONTS[style][0]
+        content = (f"BT /{font} {_number(size)} Tf {_number(gray)} g "
+                   f"{_number(x)} {_number(self.height - y)} Td (").encode('ascii')
+        self._emit(content + _escape_text(text) + b") Tj ET")
+
+    def wrap(self, text, width, style='regular', size=11):
+        """Split text into lines no wider than width, breaking at spaces"""
+        lines = []
+        for paragraph in str(text or '').split('\n'):
+            current = ''
+            for word in paragraph.split(' '):
+                candidate = f"{current} {word}" if current else word
+                if self.text_width(candidate, style, size) <= width:
+                    current = candidate
+                    continue
+                if current:
+                    lines.append(current)
+                # Break words longer than a whole line
+                while self.text_width(word, style, size) > width and len(word) > 1:
+                    cut = len(word)
+                    while cut > 1 and self.text_width(word[:cut], style, size) > width:
+                        cut -= 1
+                    lines.append(word[:cut])
+                    word = word[cut:]
+                current = word
+            lines.append(current)
+        return lines
+
+    def paragraph(self, x, y, width, text, style='regular', size=11, leading=None):
+        """
+        Draw wrapped text starting with its first baseline at y.
+
+        Returns:
+            float: Baseline of the line after the paragraph
+        """
+        leading = leading or size * 1.3
+        for line in self.wrap(text, width, style, size):
+            self.text(x, y, line, style, size)
+            y += leading
+        return y
+
+    # -------------------------------
+    # Graphics
+    # -------------------------------
+
+    def line(self, x1, y1, x2, y2, width=0.5, gray=0):
+        self._emit((f"{_number(width)} w {_number(gray)} G "
+                    f"{_number(x1)} {_number(self.height - y1)} m "
+                    f"{_number(x2)} {_number(self.height - y2)} l S").encode('ascii'))
+
+    def rect(self, x, y, w, h, width=0.5, stroke=True, fill_gray=None):
+        """Rectangle with its top-left corner at (x, y)"""
+        operator = 'B' if stroke and fill_gray is not None else ('f' if fill_gray is not None else 'S')
+        fill = f"{_number(fill_gray)} g " if fill_gray is not None else ''
+        self._emit((f"{_number(width)} w 0 G {fill}"
+                    f"{_number(x)} {_number(self.height - y - h)} {_number(w)} {_number(h)} re {operator}").encode('ascii'))
+
+    def checkbox(self, x, y, checked, size=9):
+        """Square box whose bottom edge sits on the text baseline y, crossed when checked"""
+        top = y - size
+        self.rect(x, top, size, size, width=0.6)
+        if checked:
+            self.line(x, top, x + size, y, width=0.8)
+            self.line(x, y, x + size, top, width=0.8)
+
+    def image(self, source, x, y, width, max_height=None):
+        """
+        Draw a raster image with its top-left corner at (x, y).
+
+        Args:
+            source: Path or file-like object readable by Pillow
+            width: Drawn width in points; the height keeps the aspect ratio
+            max_height: Shrink the image to fit this height if needed
+
+        Returns:
+            float: Drawn height in points
+        """
+        name, pixel_width, pixel_height = self._add_image(source)
+        height = width * pixel_height / pixel_width
+        if max_height and height > max_height:
+            width = width * max_height / height
+            height = max_height
+
+        self._emit((f"q {_number(width)} 0 0 {_number(height)} "
+                    f"{_number(x)} {_number(self.height - y - height)} cm /{name} Do Q").encode('ascii'))
+        return height
+
+    def _add_image(self, source):
+        from PIL import Image
+
+        key = source if isinstance(source, str) else id(source)
+        if key in self._image_names:
+            return self._image_names[key]
+
+        with Image.open(source) as img:
+            img.load()
+            # Flatten transparency (drawn signatures are transparent PNGs) onto white
+            if img.mode in ('RGBA', 'LA', 'P'):
+                img = img.convert('RGBA')
+                background = Image.new('RGBA', img.size, (255, 255, 255, 255))
+                img = Image.alpha_composite(background, img)
+            if img.mode in ('L', '1'):
+                img, colorspace = img.convert('L'), '/DeviceGray'
+            else:
+                img, colorspace = img.convert('RGB'), '/DeviceRGB'
+
+            name = f"Im{len(self.images) + 1}"
+            self.images.append((name, img.width, img.height, colorspace, zlib.compress(img.tobytes(), 9)))
+
+        self._image_names[key] = (name, img.width, img.height)
+        return self._image_names[key]
+
+    # -------------------------------
+    # Output
+    # -------------------------------
+
+    def to_bytes(self):
+        objects = []  # index + 1 is the object number
+
+        def add(body):
+            objects.append(body)
+            return len(objects)
+
+        catalog_id = add(None)
+        pages_id = add(None)
+
+        font_refs = []
+        for style, (font, base_font) in FONTS.items():
+            font_id = add(f"<< /Type /Font /Subtype /Type1 /BaseFont /{base_font} "
+                          f"/Encoding /WinAnsiEncoding >>".encode('ascii'))
+            font_refs.append(f"/{font} {font_id} 0 R")
+
+        image_refs = []
+        for name, width, height, colorspace, data in self.images:
+            header = (f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+                      f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /FlateDecode "
+                      f"/Length {len(data)} >>\nstream\n").encode('ascii')
+            image_id = add(header + data + b"\nendstream")
+            image_refs.append(f"/{name} {image_id} 0 R")
+
+        resources = f"<< /Font << {' '.join(font_refs)} >>"
+        if image_refs:
+            resources += f" /XObject << {' '.join(image_refs)} >>"
+        resources += " >>"
+
+        page_ids = []
+        for operators in self.pages:
+            stream = zlib.compress(b"\n".join(operators), 9)
+            content_id = add(f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode('ascii')
+                             + stream + b"\nendstream")
+            page_ids.append(add((f"<< /Type /Page /Parent {pages_id} 0 R "
+                                 f"/MediaBox [0 0 {_number(self.width)} {_number(self.height)}] "
+                                 f"/Resources {resources} /Contents {content_id} 0 R >>").encode('ascii')))
+
+        objects[catalog_id - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode('ascii')
+        kids = ' '.join(f"{page_id} 0 R" for page_id in page_ids)
+        objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode('ascii')
+
+        output = io.BytesIO()
+        output.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(output.tell())
+            output.write(f"{number} 0 obj\n".encode('ascii') + body + b"\nendobj\n")
+
+        xref_offset = output.tell()
+        output.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('ascii'))
+        for offset in offsets:
+            output.write(f"{offset:010d} 00000 n \n".encode('ascii'))
+        output.write((f"trailer\n<< /Size {len(objects) + 1} /Root {catalog_id} 0 R >>\n"
+                      f"startxref\n{xref_offset}\n%%EOF\n").encode('ascii'))
+        return output.getvalue()
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+        return path
@@ -0,0 +1,244 @@
+"""
+Optional post-processing of rendered PDFs.
+
+With PDF_OPTIMIZE=1 every PDF the render pipeline writes is rewritten in
+place before it is handed out:
+
+- image XObjects larger than PDF_IMAGE_MAX_PIXELS are downsampled and
+  opaque ones recompressed as JPEG (signatures, scanned IDs)
+- content streams are Flate-compressed and identical objects (fonts
+  embedded once per page or per merged document) are stored once
+- the file is linearized with qpdf, when it is installed, so viewers can
+  show the first page before the whole file has arrived
+
+The rewrite only replaces the file when it came out smaller. Existing PDFs
+are shrunk with `flask optimize-pdfs`, which records the checksum of every
+file before and after in instance/optimized_pdfs.jsonl.
+"""
+import io
+import os
+import json
+import shutil
+import logging
+import tempfile
+import subprocess
+from datetime import datetime
+
+import storage
+from artifacts import PDF_DIR, FORMS_DIR, BASE_DIR, file_sha256, stored_path
+from storage_layout import list_files
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get('PDF_OPTIMIZE', '0') == '1'
+# Longest side, in pixels, of an embedded image after downsampling
+IMAGE_MAX_PIXELS = int(os.environ.get('PDF_IMAGE_MAX_PIXELS', 1600))
+JPEG_QUALITY = int(os.environ.get('PDF_JPEG_QUALITY', 80))
+QPDF_TIMEOUT = 60
+
+MANIFEST_PATH = os.path.join(BASE_DIR, 'instance', 'optimized_pdfs.jsonl')
+
+
+def find_qpdf():
+    """Path of the qpdf binary (QPDF_PATH or PATH), or None"""
+    return os.environ.get('QPDF_PATH') or shutil.which('qpdf')
+
+
+def _recompress_images(page):
+    """Downsample and recompress a page's images. Returns how many were replaced."""
+    from PIL import Image
+
+    replaced = 0
+    for image in page.images:
+        try:
+            xobject = image.indirect_reference.get_object() if image.indirect_reference else None
+            if xobject is None or '/SMask' in xobject or xobject.get('/ImageMask'):
+                continue  # transparency would be lost in a JPEG
+            pil_image = image.image
+            if pil_image.mode not in ('RGB', 'L'):
+                continue
+
+            original_size = len(xobject.get_data())
+            if max(pil_image.size) > IMAGE_MAX_PIXELS:
+                pil_image = pil_image.copy()
+                pil_image.thumbnail((IMAGE_MAX_PIXELS, IMAGE_MAX_PIXELS), Image.LANCZOS)
+
+            encoded = io.BytesIO()
+            pil_image.save(encoded, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+            if encoded.tell() < original_size:
+                image.replace(pil_image, quality=JPEG_QUALITY)
+                replaced += 1
+        except Exception as e:
+            logger.warning(f"Left image {image.name} as it was: {str(e)}")
+    return replaced
+
+
+def _rewrite(source, destination):
+    """Recompress images and streams and merge identical objects with pypdf"""
+    from pypdf import PdfReader, PdfWriter
+
+    writer = PdfWriter(clone_from=PdfReader(source))
+    for page in writer.pages:
+        _recompress_images(page)
+        page.compress_content_streams()
+    writer.compress_identical_objects(remove_identicals=True, remove_orphans=True)
+    with open(destination, 'wb') as f:
+        writer.write(f)
+
+
+def _linearize(qpdf, source, destination):
+    """Linearize with qpdf. Returns True if destination was written."""
+    try:
+        result = subprocess.run(
+            [qpdf, '--linearize', '--object-streams=generate', '--compress-streams=y',
+             '--recompress-flate', source, destination],
+            capture_output=True, timeout=QPDF_TIMEOUT
+        )
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"qpdf could not linearize {source}: {str(e)}")
+        return False
+    # Exit status 3 means success with warnings
+    if result.returncode not in (0, 3):
+        logger.warning(f"qpdf could not linearize {source}: {result.stderr.decode(errors='replace').strip()}")
+        return False
+    return True
+
+
+def optimize_pdf(pdf_path):
+    """
+    Shrink and linearize a PDF in place.
+
+    Args:
+        pdf_path: The PDF to rewrite
+
+    Returns:
+        dict: {'path', 'before', 'after', 'linearized'} with sizes in bytes
+              ('after' equals 'before' when the file was left alone), or
+              None if the PDF could not be processed
+    """
+    before = os.path.getsize(pdf_path)
+    directory = os.path.dirname(os.path.abspath(pdf_path))
+    with tempfile.TemporaryDirectory(prefix='.optimize-', dir=directory) as scratch:
+        rewritten = os.path.join(scratch, 'rewritten.pdf')
+        try:
+            _rewrite(pdf_path, rewritten)
+        except Exception as e:
+            logger.error(f"Could not optimize {pdf_path}: {str(e)}")
+            return None
+
+        result = rewritten
+        linearized = False
+        qpdf = find_qpdf()
+        if qpdf:
+            linear = os.path.join(scratch, 'linear.pdf')
+            linearized = _linearize(qpdf, rewritten, linear)
+            if linearized:
+                result = linear
+
+        after = os.path.getsize(result)
+        if after < before or (linearized and after <= before * 1.02):
+            # Linearization adds hint tables; accept a slightly larger file for it
+            os.replace(result, pdf_path)
+        else:
+            after = before
+            linearized = False
+
+    report = {'path': pdf_path, 'before': before, 'after': after, 'linearized': linearized}
+    logger.info(f"Optimized {os.path.basename(pdf_path)}: {format_delta(report)}")
+    return report
+
+
+def optimize_if_enabled(pdf_path):
+    """Render pipeline hook: optimize a freshly rendered PDF when PDF_OPTIMIZE=1"""
+    if ENABLED and pdf_path and os.path.exists(pdf_path):
+        optimize_pdf(pdf_path)
+    return pdf_path
+
+
+def format_delta(report):
+    """e.g. '812.4 KB -> 301.0 KB (-62.9%, linearized)'"""
+    before, after = report['before'], report['after']
+    change = (after - before) * 100.0 / before if before else 0.0
+    suffix = ', linearized' if report['linearized'] else ''
+    return f"{before / 1024:.1f} KB -> {after / 1024:.1f} KB ({change:+.1f}%{suffix})"
+
+
+# -------------------------------
+# Backfill
+# -------------------------------
+
+def _optimized_checksums():
+    """Checksums of files the backfill already wrote, from the manifest"""
+    checksums = set()
+    if os.path.exists(MANIFEST_PATH):
+        with open(MANIFEST_PATH) as f:
+            for line in f:
+                try:
+                    checksums.add(json.loads(line)['after_sha256'])
+                except (ValueError, KeyError):
+                    continue
+    return checksums
+
+
+def optimize_existing(db, artifact_model=None, directories=(PDF_DIR, FORMS_DIR), dry_run=False):
+    """
+    Shrink the PDFs already on disk in place. Each rewritten file gets a
+    line in the manifest with its checksum and size before and after, and
+    its artifact index rows are updated. Files the manifest shows as
+    optimized are skipped, so the backfill can be re-run.
+
+    Args:
+        db: The SQLAlchemy instance (inside an app context)
+        artifact_model: The GeneratedArtifact model, to update size and sha256
+        directories: Directories to scan for PDFs
+        dry_run: Only report the files that would be processed
+
+    Returns:
+        list: One report per processed file (see optimize_pdf)
+    """
+    done = _optimized_checksums()
+    reports = []
+    os.makedirs(os.path.dirname(MANIFEST_PATH), exist_ok=True)
+
+    for directory in directories:
+        if not os.path.isdir(directory):
+            continue
+        for relative in list_files(directory):
+            path = os.path.join(directory, relative)
+            if not relative.lower().endswith('.pdf') or not os.path.isfile(path):
+                continue
+            before_sha256 = file_sha256(path)
+            if before_sha256 in done:
+                continue
+            if dry_run:
+                size = os.path.getsize(path)
+                reports.append({'path': path, 'before': size, 'after': size, 'linearized': False})
+                continue
+
+            report = optimize_pdf(path)
+            if report is None:
+                continue
+            after_sha256 = file_sha256(path)
+            done.add(after_sha256)
+            reports.append(report)
+
+            with open(MANIFEST_PATH, 'a') as f:
+                f.write(json.dumps({
+                    'path': stored_path(path),
+                    'before_sha256': before_sha256,
+                    'after_sha256': after_sha256,
+                    'before': report['before'],
+                    'after': report['after'],
+                    'linearized': report['linearized'],
+                    'optimized_at': datetime.utcnow().isoformat(),
+                }) + '\n')
+
+            if after_sha256 != before_sha256:
+                # Replace the stored copy as well (see storage.py)
+                storage.publish(path)
+            if artifact_model is not None and after_sha256 != before_sha256:
+                artifact_model.query.filter_by(path=stored_path(path)).update(
+                    {'size': report['after'], 'sha256': after_sha256}, synchronize_session=False)
+                db.session.commit()
+
+    return reports
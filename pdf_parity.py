@@ -0,0 +1,128 @@
+import os
+import sys
+import shutil
+import logging
+import tempfile
+import subprocess
+
+logger = logging.getLogger(__name__)
+
+# Resolution the pages are compared at, and how different a page may be
+PARITY_DPI = 50
+MAX_DIFFERENT_PIXELS = 0.05
+
+# Sample values for each form type with a direct renderer
+SAMPLE_FIELDS = {
+    'student_drop': {
+        "FORMID": "1042",
+        "STATUS": "APPROVED",
+        "FULLNAME": "Jordan Example",
+        "MYUHID": "1234567",
+        "COURSE_TITLE": "COSC 4351 - Fundamentals of Software Engineering",
+        "REASON": "Schedule conflict with a required lab section & work hours (50% shift change).",
+        "DROP_DATE": "March 03, 2025",
+        "CREATED_DATE": "March 01, 2025",
+        "SIGNATURE": {'text': "Jordan Example"},
+        "ADMIN_STATUS": "approved",
+        "ADMIN_SIGNATURE_IMAGE": None,
+        "DECISION_DATE": "March 04, 2025",
+    },
+    'infochange': {
+        "NAME": "Jordan Example",
+        "PEOPLESOFT": "1234567",
+        "EDIT_NAME": "yes",
+        "EDIT_SSN": "no",
+        "FN_OLD": "Jordan", "MN_OLD": "A", "LN_OLD": "Sample", "SUF_OLD": "",
+        "FN_NEW": "Jordan", "MN_NEW": "A", "LN_NEW": "Example", "SUF_NEW": "",
+        "OPT_MARITAL": "yes", "OPT_COURT": "no", "OPT_ERROR_NAME": "no",
+        "SSN_OLD": "", "SSN_NEW": "",
+        "OPT_ERROR_SSN": "no", "OPT_ADD_SSN": "no",
+        "SIGNATURE": "",
+        "DATE": "2025-03-01",
+    },
+}
+
+
+def rasterize(pdf_path, output_dir, dpi=PARITY_DPI):
+    """
+    Render every page of a PDF to grayscale PNGs with pdftoppm.
+
+    Returns:
+        list: Page image paths in page order
+    """
+    prefix = os.path.join(output_dir, os.path.splitext(os.path.basename(pdf_path))[0])
+    subprocess.run(["pdftoppm", "-gray", "-png", "-r", str(dpi), pdf_path, prefix],
+                   check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return sorted(os.path.join(output_dir, name) for name in os.listdir(output_dir)
+                  if name.startswith(os.path.basename(prefix)) and name.endswith('.png'))
+
+
+def page_difference(first_path, second_path):
+    """Fraction of pixels that differ noticeably between two page images"""
+    from PIL import Image, ImageChops
+
+    with Image.open(first_path) as first, Image.open(second_path) as second:
+        if first.size != second.size:
+            second = second.resize(first.size)
+        diff = ImageChops.difference(first.convert('L'), second.convert('L'))
+        # Ignore antialiasing noise
+        histogram = diff.point(lambda value: 255 if value > 64 else 0).histogram()
+        return histogram[255] / float(first.size[0] * first.size[1])
+
+
+def check_parity(form_type, fields=None, threshold=MAX_DIFFERENT_PIXELS):
+    """
+    Render a form with the LaTeX and direct backends and compare the pages.
+
+    Args:
+        form_type: Form type with a direct renderer
+        fields: Field values (defaults to SAMPLE_FIELDS)
+        threshold: Largest acceptable fraction of differing pixels per page
+
+    Returns:
+        tuple: (ok, message)
+    """
+    from form_renderers import render_fields
+
+    if not shutil.which("pdftoppm"):
+        return False, "pdftoppm (poppler-utils) is required for the parity check"
+
+    fields = fields or SAMPLE_FIELDS[form_type]
+    work_dir = tempfile.mkdtemp(prefix='pdf_parity_')
+    try:
+        pages = {}
+        for backend in ('latex', 'direct'):
+            pdf_path = os.path.join(work_dir, f"{form_type}_{backend}.pdf")
+            if not render_fields(form_type, fields, pdf_path, backend=backend) or not os.path.exists(pdf_path):
+                return False, f"{backend} backend did not produce a PDF"
+            page_dir = os.path.join(work_dir, backend)
+            os.makedirs(page_dir)
+            pages[backend] = rasterize(pdf_path, page_dir)
+
+        if len(pages['latex']) != len(pages['direct']):
+            return False, f"page count differs: latex {len(pages['latex'])}, direct {len(pages['direct'])}"
+
+        worst = 0.0
+        for number, (latex_page, direct_page) in enumerate(zip(pages['latex'], pages['direct']), start=1):
+            difference = page_difference(latex_page, direct_page)
+            worst = max(worst, difference)
+            if difference > threshold:
+                keep = os.path.join(tempfile.gettempdir(), f"pdf_parity_{form_type}_page{number}")
+                os.makedirs(keep, exist_ok=True)
+                shutil.copy(latex_page, keep)
+                shutil.copy(direct_page, keep)
+                return False, f"page {number} differs in {difference:.1%} of pixels (pages kept in {keep})"
+
+        return True, f"{len(pages['direct'])} page(s), largest difference {worst:.1%}"
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    form_types = sys.argv[1:] or sorted(SAMPLE_FIELDS)
+    failed = False
+    for form_type in form_types:
+        ok, message = check_parity(form_type)
+        failed = failed or not ok
+        print(f"{form_type:<14} {'OK' if ok else 'FAIL'}  {message}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,369 @@
+import io
+import os
+import re
+import json
+import logging
+from datetime import datetime
+
+import storage
+from pdf_canvas import PDFCanvas, WIDTHS
+from storage_layout import PDF_DIR, sharded_path, pdf_name
+
+logger = logging.getLogger(__name__)
+
+# Statuses that only change the status banner and the approval block, so
+# their PDF can be stamped onto the pending one instead of recompiled
+STAMPABLE_STATUSES = ('pending_approval', 'approved', 'rejected')
+
+# Set PDF_STAMPING=0 to always recompile the whole PDF
+ENABLED = os.environ.get('PDF_STAMPING', '1') != '0'
+
+# Status the unstamped base PDF was rendered for
+BASE_STATUS = 'pending'
+
+# <form>_<id>_<status>_<YYYYmmddHHMMSS>_<token>.pdf, as written by form_renderers
+# (PDFs from before storage_layout have no token)
+PDF_NAME = re.compile(r'^(?P<form>medical_withdrawal|student_drop)_(?P<id>\d+)_'
+                      r'(?P<status>[a-z_]+)_(?P<timestamp>\d{14})(?:_(?P<token>[0-9a-f]+))?\.pdf$')
+
+BANNER_TEXT = {
+    'pending_approval': 'PENDING SECOND APPROVAL',
+    'approved': 'APPROVED',
+    'rejected': 'REJECTED',
+}
+
+FORM_TITLES = {
+    'medical_withdrawal': 'Medical/Administrative Term Withdrawal',
+    'student_drop': 'Student-Initiated Drop',
+}
+
+
+def stamping_available():
+    """True when pypdf is installed; without it every status gets a full render"""
+    try:
+        import pypdf  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def find_base_pdf(snapshot, form_type):
+    """
+    Most recent pending PDF of a request that is still stored, fetched to
+    local disk if it was rendered on another node.
+
+    Args:
+        snapshot: The request row (or a snapshot of it) with generated_pdfs
+        form_type: 'medical_withdrawal' or 'student_drop'
+
+    Returns:
+        str: Path of the pending PDF, or None
+    """
+    try:
+        pdfs = json.loads(getattr(snapshot, 'generated_pdfs', None) or '[]')
+    except ValueError:
+        return None
+
+    for pdf_path in reversed(pdfs):
+        match = PDF_NAME.match(os.path.basename(pdf_path))
+        if (match and match.group('form') == form_type and match.group('id') == str(snapshot.id)
+                and match.group('status') == BASE_STATUS):
+            local_path = pdf_path if os.path.exists(pdf_path) else storage.fetch(pdf_path)
+            if local_path:
+                return local_path
+    return None
+
+
+def _multiply(m, n):
+    """Product of two PDF matrices [a b c d e f]"""
+    return [m[0] * n[0] + m[1] * n[2], m[0] * n[1] + m[1] * n[3],
+            m[2] * n[0] + m[3] * n[2], m[2] * n[1] + m[3] * n[3],
+            m[4] * n[0] + m[5] * n[2] + n[4], m[4] * n[1] + m[5] * n[3] + n[5]]
+
+
+def _font_widths(font):
+    """Advance width (1/1000 em) of each character code of a simple font"""
+    font = font.get_object() if font is not None else {}
+    if '/Widths' in font:
+        first = int(font.get('/FirstChar', 0))
+        widths = [float(width) for width in font['/Widths']]
+        return lambda code: widths[code - first] if 0 <= code - first < len(widths) else 500
+    # The standard 14 fonts carry no widths; the direct backend (see
+    # direct_pdf.py) writes its text in Helvetica
+    table = WIDTHS['bold' if 'Bold' in str(font.get('/BaseFont', '')) else 'regular']
+    return lambda code: table[code - 32] if 32 <= code <= 126 else 556
+
+
+def remove_text(page, word, after):
+    """
+    Take a word out of a page's content stream wherever the page shows it
+    right after a label, leaving the space it took. The text operators are
+    followed to find where it was drawn.
+
+    Args:
+        page: pypdf page (its contents are replaced when the word is found)
+        word: Text to remove, as a whole word (e.g. 'PENDING')
+        after: Text the word has to follow (e.g. 'Status:'), so the same
+               word typed into a field is left alone
+
+    Returns:
+        list: (x, baseline, width, font size) of each removed occurrence, in
+              PDF coordinates
+    """
+    from pypdf.generic import ArrayObject, ByteStringObject, ContentStream, FloatObject
+
+    target, label = word.encode('latin-1'), after.encode('latin-1')
+    fonts = page['/Resources'].get('/Font', {}) if '/Resources' in page else {}
+    content = ContentStream(page.get_contents(), page.pdf)
+    operations = content.operations
+    identity = [1, 0, 0, 1, 0, 0]
+    ctm, saved = identity, []
+    tm = line = identity
+    widths, size, leading, char_space, word_space, scale = _font_widths(None), 0, 0, 0, 0, 1
+    boxes = []
+    shown = b''  # the last few characters drawn
+    cuts = {}  # (operation, item of a TJ array) -> [(start, end, gap in TJ units)]
+
+    def move(m, tx, ty):
+        return _multiply([1, 0, 0, 1, tx, ty], m)
+
+    def show(string, where=None):
+        nonlocal tm, shown
+        data = string.original_bytes if hasattr(string, 'original_bytes') else bytes(string)
+        advances = [(widths(code) * size / 1000 + char_space + (word_space if code == 32 else 0)) * scale
+                    for code in data]
+        start = data.find(target)
+        while start >= 0:
+            end = start + len(target)
+            if ((shown + data[:start]).rstrip().endswith(label)
+                    and not data[start - 1:start].isalnum() and not data[end:end + 1].isalnum()):
+                m = _multiply(tm, ctm)
+                x0, x1 = sum(advances[:start]), sum(advances[:end])
+                boxes.append((m[0] * x0 + m[4], m[1] * x0 + m[5], (x1 - x0) * m[0], size * m[3]))
+                if where is not None and size:
+                    cuts.setdefault(where, []).append((start, end, -(x1 - x0) * 1000 / (size * scale)))
+            start = data.find(target, end)
+        tm = move(tm, sum(advances), 0)
+        shown = (shown + data)[-len(label) - 8:]
+
+    for number, (operands, operator) in enumerate(operations):
+        if operator == b'q':
+            saved.append(ctm)
+        elif operator == b'Q':
+            ctm = saved.pop() if saved else identity
+        elif operator == b'cm':
+            ctm = _multiply([float(value) for value in operands], ctm)
+        elif operator == b'BT':
+            tm = line = identity
+        elif operator == b'Tf':
+            widths, size = _font_widths(fonts.get(operands[0])), float(operands[1])
+        elif operator == b'Tc':
+            char_space = float(operands[0])
+        elif operator == b'Tw':
+            word_space = float(operands[0])
+        elif operator == b'Tz':
+            scale = float(operands[0]) / 100
+        elif operator == b'TL':
+            leading = float(operands[0])
+        elif operator in (b'Td', b'TD'):
+            if operator == b'TD':
+                leading = -float(operands[1])
+            tm = line = move(line, float(operands[0]), float(operands[1]))
+        elif operator == b'Tm':
+            tm = line = [float(value) for value in operands]
+        elif operator in (b'T*', b"'", b'"'):
+            if operator == b'"':
+                word_space, char_space = float(operands[0]), float(operands[1])
+            tm = line = move(line, 0, -leading)
+            if operator != b'T*':
+                # Left in place; the overlay covers it
+                show(operands[-1])
+        elif operator == b'Tj':
+            show(operands[0], (number, 0))
+        elif operator == b'TJ':
+            for index, item in enumerate(operands[0]):
+                if isinstance(item, (str, bytes)):
+                    show(item, (number, index))
+                else:
+                    tm = move(tm, -float(item) / 1000 * size * scale, 0)
+
+    # Replace each occurrence with a gap of the same width, turning Tj into TJ
+    for (number, index), spans in sorted(cuts.items(), reverse=True):
+        operands, operator = operations[number]
+        items = list(operands[0]) if operator == b'TJ' else [operands[0]]
+        data = items[index].original_bytes if hasattr(items[index], 'original_bytes') else bytes(items[index])
+        pieces, position = [], 0
+        for start, end, gap in spans:
+            if start > position:
+                pieces.append(ByteStringObject(data[position:start]))
+            pieces.append(FloatObject(gap))
+            position = end
+        if position < len(data):
+            pieces.append(ByteStringObject(data[position:]))
+        items[index:index + 1] = pieces
+        operations[number] = ([ArrayObject(items)], b'TJ')
+    if cuts:
+        content.operations = operations
+        page.replace_contents(content)
+    return boxes
+
+
+def _stamp_pages(page_width, page_height, form_type, snapshot, status, approvers, decided_at,
+                 admin_signature, status_boxes):
+    """
+    Draw an overlay for each page of the pending PDF (status banner, new
+    status where the old one was) and the appended approval record page.
+
+    Args:
+        status_boxes: remove_text() boxes of the pending status, one list per page
+
+    Returns:
+        bytes: PDF with one overlay per page, then the approval page
+    """
+    canvas = PDFCanvas((page_width, page_height))
+    decided = decided_at.strftime('%B %d, %Y %H:%M UTC')
+
+    for number, boxes in enumerate(status_boxes):
+        if number:
+            canvas.new_page()
+        # The status printed in the body: write the new one at the same
+        # baseline and size, as a full render would show it, over a blank
+        # in case the old text could not be taken out
+        for x, baseline, width, size in boxes:
+            canvas.rect(x - 1, page_height - baseline - 0.8 * size, width + 2, 1.02 * size,
+                        stroke=False, fill_gray=1)
+            canvas.text(x, page_height - baseline, status.upper(), 'bold', size)
+
+    # Page 1: banner in the top margin, above the original content
+    canvas.set_page(1)
+    banner = f"{BANNER_TEXT.get(status, status.upper())} - {decided}"
+    canvas.rect(72, 16, page_width - 144, 30, width=1, fill_gray=0.9)
+    canvas.text(page_width / 2, 36, banner, 'bold', 13, align='center')
+
+    # Last page: approval record
+    canvas.new_page()
+    y = 90
+    canvas.text(page_width / 2, y, 'Approval Record', 'bold', 17, align='center')
+    y += 22
+    canvas.text(page_width / 2, y, f"{FORM_TITLES.get(form_type, form_type)} - Form ID: {snapshot.id}",
+                'regular', 11, align='center')
+    y += 14
+    canvas.line(72, y, page_width - 72, y, width=0.4)
+    y += 26
+
+    rows = [('Status:', status.replace('_', ' ').upper())]
+    created_at = getattr(snapshot, 'created_at', None)
+    if created_at:
+        rows.append(('Submitted:', created_at.strftime('%B %d, %Y %H:%M UTC')))
+    rows.append(('Decision recorded:', decided))
+    for label, value in rows:
+        canvas.text(72, y, label, 'regular', 11)
+        canvas.text(230, y, value, 'bold', 11)
+        y += 18
+
+    if approvers:
+        y += 10
+        canvas.text(72, y, 'Approvals:', 'regular', 11)
+        for name in approvers:
+            canvas.text(230, y, name, 'bold', 11)
+            y += 16
+
+    if admin_signature and os.path.exists(admin_signature):
+        y += 16
+        canvas.text(72, y, 'Administrator Signature:', 'regular', 11)
+        canvas.image(admin_signature, 230, y - 11, 142, max_height=60)
+        y += 60
+
+    y += 24
+    canvas.paragraph(72, y, page_width - 144,
+                     "This page and the banner on page 1 record the decision on the request.",
+                     'italic', 9)
+    return canvas.to_bytes()
+
+
+def stamp_pdf(base_pdf, pdf_path, form_type, snapshot, status, approvers=(), decided_at=None,
+              admin_signature=None):
+    """
+    Produce the PDF for a status change by stamping the pending PDF: the
+    status printed in its body is replaced, a status banner is merged onto
+    the first page and an approval record page is appended. No LaTeX run is
+    needed.
+
+    Args:
+        base_pdf: The pending PDF to stamp
+        pdf_path: Where the stamped PDF should be written
+        form_type: 'medical_withdrawal' or 'student_drop'
+        snapshot: The request (or a snapshot of it)
+        status: The new status
+        approvers: Names of the approving administrators
+        decided_at: Time of the decision (defaults to now)
+        admin_signature: Optional admin signature image
+
+    Returns:
+        str: pdf_path on success, None if the PDF could not be stamped (or
+             shows no pending status to replace)
+    """
+    try:
+        from pypdf import PdfReader, PdfWriter
+    except ImportError:
+        logger.info("pypdf is not installed; cannot stamp PDFs")
+        return None
+
+    try:
+        writer = PdfWriter(clone_from=PdfReader(base_pdf))
+        pages = list(writer.pages)
+        page_width = float(pages[0].mediabox.width)
+        page_height = float(pages[0].mediabox.height)
+
+        status_boxes = [remove_text(page, BASE_STATUS.upper(), 'Status:') for page in pages]
+        if not any(status_boxes):
+            # Stamping would leave the body saying pending
+            logger.info(f"No {BASE_STATUS} status found in {os.path.basename(base_pdf)}; rendering in full")
+            return None
+
+        stamp = PdfReader(io.BytesIO(_stamp_pages(page_width, page_height, form_type, snapshot, status,
+                                                  approvers, decided_at or datetime.utcnow(),
+                                                  admin_signature, status_boxes)))
+
+        for number, page in enumerate(pages):
+            page.merge_page(stamp.pages[number])
+        writer.add_page(stamp.pages[-1])
+
+        # Write next to the destination, then rename so the PDF appears atomically
+        os.makedirs(os.path.dirname(os.path.abspath(pdf_path)), exist_ok=True)
+        partial_path = f"{pdf_path}.{os.getpid()}.part"
+        with open(partial_path, 'wb') as f:
+            writer.write(f)
+        os.replace(partial_path, pdf_path)
+        logger.info(f"Stamped {os.path.basename(base_pdf)} as {status}: {pdf_path}")
+        return pdf_path
+    except Exception as e:
+        logger.error(f"Error stamping {base_pdf}: {str(e)}")
+        return None
+
+
+def stamp_status_pdf(form_type, snapshot, admin_signature=None):
+    """
+    Stamped PDF for a request's current status, if it can be made from its
+    pending PDF.
+
+    Args:
+        form_type: 'medical_withdrawal' or 'student_drop'
+        snapshot: Request snapshot; snapshot.approvers may hold approver names
+
+    Returns:
+        str: Path of the stamped PDF, or None if a full render is needed
+    """
+    status = snapshot.status
+    if not ENABLED or status not in STAMPABLE_STATUSES or not stamping_available():
+        return None
+
+    base_pdf = find_base_pdf(snapshot, form_type)
+    if not base_pdf:
+        return None
+
+    file_id = datetime.utcnow().strftime('%Y%m%d%H%M%S')
+    pdf_path = sharded_path(PDF_DIR, pdf_name(form_type, snapshot.id, status, file_id))
+    return stamp_pdf(base_pdf, pdf_path, form_type, snapshot, status,
+                     approvers=getattr(snapshot, 'approvers', None) or (),
+                     admin_signature=admin_signature)
@@ -0,0 +1,241 @@
+"""
+HTML previews of requests for admin triage.
+
+A preview is rendered straight from the request row, so reading a request
+never needs pdflatex or a PDF download. Each preview carries a strong ETag
+(a hash of the row's content), repeat views are answered with 304, and the
+rendered HTML is kept in a small in-process cache until the row changes.
+"""
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+from flask import current_app, render_template, request
+
+# Columns a preview does not show; admin_viewed changes on every first view
+HIDDEN_COLUMNS = {'admin_viewed', 'generated_pdfs', 'pdf_link'}
+# Bump when the preview template changes so cached copies are replaced
+PREVIEW_VERSION = 1
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+CACHE_SIZE = 512
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+TITLES = {
+    'medical_withdrawal': 'Medical/Administrative Term Withdrawal',
+    'student_drop': 'Student-Initiated Drop',
+    'ferpa': 'FERPA Release Authorization',
+    'infochange': 'Name/SSN Change',
+}
+
+
+def _full_name(*attributes):
+    return lambda record: ' '.join(filter(None, (getattr(record, name, None) for name in attributes)))
+
+
+def _signature(attribute):
+    def value(record):
+        signature = getattr(record, attribute, None)
+        if not signature:
+            return 'None'
+        if signature.startswith('data:image') or signature.lower().endswith(IMAGE_EXTENSIONS):
+            return 'Signature image on file'
+        return signature
+    return value
+
+
+def _documentation(record):
+    try:
+        files = json.loads(record.documentation_files) if record.documentation_files else []
+    except ValueError:
+        files = []
+    return f"{len(files)} file(s)"
+
+
+# Form type -> [(section heading, [(label, column name or function of the row)])]
+SECTIONS = {
+    'medical_withdrawal': [
+        ('Student Information', [
+            ('Name', _full_name('first_name', 'middle_name', 'last_name')),
+            ('myUH ID', 'myuh_id'),
+            ('College', 'college'),
+            ('Plan/Degree', 'plan_degree'),
+            ('Phone', 'phone'),
+        ]),
+        ('Mailing Address', [
+            ('Address', 'address'),
+            ('City', 'city'),
+            ('State', 'state'),
+            ('ZIP', 'zip_code'),
+        ]),
+        ('Term', [
+            ('Term/Year', 'term_year'),
+            ('Last date attended', 'last_date'),
+        ]),
+        ('Reason', [
+            ('Type', 'reason_type'),
+            ('Details', 'details'),
+        ]),
+        ('Additional Information', [
+            ('Financial assistance', 'financial_assistance'),
+            ('Health insurance', 'health_insurance'),
+            ('Campus housing', 'campus_housing'),
+            ('Visa', 'visa_status'),
+            ('GI Bill', 'gi_bill'),
+        ]),
+        ('Acknowledgement', [
+            ('Initials', 'initial'),
+            ('Signature', _signature('signature')),
+            ('Signed on', 'signature_date'),
+            ('Documentation', _documentation),
+        ]),
+    ],
+    'student_drop': [
+        ('Student Information', [
+            ('Name', 'student_name'),
+            ('Student ID', 'student_id'),
+        ]),
+        ('Drop Request', [
+            ('Course', 'course_title'),
+            ('Reason', 'reason'),
+            ('Drop date', 'date'),
+            ('Signature', _signature('signature')),
+        ]),
+    ],
+    'ferpa': [
+        ('Student Information', [
+            ('Name', 'name'),
+            ('Campus', 'campus'),
+            ('PeopleSoft ID', 'peoplesoft_id'),
+        ]),
+        ('Offices', [
+            ('Officials', 'official_choices'),
+            ('Other officials', 'official_other'),
+        ]),
+        ('Information Released', [
+            ('Information', 'info_choices'),
+            ('Other information', 'info_other'),
+        ]),
+        ('Release', [
+            ('Release to', 'release_to'),
+            ('Purpose', 'purpose'),
+            ('Release for', 'release_choices'),
+            ('Other', 'release_other'),
+            ('Additional names', 'additional_names'),
+            ('Phone password', 'password'),
+        ]),
+        ('Signature', [
+            ('Signature', _signature('sig_link')),
+            ('Date', 'date'),
+        ]),
+    ],
+    'infochange': [
+        ('Student Information', [
+            ('Name', 'name'),
+            ('PeopleSoft ID', 'peoplesoft_id'),
+            ('Changing', 'choice'),
+        ]),
+        ('Name Change', [
+            ('Old name', _full_name('fname_old', 'mname_old', 'lname_old', 'sfx_old')),
+            ('New name', _full_name('fname_new', 'mname_new', 'lname_new', 'sfx_new')),
+            ('Reason', 'nmchg_reason'),
+        ]),
+        ('SSN Change', [
+            ('Old SSN', 'ssn_old'),
+            ('New SSN', 'ssn_new'),
+            ('Reason', 'ssnchg_reason'),
+        ]),
+        ('Signature', [
+            ('Signature', _signature('sig_link')),
+            ('Date', 'date'),
+        ]),
+    ],
+}
+
+
+def _display(value):
+    if value is None or value == '':
+        return '-'
+    if isinstance(value, bool):
+        return 'Yes' if value else 'No'
+    if isinstance(value, datetime):
+        return value.strftime('%B %d, %Y %H:%M')
+    if isinstance(value, date):
+        return value.strftime('%B %d, %Y')
+    return str(value)
+
+
+def preview_etag(form_type, record):
+    """Content hash of everything a request's preview shows"""
+    values = {column.name: getattr(record, column.name) for column in record.__table__.columns
+              if column.name not in HIDDEN_COLUMNS}
+    encoded = json.dumps([PREVIEW_VERSION, form_type, values], sort_keys=True, default=str)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def preview_context(form_type, record):
+    """Template values for a request's preview"""
+    sections = []
+    for heading, fields in SECTIONS[form_type]:
+        rows = []
+        for label, source in fields:
+            value = source(record) if callable(source) else getattr(record, source, None)
+            rows.append((label, _display(value)))
+        sections.append((heading, rows))
+
+    courses = []
+    if form_type == 'medical_withdrawal' and record.courses:
+        try:
+            courses = [course for course in json.loads(record.courses) if isinstance(course, dict)]
+        except ValueError:
+            courses = []
+
+    return {
+        'title': TITLES[form_type],
+        'form_type': form_type,
+        'record': record,
+        'submitted': _display(getattr(record, 'created_at', None) or getattr(record, 'time', None)),
+        'sections': sections,
+        'courses': courses,
+    }
+
+
+def render_preview(form_type, record, etag=None):
+    """HTML of a request's preview, from the cache while the row is unchanged"""
+    etag = etag or preview_etag(form_type, record)
+    key = (form_type, record.id, etag)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+
+    html = render_template('admin/request_preview.html', **preview_context(form_type, record))
+
+    with _cache_lock:
+        _cache[key] = html
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return html
+
+
+def preview_response(form_type, record):
+    """
+    Response with a request's preview, or 304 when the browser's copy is
+    still current (checked before anything is rendered).
+    """
+    if form_type not in SECTIONS:
+        raise ValueError(f"No preview for form type {form_type}")
+
+    etag = preview_etag(form_type, record)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = current_app.response_class(render_preview(form_type, record, etag), mimetype='text/html')
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
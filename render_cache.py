@@ -0,0 +1,240 @@
+import os
+import re
+import shutil
+import hashlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# -------------------------------
+# Configuration
+# -------------------------------
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+# Rendered PDFs are stored here, one sub-directory per template fingerprint.
+# Kept out of static/: cached PDFs hold student data and must not be served
+# without the download routes' checks.
+CACHE_DIR = os.environ.get('RENDER_CACHE_DIR', os.path.join(BASE_DIR, 'instance', 'render_cache'))
+
+# Where the cache used to live (publicly served); removed by migrations.py
+LEGACY_CACHE_DIR = os.path.join(BASE_DIR, 'static', 'render_cache')
+
+# Upper bound for the whole cache; least recently used PDFs are evicted first
+MAX_BYTES = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+ENABLED = os.environ.get('RENDER_CACHE_ENABLED', '1') == '1'
+
+# Any change to a file in these directories invalidates the whole cache
+TEMPLATE_DIRS = [
+    os.path.join(BASE_DIR, 'static', 'templates'),
+    os.path.join(BASE_DIR, 'static', 'form-templates'),
+]
+
+# Bump when the way PDFs are produced changes without touching a template
+CACHE_VERSION = '1'
+
+# pdfTeX otherwise embeds the build time and a random document ID, so two
+# compiles of the same source would never be byte-identical. Guarded so the
+# source still compiles with engines that lack these primitives.
+DETERMINISTIC_PREAMBLE = (
+    "\\ifdefined\\pdftrailerid\\pdftrailerid{}\\fi\n"
+    "\\ifdefined\\pdfinfoomitdate\\pdfinfoomitdate=1\\fi\n"
+)
+
+INCLUDEGRAPHICS_PATTERN = re.compile(r'\\includegraphics\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}')
+
+# Extensions pdflatex tries when \includegraphics names a file without one
+GRAPHICS_EXTENSIONS = ['.pdf', '.png', '.jpg', '.jpeg']
+
+
+def make_deterministic(tex_source):
+    """Prefix a LaTeX document with the settings that make pdflatex output reproducible"""
+    if tex_source.startswith(DETERMINISTIC_PREAMBLE):
+        return tex_source
+    return DETERMINISTIC_PREAMBLE + tex_source
+
+
+def deterministic_env():
+    """Environment for pdflatex runs whose output should be reproducible"""
+    env = os.environ.copy()
+    env['SOURCE_DATE_EPOCH'] = '0'
+    # Leave \today alone: it is only fixed when FORCE_SOURCE_DATE is set
+    env.pop('FORCE_SOURCE_DATE', None)
+    return env
+
+
+def _resolve_graphic(path, base_dir):
+    """Find the file pdflatex would load for an \\includegraphics argument"""
+    path = path.strip()
+    if not os.path.isabs(path):
+        path = os.path.join(base_dir, path)
+
+    if os.path.isfile(path):
+        return path
+    for ext in GRAPHICS_EXTENSIONS:
+        if os.path.isfile(path + ext):
+            return path + ext
+    return None
+
+
+def _file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(tex_source, base_dir=None):
+    """
+    Compute the content address of a LaTeX document.
+
+    Every \\includegraphics path is replaced by the digest of the image it
+    points to, so the same signature saved under two different temporary
+    filenames still produces the same key, while a changed image does not.
+
+    Args:
+        tex_source: The fully filled-in LaTeX source
+        base_dir: Directory relative image paths are resolved against
+                  (defaults to the current working directory)
+
+    Returns:
+        str: Hex digest identifying the rendered PDF
+    """
+    base_dir = base_dir or os.getcwd()
+
+    def replace_graphic(match):
+        resolved = _resolve_graphic(match.group(1), base_dir)
+        if resolved is None:
+            # pdflatex fails on a missing image; keep the path so such a
+            # source never shares a key with one whose image exists
+            return f"<missing:{match.group(1)}>"
+        return f"<image:{_file_digest(resolved)}>"
+
+    normalized = INCLUDEGRAPHICS_PATTERN.sub(replace_graphic, tex_source)
+    return hashlib.sha256(f"{CACHE_VERSION}\n{normalized}".encode('utf-8')).hexdigest()
+
+
+def template_fingerprint():
+    """Hash of the name, size and modification time of every template file"""
+    digest = hashlib.sha256(CACHE_VERSION.encode('utf-8'))
+    for template_dir in TEMPLATE_DIRS:
+        if not os.path.isdir(template_dir):
+            continue
+        for name in sorted(os.listdir(template_dir)):
+            path = os.path.join(template_dir, name)
+            if not os.path.isfile(path):
+                continue
+            stat = os.stat(path)
+            digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+_active_namespace = None
+
+
+def _namespace_dir():
+    """
+    Directory for the current template fingerprint. When the templates change
+    a new directory is used and the ones for older fingerprints are removed.
+    """
+    global _active_namespace
+
+    fingerprint = template_fingerprint()
+    namespace_dir = os.path.join(CACHE_DIR, fingerprint)
+
+    if fingerprint != _active_namespace:
+        os.makedirs(namespace_dir, exist_ok=True)
+        for name in os.listdir(CACHE_DIR):
+            stale_dir = os.path.join(CACHE_DIR, name)
+            if name != fingerprint and os.path.isdir(stale_dir):
+                logger.info(f"Templates changed, dropping render cache {stale_dir}")
+                shutil.rmtree(stale_dir, ignore_errors=True)
+        _active_namespace = fingerprint
+
+    return namespace_dir
+
+
+def fetch(key, dest_path):
+    """
+    Copy a cached PDF to dest_path.
+
+    Args:
+        key: Value returned by cache_key()
+        dest_path: Where the PDF should end up
+
+    Returns:
+        bool: True on a cache hit, False if the PDF has to be compiled
+    """
+    if not ENABLED:
+        return False
+
+    try:
+        cached_path = os.path.join(_namespace_dir(), f"{key}.pdf")
+        shutil.copyfile(cached_path, dest_path)
+        # Mark as recently used for eviction
+        os.utime(cached_path)
+        logger.info(f"Render cache hit {key[:12]} -> {dest_path}")
+        return True
+    except FileNotFoundError:
+        return False
+    except Exception as e:
+        logger.error(f"Error reading render cache: {str(e)}")
+        return False
+
+
+def store(key, pdf_path):
+    """
+    Add a freshly compiled PDF to the cache, then evict down to MAX_BYTES.
+
+    Args:
+        key: Value returned by cache_key() for the source pdf_path was built from
+        pdf_path: The compiled PDF
+    """
+    if not ENABLED or not os.path.exists(pdf_path):
+        return
+
+    try:
+        namespace_dir = _namespace_dir()
+        cached_path = os.path.join(namespace_dir, f"{key}.pdf")
+
+        # Write under a temporary name and rename so readers never see a partial file
+        temp_path = f"{cached_path}.{os.getpid()}.tmp"
+        shutil.copyfile(pdf_path, temp_path)
+        os.replace(temp_path, cached_path)
+        logger.info(f"Stored {pdf_path} in render cache as {key[:12]}")
+
+        evict(namespace_dir)
+    except Exception as e:
+        logger.error(f"Error writing render cache: {str(e)}")
+
+
+def evict(namespace_dir=None):
+    """Remove least recently used PDFs until the cache fits in MAX_BYTES"""
+    namespace_dir = namespace_dir or _namespace_dir()
+
+    entries = []
+    total_bytes = 0
+    for entry in os.scandir(namespace_dir):
+        if not entry.name.endswith('.pdf'):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes += stat.st_size
+
+    if total_bytes <= MAX_BYTES:
+        return
+
+    for _mtime, size, path in sorted(entries):
+        try:
+            os.remove(path)
+            total_bytes -= size
+            logger.debug(f"Evicted {path} from render cache")
+        except FileNotFoundError:
+            pass
+        if total_bytes <= MAX_BYTES:
+            break
@@ -0,0 +1,203 @@
+"""
+Client of the render service (render_service.py).
+
+When RENDER_SERVICE_URL is set, LaTeX renders are sent to the service
+instead of running pdflatex on the web node. Connections are pooled per
+process, every call has connect/read timeouts, and while the service is
+unreachable renders fall back to this process (see
+form_renderers.render_fields).
+
+    pdf_path = render_client.render_to_file('ferpa', fields, pdf_path)
+"""
+import os
+import time
+import base64
+import logging
+import threading
+
+import latex_limits
+
+logger = logging.getLogger(__name__)
+
+SERVICE_URL = os.environ.get('RENDER_SERVICE_URL', '').rstrip('/')
+TOKEN = os.environ.get('RENDER_SERVICE_TOKEN', '')
+CONNECT_TIMEOUT = float(os.environ.get('RENDER_SERVICE_CONNECT_TIMEOUT', 3))
+# Covers the service's queueing plus the LaTeX budget (LATEX_TIMEOUT)
+READ_TIMEOUT = float(os.environ.get('RENDER_SERVICE_READ_TIMEOUT', 120))
+# Connections kept open to the service, per process
+POOL_SIZE = int(os.environ.get('RENDER_SERVICE_POOL_SIZE', 10))
+# After the service could not be reached, render locally for this long before trying it again
+RETRY_AFTER = float(os.environ.get('RENDER_SERVICE_RETRY_AFTER', 30))
+
+# Image fields whose local files (signature images) are sent along with the
+# request, replaced by {FILE_MARKER: name}. SIGNATURE is a path for the
+# linked forms and a resolve_signature() dict ({'image': path}) for the
+# others. Every other field value is sent as it is.
+IMAGE_FIELDS = ('SIGNATURE', 'ADMIN_SIGNATURE_IMAGE')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+FILE_MARKER = '$file'
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_down_until = 0.0
+
+
+class RenderServiceUnavailable(Exception):
+    """The service could not be reached or could not take the job; render locally instead"""
+
+
+def enabled():
+    """Whether renders should be sent to the service right now"""
+    return bool(SERVICE_URL) and time.monotonic() >= _down_until
+
+
+def _mark_down(reason):
+    global _down_until
+    _down_until = time.monotonic() + RETRY_AFTER
+    logger.warning(f"Render service unavailable ({reason}), rendering locally for {RETRY_AFTER:.0f}s")
+
+
+def _get_session():
+    """Pooled HTTP session of this process (rebuilt after a fork)"""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=1)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if TOKEN:
+                session.headers['Authorization'] = f"Bearer {TOKEN}"
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _request(method, path, **kwargs):
+    import requests
+
+    try:
+        response = _get_session().request(method, SERVICE_URL + path,
+                                          timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), **kwargs)
+    except requests.RequestException as e:
+        _mark_down(str(e))
+        raise RenderServiceUnavailable(str(e))
+
+    if response.status_code in (502, 503, 504):
+        _mark_down(f"HTTP {response.status_code}")
+        raise RenderServiceUnavailable(f"HTTP {response.status_code}")
+    return response
+
+
+def _pack_file(path, files):
+    """Attach a signature image and return its reference; anything else is returned unchanged"""
+    if not isinstance(path, str) or not path.lower().endswith(IMAGE_EXTENSIONS) or not os.path.isfile(path):
+        return path
+    name = f"{len(files)}_{os.path.basename(path)}"
+    with open(path, 'rb') as f:
+        files[name] = base64.b64encode(f.read()).decode('ascii')
+    return {FILE_MARKER: name}
+
+
+def pack_files(fields, files):
+    """Field values with the signature images in IMAGE_FIELDS replaced by references to their attached content"""
+    packed = dict(fields)
+    for field in IMAGE_FIELDS:
+        value = packed.get(field)
+        if isinstance(value, dict) and value.get('image'):
+            packed[field] = dict(value, image=_pack_file(value['image'], files))
+        elif value:
+            packed[field] = _pack_file(value, files)
+    return packed
+
+
+def render(form_type, fields, backend='latex', store=False):
+    """
+    Render prepared field values on the service.
+
+    Args:
+        form_type: A registered form type
+        fields: Field values after FormRenderer.prepare()
+        backend: Backend the service should use
+        store: Keep the PDF on the service and return its artifact ID
+
+    Returns:
+        bytes: The PDF, or str: its artifact ID when store is set
+
+    Raises:
+        RenderServiceUnavailable: The service could not be reached
+        CompileFailure: LaTeX failed on the service (also kept in latex_limits.last_failure())
+        ValueError: The service rejected the request
+    """
+    files = {}
+    payload = {
+        'form_type': form_type,
+        'backend': backend,
+        'fields': pack_files(fields, files),
+        'files': files,
+        'store': store,
+    }
+    response = _request('POST', '/render', json=payload)
+
+    if response.status_code == 422:
+        failure = response.json()['failure']
+        # The service counted it against the template's breaker already
+        latex_limits.record_failure(failure.get('template') or form_type, failure['reason'], failure.get('detail'),
+                                    failure.get('exit_code'), failure.get('elapsed'), count=False)
+        raise latex_limits.CompileFailure(latex_limits.last_failure())
+    if response.status_code != 200:
+        raise ValueError(f"Render service refused {form_type}: HTTP {response.status_code} {response.text[:200]}")
+
+    if store:
+        return response.json()['artifact_id']
+    return response.content
+
+
+def _write(data, pdf_path):
+    os.makedirs(os.path.dirname(os.path.abspath(pdf_path)), exist_ok=True)
+    partial_path = f"{pdf_path}.{os.getpid()}.part"
+    with open(partial_path, 'wb') as f:
+        f.write(data)
+    os.replace(partial_path, pdf_path)
+    return pdf_path
+
+
+def render_to_file(form_type, fields, pdf_path, backend='latex'):
+    """
+    Render on the service and write the PDF to pdf_path.
+
+    Returns:
+        str: pdf_path, or None if the render failed (see latex_limits.last_failure())
+
+    Raises:
+        RenderServiceUnavailable: The service could not be reached; render locally
+    """
+    latex_limits.clear_failure()
+    try:
+        data = render(form_type, fields, backend=backend)
+    except latex_limits.CompileFailure:
+        return None
+    except ValueError as e:
+        logger.error(str(e))
+        return None
+    return _write(data, pdf_path)
+
+
+def fetch_artifact(artifact_id, pdf_path):
+    """Download a PDF kept on the service (render(..., store=True)) to pdf_path"""
+    response = _request('GET', f"/artifacts/{artifact_id}")
+    if response.status_code != 200:
+        raise ValueError(f"Render service has no artifact {artifact_id}: HTTP {response.status_code}")
+    return _write(response.content, pdf_path)
+
+
+def health():
+    """The service's health report, or None if it can't be reached"""
+    try:
+        response = _request('GET', '/health')
+    except RenderServiceUnavailable:
+        return None
+    return response.json() if response.status_code == 200 else None
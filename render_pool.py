@@ -0,0 +1,257 @@
+"""
+Pre-forked renderer processes.
+
+The pool process resolves the toolchain once (pdflatex path, precompiled
+formats, parsed templates, Pillow) and then forks RENDERER_WORKERS workers
+that inherit the warm state. Workers accept jobs on a local Unix socket,
+render, and send back the PDF path; each one is replaced after
+RENDERER_MAX_JOBS jobs so leaks can't build up.
+
+Start it at boot, before the web server:
+
+    python render_pool.py [--workers N] [--max-jobs N] [--socket PATH]
+
+Web code calls call()/render_snapshot() below. When no pool is listening
+the job runs in the calling process as before.
+"""
+import os
+import sys
+import signal
+import logging
+import argparse
+import importlib
+import traceback
+from multiprocessing.connection import Listener, Client
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+SOCKET_PATH = os.environ.get('RENDERER_SOCKET', os.path.join(BASE_DIR, 'instance', 'renderer.sock'))
+WORKERS = int(os.environ.get('RENDERER_WORKERS', 2))
+# Jobs a worker handles before it is replaced (0 = never)
+MAX_JOBS = int(os.environ.get('RENDERER_MAX_JOBS', 200))
+# Set to 0 to always render in the calling process
+ENABLED = os.environ.get('RENDERER_POOL', '1') == '1'
+# How long a client waits for a worker's answer
+REPLY_TIMEOUT = float(os.environ.get('RENDERER_REPLY_TIMEOUT', 300))
+
+# Jobs the workers accept: name -> (module, function)
+CALLS = {
+    'render_snapshot': ('render_queue', 'render_snapshot'),
+    'generate_ferpa': ('form_utils', 'generate_ferpa'),
+    'generate_ssn_name': ('form_utils', 'generate_ssn_name'),
+    'render_prepared': ('form_renderers', 'render_prepared'),
+}
+
+
+def _resolve(name):
+    module, function = CALLS[name]
+    return getattr(importlib.import_module(module), function)
+
+
+# -------------------------------
+# Client side (web workers, render dispatcher)
+# -------------------------------
+
+def available():
+    """Whether a pool is listening on SOCKET_PATH"""
+    if not ENABLED or not os.path.exists(SOCKET_PATH):
+        return False
+    try:
+        Client(SOCKET_PATH, 'AF_UNIX').close()
+        return True
+    except OSError:
+        return False
+
+
+def call(name, *args, **kwargs):
+    """
+    Run one of CALLS in a pool worker and return its result. Falls back to
+    running it in this process when the pool isn't up.
+
+    Raises:
+        Whatever the render function raised (e.g. latex_limits.CompileFailure)
+    """
+    if name not in CALLS:
+        raise ValueError(f"Unknown render call: {name}")
+
+    conn = None
+    if ENABLED and os.path.exists(SOCKET_PATH):
+        try:
+            conn = Client(SOCKET_PATH, 'AF_UNIX')
+        except OSError as e:
+            logger.warning(f"Renderer pool not reachable at {SOCKET_PATH}, rendering here: {str(e)}")
+
+    if conn is None:
+        return _resolve(name)(*args, **kwargs)
+
+    with conn:
+        conn.send((name, args, kwargs))
+        if not conn.poll(REPLY_TIMEOUT):
+            raise RuntimeError(f"Renderer pool did not answer {name} within {REPLY_TIMEOUT:.0f}s")
+        try:
+            status, value = conn.recv()
+        except EOFError:
+            raise RuntimeError(f"Renderer worker exited during {name}")
+
+    if status == 'error':
+        raise value
+    return value
+
+
+def render_snapshot(form_type, snapshot, stamp=True):
+    """render_queue.render_snapshot in a pool worker"""
+    return call('render_snapshot', form_type, snapshot, stamp=stamp)
+
+
+# -------------------------------
+# Pool side
+# -------------------------------
+
+def warm_up():
+    """Load everything a render needs so forked workers start warm"""
+    from latex_runner import find_pdflatex
+    import latex_formats
+    import render_queue  # noqa: F401 (imported for the workers)
+    import direct_pdf  # noqa: F401
+    import pdf_stamp  # noqa: F401
+    import form_renderers
+
+    pdflatex = find_pdflatex()
+    if pdflatex:
+        latex_formats.warm_formats(pdflatex)
+
+    # Parse the templates now instead of on each worker's first job
+    for form_type, renderer in form_renderers.RENDERERS.items():
+        try:
+            renderer.template()
+        except Exception as e:
+            logger.error(f"Error preloading the {form_type} template: {str(e)}")
+
+    try:
+        from PIL import Image
+        Image.init()
+    except ImportError:
+        pass
+
+
+def _handle(conn):
+    """Run one job from a client. Returns False for an availability probe."""
+    try:
+        name, args, kwargs = conn.recv()
+    except (EOFError, OSError):
+        return False  # availability probe or client gone
+
+    try:
+        reply = ('ok', _resolve(name)(*args, **kwargs))
+    except Exception as e:
+        logger.error(f"Render call {name} failed: {str(e)}")
+        logger.debug(traceback.format_exc())
+        reply = ('error', e)
+
+    try:
+        conn.send(reply)
+    except (EOFError, OSError):
+        logger.warning(f"Client left before {name} finished")
+    except Exception:
+        # The exception could not be pickled
+        conn.send(('error', RuntimeError(str(reply[1]))))
+    return True
+
+
+def _worker(listener, max_jobs):
+    """Body of a forked worker: take jobs until recycled"""
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    jobs = 0
+    while not max_jobs or jobs < max_jobs:
+        try:
+            conn = listener.accept()
+        except OSError:
+            break
+        with conn:
+            if _handle(conn):
+                jobs += 1
+    os._exit(0)
+
+
+class RendererPool:
+    """Parent process of the pre-forked workers"""
+
+    def __init__(self, socket_path=SOCKET_PATH, workers=WORKERS, max_jobs=MAX_JOBS):
+        self.socket_path = socket_path
+        self.workers = max(workers, 1)
+        self.max_jobs = max_jobs
+        self.children = set()
+        self.stopping = False
+
+    def _spawn(self, listener):
+        pid = os.fork()
+        if pid == 0:
+            _worker(listener, self.max_jobs)
+        self.children.add(pid)
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def serve_forever(self):
+        if not hasattr(os, 'fork'):
+            raise RuntimeError("The renderer pool needs os.fork(); render in-process on this platform")
+
+        # Workers resolve relative paths the same way the web app does
+        os.chdir(BASE_DIR)
+        warm_up()
+
+        os.makedirs(os.path.dirname(self.socket_path), exist_ok=True)
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        old_umask = os.umask(0o077)
+        try:
+            listener = Listener(self.socket_path, 'AF_UNIX', backlog=64)
+        finally:
+            os.umask(old_umask)
+
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+
+        for _ in range(self.workers):
+            self._spawn(listener)
+        logger.info(f"Renderer pool listening on {self.socket_path} with {self.workers} worker(s)")
+
+        try:
+            while self.children:
+                try:
+                    pid, status = os.wait()
+                except InterruptedError:
+                    continue
+                except ChildProcessError:
+                    break
+                self.children.discard(pid)
+                if not self.stopping:
+                    # Recycled after MAX_JOBS jobs, or crashed; keep the pool full
+                    if status:
+                        logger.warning(f"Renderer worker {pid} exited with status {status}")
+                    self._spawn(listener)
+        finally:
+            listener.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+            logger.info("Renderer pool stopped")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the pre-forked PDF renderer pool')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='Worker processes')
+    parser.add_argument('--max-jobs', type=int, default=MAX_JOBS, help='Jobs per worker before it is replaced (0: never)')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='Unix socket to listen on')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s', stream=sys.stderr)
+    RendererPool(args.socket, args.workers, args.max_jobs).serve_forever()
@@ -0,0 +1,601 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import latex_limits
+import storage
+from pdf_optimize import optimize_if_enabled
+from storage_layout import FORMS_DIR, relative_path
+
+logger = logging.getLogger(__name__)
+
+# Job states stored in RenderJob.state
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+# Job kinds stored in RenderJob.kind
+KIND_FINAL = 'final'
+KIND_SPECULATIVE = 'speculative'  # pre-render of a draft, attached only if it is submitted unchanged
+
+# Form types that can be rendered. The renderers are imported inside the
+# worker process so this module never has to import form_renderers (or main).
+FORM_TYPES = ['medical_withdrawal', 'student_drop', 'ferpa', 'infochange']
+
+# Form types whose PDFs are listed in generated_pdfs; the others keep a
+# single pdf_link relative to static/forms
+GENERATED_PDFS_FORMS = ['medical_withdrawal', 'student_drop']
+
+# Columns that change without changing what a request's PDF shows
+BOOKKEEPING_COLUMNS = {'id', 'status', 'generated_pdfs', 'pdf_link', 'admin_viewed', 'admin_approvals', 'updated_at'}
+
+
+def snapshot_request(record, status=None, approvers=None):
+    """
+    Copy the column values of a request row into a plain object that can be
+    pickled and sent to a worker process.
+
+    Args:
+        record: A MedicalWithdrawalRequest or StudentInitiatedDrop row
+        status: Status to render the PDF for (defaults to the row's status)
+        approvers: Names of the approving administrators, shown on stamped PDFs
+
+    Returns:
+        SimpleNamespace: Detached copy of the row usable by the PDF generators
+    """
+    values = {column.name: getattr(record, column.name) for column in record.__table__.columns}
+    if status:
+        values['status'] = status
+
+    # The medical withdrawal PDF reads the requester's email through the relationship
+    user = getattr(record, 'user', None)
+    if user is not None:
+        values['user'] = SimpleNamespace(email_=getattr(user, 'email_', None))
+
+    if approvers:
+        values['approvers'] = list(approvers)
+
+    return SimpleNamespace(**values)
+
+
+def content_hash(record):
+    """
+    SHA-256 of the request columns that end up in its PDF. A draft that still
+    has the hash of a speculative render can be submitted with that PDF.
+    """
+    values = {column.name: getattr(record, column.name) for column in record.__table__.columns
+              if column.name not in BOOKKEEPING_COLUMNS}
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def render_snapshot(form_type, snapshot, stamp=True):
+    """
+    Render a request snapshot to PDF. Runs inside a worker process.
+
+    Args:
+        form_type: One of FORM_TYPES
+        snapshot: Result of snapshot_request()
+        stamp: Allow stamping a status change onto the pending PDF instead
+               of a full render (see pdf_stamp.py)
+
+    Returns:
+        str: Absolute path of the generated PDF, or None on failure
+
+    Raises:
+        CompileFailure: LaTeX failed for a known reason (timeout, resource
+                        limit, LaTeX error, circuit open...)
+    """
+    latex_limits.clear_failure()
+    pdf_path = _render(form_type, snapshot, stamp)
+    if (not pdf_path or not os.path.exists(pdf_path)) and latex_limits.last_failure():
+        raise latex_limits.CompileFailure(latex_limits.last_failure())
+    # Shrink and linearize the new file when PDF_OPTIMIZE=1 (see pdf_optimize.py),
+    # then make it available to every web node (see storage.py)
+    return storage.publish(optimize_if_enabled(pdf_path))
+
+
+def _render(form_type, snapshot, stamp):
+    if stamp and form_type in GENERATED_PDFS_FORMS:
+        # Status changes after submission are stamped onto the pending PDF
+        # when it exists, skipping a full LaTeX run
+        from pdf_stamp import stamp_status_pdf
+        stamped = stamp_status_pdf(form_type, snapshot)
+        if stamped:
+            return stamped
+
+    # Every form type goes through its registered renderer (see form_renderers.py)
+    from form_renderers import render
+    return render(form_type, snapshot)
+
+
+def record_pdf(form_type, record, pdf_path):
+    """Point a request row at a newly rendered PDF. The caller commits."""
+    if form_type in GENERATED_PDFS_FORMS:
+        pdfs = json.loads(record.generated_pdfs) if record.generated_pdfs else []
+        pdfs.append(pdf_path)
+        record.generated_pdfs = json.dumps(pdfs)
+    else:
+        # pdf_link is relative to static/forms (shard directory and name)
+        record.pdf_link = relative_path(FORMS_DIR, pdf_path)
+
+
+class RenderQueue:
+    """
+    Persistent PDF render queue.
+
+    Routes call enqueue() and commit their status change right away. A
+    dispatcher thread claims queued RenderJob rows, renders them on a process
+    pool and writes the finished PDF path back to the request's
+    generated_pdfs (or pdf_link) column.
+    """
+
+    def __init__(self, app, db, job_model, form_models, approver_names=None, artifact_model=None):
+        self.app = app
+        self.db = db
+        self.job_model = job_model
+        self.form_models = form_models
+        # Finished PDFs are registered here when given (see artifacts.py)
+        self.artifact_model = artifact_model
+        # Optional function (record) -> list of approver names for stamped PDFs
+        self.approver_names = approver_names
+
+        self.pool_size = app.config.get('RENDER_POOL_SIZE', 2)
+        self.poll_interval = app.config.get('RENDER_QUEUE_POLL_INTERVAL', 1.0)
+        self.max_attempts = app.config.get('RENDER_MAX_ATTEMPTS', 3)
+        self.stale_after = timedelta(seconds=app.config.get('RENDER_JOB_TIMEOUT', 600))
+        # Pre-render drafts in the background (see speculate())
+        self.speculative = app.config.get('RENDER_SPECULATIVE', True)
+        # Merge each new PDF with the request's documentation (see packets.packet_pdf())
+        self.build_packets = app.config.get('RENDER_PACKETS', False)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._executor = None
+        self._render = render_snapshot
+        self._in_flight = {}  # job id -> Future
+
+    # -------------------------------
+    # Producer side (web routes)
+    # -------------------------------
+
+    def enqueue(self, form_type, record):
+        """
+        Queue a PDF render for a request. The caller is responsible for
+        committing the session.
+
+        Args:
+            form_type: One of FORM_TYPES
+            record: The request row to render
+
+        Returns:
+            RenderJob: The newly created job
+        """
+        if form_type not in FORM_TYPES:
+            raise ValueError(f"Unknown form type for rendering: {form_type}")
+
+        # A draft submitted unchanged takes over its speculative render
+        job = self._adopt_speculative(form_type, record)
+        if job is not None:
+            return job
+
+        job = self.job_model(
+            form_type=form_type,
+            form_id=record.id,
+            form_status=record.status,
+            state=QUEUED,
+            kind=KIND_FINAL
+        )
+        self.db.session.add(job)
+        self._wakeup.set()
+        return job
+
+    def speculate(self, form_type, record, status='pending'):
+        """
+        Pre-render a draft in the background as it will look once submitted,
+        so that submitting it unchanged needs no render. Earlier speculative
+        renders of the draft that no longer match its content are dropped.
+        The caller is responsible for committing the session.
+
+        Args:
+            form_type: One of FORM_TYPES
+            record: The draft row
+            status: Status the draft will have once submitted
+
+        Returns:
+            RenderJob: The speculative job for the draft's current content,
+                       or None when speculative rendering is turned off
+        """
+        if form_type not in FORM_TYPES:
+            raise ValueError(f"Unknown form type for rendering: {form_type}")
+        if not self.speculative:
+            return None
+
+        digest = content_hash(record)
+        current = None
+        for job in self._speculative_jobs(form_type, record.id):
+            if current is None and job.content_hash == digest and job.form_status == status and self._usable(job):
+                current = job
+            else:
+                self._drop(job)
+        if current is not None:
+            return current
+
+        job = self.job_model(
+            form_type=form_type,
+            form_id=record.id,
+            form_status=status,
+            state=QUEUED,
+            kind=KIND_SPECULATIVE,
+            content_hash=digest
+        )
+        self.db.session.add(job)
+        self._wakeup.set()
+        return job
+
+    def record_render(self, form_type, record, pdf_path=None, failure=None):
+        """
+        Keep the outcome of a render done outside the queue (a synchronous
+        re-render on download) as a finished job, so the status page can say
+        why a PDF is missing. The caller is responsible for committing.
+
+        Args:
+            form_type: One of FORM_TYPES
+            record: The request row that was rendered
+            pdf_path: The PDF, when the render succeeded
+            failure: latex_limits.CompileFailure, when LaTeX failed
+
+        Returns:
+            RenderJob: The finished job
+        """
+        now = datetime.utcnow()
+        job = self.job_model(
+            form_type=form_type,
+            form_id=record.id,
+            form_status=record.status,
+            state=DONE if pdf_path else FAILED,
+            kind=KIND_FINAL,
+            attempts=1,
+            pdf_path=pdf_path,
+            error=json.dumps(failure.failure) if failure else None,
+            failure_reason=failure.reason if failure else None,
+            started_at=now,
+            finished_at=now
+        )
+        self.db.session.add(job)
+        return job
+
+    def latest_jobs(self, form_type, form_ids):
+        """Return {form_id: most recent RenderJob} for the given requests"""
+        if not form_ids:
+            return {}
+
+        jobs = self.job_model.query.filter(
+            self.job_model.form_type == form_type,
+            self.job_model.form_id.in_(list(form_ids)),
+            self.job_model.kind == KIND_FINAL
+        ).order_by(self.job_model.created_at).all()
+
+        # Later jobs overwrite earlier ones, leaving the most recent per request
+        return {job.form_id: job for job in jobs}
+
+    # -------------------------------
+    # Speculative renders of drafts
+    # -------------------------------
+
+    def _speculative_jobs(self, form_type, form_id):
+        return self.job_model.query.filter_by(form_type=form_type, form_id=form_id,
+                                              kind=KIND_SPECULATIVE).order_by(self.job_model.created_at.desc()).all()
+
+    @staticmethod
+    def _usable(job):
+        """Whether a speculative job is pending or has a PDF to hand over"""
+        if job.state in (QUEUED, RUNNING):
+            return True
+        return job.state == DONE and storage.exists(job.pdf_path)
+
+    def _drop(self, job):
+        """Discard a speculative render that no longer matches its draft"""
+        if job.state == RUNNING:
+            # Its result is thrown away when the worker hands it back
+            job.content_hash = None
+            return
+        if job.pdf_path:
+            storage.delete(job.pdf_path)
+        self.db.session.delete(job)
+        logger.info(f"Dropped speculative render job {job.id} ({job.form_type} #{job.form_id})")
+
+    def _adopt_speculative(self, form_type, record):
+        """
+        Turn the speculative render of a draft being submitted into its real
+        job. A finished one is attached to the request at once; one still
+        queued or running is recorded when it finishes.
+
+        Returns:
+            RenderJob: The adopted job, or None if there is no matching render
+        """
+        if not self.speculative:
+            return None
+
+        digest = content_hash(record)
+        adopted = None
+        for job in self._speculative_jobs(form_type, record.id):
+            if (adopted is None and job.content_hash == digest and job.form_status == record.status
+                    and self._usable(job)):
+                adopted = job
+            else:
+                self._drop(job)
+        if adopted is None:
+            return None
+
+        if adopted.state != DONE:
+            # Conditional, in case a dispatcher is finishing the job right now
+            switched = self.job_model.query.filter(
+                self.job_model.id == adopted.id,
+                self.job_model.kind == KIND_SPECULATIVE,
+                self.job_model.state.in_([QUEUED, RUNNING])
+            ).update({'kind': KIND_FINAL}, synchronize_session=False)
+            self.db.session.refresh(adopted)
+            if switched:
+                logger.info(f"Submitted draft {form_type} #{record.id} takes over render job {adopted.id}")
+                return adopted
+            if not self._usable(adopted):
+                return None
+
+        adopted.kind = KIND_FINAL
+        self._attach(adopted, record)
+        logger.info(f"Attached speculative render {adopted.pdf_path} to submitted {form_type} #{record.id}")
+        return adopted
+
+    def _finish_speculative(self, job, state, pdf_path, error, reason):
+        """
+        Keep a finished speculative render for its draft, or drop it if the
+        draft changed while it rendered.
+
+        Returns:
+            bool: False if the draft was submitted in the meantime and the job
+                  has to be finished as a real one
+        """
+        record = self.db.session.get(self.form_models[job.form_type], job.form_id)
+        still_current = record is not None and job.content_hash == content_hash(record)
+        job_filter = self.job_model.query.filter_by(id=job.id, kind=KIND_SPECULATIVE)
+
+        if state == DONE and not still_current:
+            description = f"{job.id} ({job.form_type} #{job.form_id})"
+            if not job_filter.delete(synchronize_session=False):
+                return False
+            self.db.session.commit()
+            if pdf_path:
+                storage.delete(pdf_path)
+            logger.info(f"Dropped stale speculative render job {description}")
+            return True
+
+        kept = job_filter.update({
+            'state': state,
+            'pdf_path': pdf_path,
+            'error': error,
+            'failure_reason': reason,
+            'finished_at': datetime.utcnow()
+        }, synchronize_session=False)
+        self.db.session.commit()
+        if not kept:
+            self.db.session.refresh(job)
+            return False
+        logger.info(f"Speculative render job {job.id} finished: {state}")
+        return True
+
+    # -------------------------------
+    # Consumer side (dispatcher)
+    # -------------------------------
+
+    def ensure_started(self):
+        """Start the dispatcher thread in this process if it is not running yet"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self.run_forever, name='render-dispatcher', daemon=True)
+            self._thread.start()
+            logger.info(f"Started render dispatcher with {self.pool_size} worker process(es)")
+
+    def run_forever(self):
+        """Dispatch queued jobs until the process exits"""
+        # Build the LaTeX formats once before the workers start compiling
+        try:
+            import latex_formats
+            latex_formats.warm_formats()
+        except Exception as e:
+            logger.error(f"Error warming LaTeX formats: {str(e)}")
+
+        # Hand jobs to the pre-forked renderer pool when it is running (see
+        # render_pool.py); otherwise render in processes of our own
+        import render_pool
+        if render_pool.available():
+            self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix='render')
+            self._render = render_pool.render_snapshot
+            logger.info(f"Render dispatcher using the renderer pool at {render_pool.SOCKET_PATH}")
+        else:
+            self._executor = ProcessPoolExecutor(max_workers=self.pool_size)
+
+        # Sweep for jobs orphaned by a dead worker or dispatcher at start and
+        # then every half timeout, so they don't wait for the next restart
+        sweep_every = self.stale_after.total_seconds() / 2
+        next_sweep = 0
+
+        while True:
+            try:
+                with self.app.app_context():
+                    if time.monotonic() >= next_sweep:
+                        next_sweep = time.monotonic() + sweep_every
+                        self._requeue_stale_jobs()
+                    self._collect_finished()
+                    self._claim_and_submit()
+            except Exception as e:
+                logger.error(f"Render dispatcher error: {str(e)}")
+                import traceback
+                logger.error(traceback.format_exc())
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _requeue_stale_jobs(self):
+        """Put back jobs left 'running' by a worker that died mid-render"""
+        cutoff = datetime.utcnow() - self.stale_after
+        query = self.job_model.query.filter(
+            self.job_model.state == RUNNING,
+            self.job_model.started_at < cutoff
+        )
+        # Our own renders are still being waited on, however long they take
+        if self._in_flight:
+            query = query.filter(self.job_model.id.notin_(list(self._in_flight)))
+        stale = query.all()
+        for job in stale:
+            logger.warning(f"Requeueing stale render job {job.id}")
+            job.state = QUEUED
+        if stale:
+            self.db.session.commit()
+
+    def _claim_and_submit(self):
+        free_slots = self.pool_size - len(self._in_flight)
+        if free_slots <= 0:
+            return
+
+        # Form types whose template is circuit-broken (shared with every
+        # worker and dispatcher, see latex_limits)
+        paused = latex_limits.paused_templates()
+
+        query = self.job_model.query.filter_by(state=QUEUED)
+        if paused:
+            query = query.filter(self.job_model.form_type.notin_(paused))
+        # Real renders go ahead of speculative ones
+        candidates = query.order_by(self.job_model.kind == KIND_SPECULATIVE,
+                                    self.job_model.created_at).limit(free_slots).all()
+
+        for job in candidates:
+            # Claim atomically so several dispatchers can share the same table
+            claimed = self.job_model.query.filter_by(id=job.id, state=QUEUED).update({
+                'state': RUNNING,
+                'started_at': datetime.utcnow(),
+                'attempts': self.job_model.attempts + 1
+            }, synchronize_session=False)
+            self.db.session.commit()
+            if not claimed:
+                continue
+
+            record = self.db.session.get(self.form_models[job.form_type], job.form_id)
+            if record is None:
+                self._finish(job.id, FAILED, error='Request no longer exists')
+                continue
+
+            if job.kind == KIND_SPECULATIVE and job.content_hash != content_hash(record):
+                # The draft changed after it was queued; don't spend a render on it
+                self.job_model.query.filter_by(id=job.id, kind=KIND_SPECULATIVE).delete(synchronize_session=False)
+                self.db.session.commit()
+                continue
+
+            approvers = self.approver_names(record) if self.approver_names else None
+            snapshot = snapshot_request(record, status=job.form_status, approvers=approvers)
+            future = self._executor.submit(self._render, job.form_type, snapshot)
+            future.add_done_callback(lambda _f: self._wakeup.set())
+            self._in_flight[job.id] = future
+            logger.info(f"Submitted render job {job.id} ({job.form_type} #{job.form_id}, {job.form_status})")
+
+    def _collect_finished(self):
+        for job_id, future in list(self._in_flight.items()):
+            if not future.done():
+                continue
+            del self._in_flight[job_id]
+
+            try:
+                pdf_path = future.result()
+            except latex_limits.CompileFailure as e:
+                self._compile_failed(job_id, e)
+                continue
+            except Exception as e:
+                logger.error(f"Render job {job_id} raised: {str(e)}")
+                self._retry_or_fail(job_id, str(e))
+                continue
+
+            if pdf_path and os.path.exists(pdf_path):
+                self._finish(job_id, DONE, pdf_path=pdf_path)
+            else:
+                self._retry_or_fail(job_id, 'Renderer did not produce a PDF')
+
+    def _compile_failed(self, job_id, failure):
+        """Record why LaTeX failed; only failures that may pass next time are retried"""
+        job = self.db.session.get(self.job_model, job_id)
+        error = json.dumps(failure.failure)
+        logger.error(f"Render job {job_id} failed: {failure}")
+
+        if failure.reason == latex_limits.REASON_CIRCUIT_OPEN:
+            # Not the job's fault: requeue it without counting the attempt; the
+            # form type is held back until the breaker lets a trial through
+            job.state = QUEUED
+            job.attempts = max((job.attempts or 1) - 1, 0)
+            job.error = error
+            job.failure_reason = failure.reason
+            self.db.session.commit()
+        elif failure.permanent:
+            self._finish(job_id, FAILED, error=error, reason=failure.reason)
+        else:
+            self._retry_or_fail(job_id, error, reason=failure.reason)
+
+    def _retry_or_fail(self, job_id, error, reason=None):
+        job = self.db.session.get(self.job_model, job_id)
+        if job.attempts < self.max_attempts:
+            job.state = QUEUED
+            job.error = error
+            job.failure_reason = reason
+            self.db.session.commit()
+        else:
+            self._finish(job_id, FAILED, error=error, reason=reason)
+
+    def _finish(self, job_id, state, pdf_path=None, error=None, reason=None):
+        job = self.db.session.get(self.job_model, job_id)
+        if job.kind == KIND_SPECULATIVE and self._finish_speculative(job, state, pdf_path, error, reason):
+            return
+
+        job.state = state
+        job.pdf_path = pdf_path
+        job.error = error
+        job.failure_reason = reason
+        job.finished_at = datetime.utcnow()
+
+        record = None
+        if pdf_path:
+            record = self.db.session.get(self.form_models[job.form_type], job.form_id)
+            self._attach(job, record)
+
+        self.db.session.commit()
+        logger.info(f"Render job {job_id} finished: {state}")
+
+        if record is not None and self.build_packets and self.artifact_model is not None:
+            self._build_packet(job.form_type, record)
+
+    def _build_packet(self, form_type, record):
+        """Build the merged packet PDF of a request with documentation ahead of its first download"""
+        if not getattr(record, 'documentation_files', None):
+            return
+        from packets import packet_pdf
+        try:
+            packet_pdf(self.artifact_model, form_type, record)
+        except Exception as e:
+            logger.error(f"Could not build the packet of {form_type} #{record.id}: {str(e)}")
+
+    def _attach(self, job, record):
+        """Add a job's PDF to its request and the artifact index. The caller commits."""
+        if record is not None:
+            record_pdf(job.form_type, record, job.pdf_path)
+        if self.artifact_model is not None:
+            from artifacts import register_artifact, KIND_PDF
+            register_artifact(self.db.session, self.artifact_model, job.form_type, job.form_id,
+                              KIND_PDF, job.pdf_path, status=job.form_status)
+
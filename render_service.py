@@ -0,0 +1,202 @@
+"""
+Standalone render service.
+
+Runs the form renderers (LaTeX toolchain, templates, renderer pool) behind a
+small HTTP API so web nodes don't need TeX Live and render capacity can be
+scaled on its own. Web nodes reach it through render_client.py by setting
+RENDER_SERVICE_URL.
+
+    POST /render               {"form_type", "fields", "files", "backend", "store"}
+                               -> PDF bytes, or {"artifact_id", "size"} when store is true
+                               -> 422 {"failure": {...}} when LaTeX fails
+    GET  /artifacts/<id>       a PDF kept with "store": true
+    GET  /health               toolchain and pool status
+
+Start it next to a renderer pool, which does the actual compiling:
+
+    python render_pool.py &
+    python render_service.py [--host 0.0.0.0] [--port 8000]
+
+Requests must carry "Authorization: Bearer $RENDER_SERVICE_TOKEN" when a
+token is set. Stored PDFs are kept through storage.py: with STORAGE_BACKEND=s3
+any instance can answer /artifacts/<id>; with the local backend they stay on
+the instance that rendered them, so run a single instance (or share
+RENDER_SERVICE_STORE between them). Each instance removes the stored PDFs it
+rendered once they expire; a lifecycle rule on the bucket covers instances
+that went away.
+"""
+import os
+import re
+import hmac
+import time
+import base64
+import shutil
+import logging
+import argparse
+import tempfile
+
+from flask import Flask, request, jsonify, abort
+from werkzeug.utils import secure_filename
+
+import storage
+import latex_limits
+import render_pool
+from render_client import FILE_MARKER, IMAGE_FIELDS
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+TOKEN = os.environ.get('RENDER_SERVICE_TOKEN', '')
+# PDFs rendered with "store": true, named by their SHA-256
+STORE_DIR = os.environ.get('RENDER_SERVICE_STORE', os.path.join(BASE_DIR, 'instance', 'render_service'))
+# Stored PDFs are removed after this many seconds
+STORE_TTL = float(os.environ.get('RENDER_SERVICE_STORE_TTL', 24 * 3600))
+
+ARTIFACT_ID = re.compile(r'^[0-9a-f]{64}$')
+
+app = Flask(__name__)
+# Field values plus attached signature images
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('RENDER_SERVICE_MAX_MB', 20)) * 1024 * 1024
+
+
+@app.before_request
+def check_token():
+    if request.endpoint == 'health' or not TOKEN:
+        return None
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {TOKEN}".encode('utf-8')):
+        abort(401)
+    return None
+
+
+def _unpack_file(value, files, directory):
+    if isinstance(value, dict) and set(value) == {FILE_MARKER}:
+        name = value[FILE_MARKER]
+        if name not in files:
+            raise ValueError(f"Missing attached file {name}")
+        path = os.path.join(directory, secure_filename(name) or 'file')
+        with open(path, 'wb') as f:
+            f.write(base64.b64decode(files[name]))
+        return path
+    if isinstance(value, str) and (os.path.isabs(value) or value.startswith('~') or '..' in value.replace('\\', '/').split('/')):
+        # Only attached files are read; never a path on this host
+        raise ValueError("Image fields must be attached files, not paths")
+    return value
+
+
+def unpack_files(fields, files, directory):
+    """Write the attached signature images into directory and put their paths back into the field values"""
+    unpacked = dict(fields)
+    for field in IMAGE_FIELDS:
+        value = unpacked.get(field)
+        if isinstance(value, dict) and set(value) != {FILE_MARKER}:
+            if value.get('image'):
+                unpacked[field] = dict(value, image=_unpack_file(value['image'], files, directory))
+        elif value:
+            unpacked[field] = _unpack_file(value, files, directory)
+    return unpacked
+
+
+def _store(pdf_path):
+    """Keep a rendered PDF under its checksum and drop expired ones. Returns the artifact ID."""
+    from artifacts import file_sha256
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    artifact_id = file_sha256(pdf_path)
+    stored_path = os.path.join(STORE_DIR, f"{artifact_id}.pdf")
+    shutil.move(pdf_path, stored_path)
+    storage.publish(stored_path)
+
+    cutoff = time.time() - STORE_TTL
+    for name in os.listdir(STORE_DIR):
+        path = os.path.join(STORE_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                storage.delete(path)
+        except OSError:
+            pass
+    return artifact_id
+
+
+@app.route('/render', methods=['POST'])
+def render():
+    from form_renderers import RENDERERS, BACKENDS
+
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get('fields'), dict):
+        return jsonify(error="Expected a JSON object with form_type and fields"), 400
+    form_type = payload.get('form_type')
+    backend = payload.get('backend') or 'latex'
+    if form_type not in RENDERERS:
+        return jsonify(error=f"Unknown form type: {form_type}"), 404
+    if backend not in BACKENDS:
+        return jsonify(error=f"Unknown backend: {backend}"), 400
+
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory(prefix='render-service-') as scratch:
+        try:
+            fields = unpack_files(payload['fields'], payload.get('files') or {}, scratch)
+        except (ValueError, TypeError) as e:
+            return jsonify(error=str(e)), 400
+
+        pdf_path = os.path.join(scratch, f"{form_type}.pdf")
+        try:
+            result = render_pool.call('render_prepared', form_type, fields, pdf_path, backend=backend)
+        except latex_limits.CompileFailure as e:
+            return jsonify(failure=e.failure), 422
+        except RuntimeError as e:
+            # Renderer pool stopped answering
+            logger.error(f"Render of {form_type} failed: {str(e)}")
+            return jsonify(error=str(e)), 503
+        if not result or not os.path.exists(result):
+            return jsonify(error=f"No PDF was produced for {form_type}"), 500
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"Rendered {form_type} with {backend} in {elapsed * 1000:.1f} ms")
+
+        if payload.get('store'):
+            size = os.path.getsize(result)
+            return jsonify(artifact_id=_store(result), size=size)
+
+        with open(result, 'rb') as f:
+            response = app.response_class(f.read(), mimetype='application/pdf')
+    response.headers['X-Render-Time'] = f"{elapsed:.3f}"
+    return response
+
+
+@app.route('/artifacts/<artifact_id>')
+def artifact(artifact_id):
+    path = os.path.join(STORE_DIR, f"{artifact_id}.pdf")
+    if not ARTIFACT_ID.match(artifact_id) or not storage.exists(path):
+        abort(404)
+    return storage.send(path, etag=artifact_id, as_attachment=False, mimetype='application/pdf')
+
+
+@app.route('/health')
+def health():
+    from latex_runner import find_pdflatex
+    from form_renderers import RENDERERS, render_metrics
+
+    return jsonify(
+        status='ok',
+        pdflatex=bool(find_pdflatex()),
+        pool=render_pool.available(),
+        forms=sorted(RENDERERS),
+        breakers=latex_limits.breaker_status(),
+        metrics=render_metrics(),
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the HTTP render service')
+    parser.add_argument('--host', default=os.environ.get('RENDER_SERVICE_HOST', '127.0.0.1'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('RENDER_SERVICE_PORT', 8000)))
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    os.chdir(BASE_DIR)
+    if not render_pool.available():
+        logger.warning("No renderer pool is listening; renders will run inside the service")
+        render_pool.warm_up()
+    app.run(host=args.host, port=args.port, threaded=True)
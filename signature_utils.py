@@ -0,0 +1,184 @@
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+SIGNATURES_DIR = os.path.join(BASE_DIR, 'static', 'uploads', 'signatures')
+
+# Signatures are printed 5cm wide; 600px is ~300dpi at that size
+MAX_WIDTH = int(os.environ.get('SIGNATURE_MAX_WIDTH', 600))
+MAX_HEIGHT = int(os.environ.get('SIGNATURE_MAX_HEIGHT', 240))
+
+# Pixels darker than this count as ink when cropping
+INK_THRESHOLD = 235
+CROP_MARGIN = 8
+
+# Suffix of the normalized copy kept next to the original
+DERIVATIVE_SUFFIX = '_print.png'
+
+# Signature uploads main.py accepts
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif')
+
+_pool = None
+_pool_lock = threading.Lock()
+_pending = {}
+
+
+def is_derivative(path):
+    return os.path.basename(path).endswith(DERIVATIVE_SUFFIX)
+
+
+def derivative_path(path):
+    """Path of the normalized copy of a signature image"""
+    stem = os.path.splitext(path)[0]
+    return stem + DERIVATIVE_SUFFIX
+
+
+def _is_fresh(original, derivative):
+    try:
+        return os.path.getmtime(derivative) >= os.path.getmtime(original)
+    except OSError:
+        return False
+
+
+def normalize_signature(path):
+    """
+    Write a print-ready copy of a signature image: white background, cropped
+    to the ink, at most MAX_WIDTH x MAX_HEIGHT, 8-bit grayscale PNG.
+
+    Args:
+        path: Path of the uploaded or drawn signature
+
+    Returns:
+        str: Path of the normalized copy, or None if the image can't be read
+    """
+    if not path or is_derivative(path) or not os.path.isfile(path):
+        return None
+
+    output = derivative_path(path)
+    if _is_fresh(path, output):
+        return output
+
+    try:
+        from PIL import Image, ImageOps
+
+        with Image.open(path) as source:
+            image = ImageOps.exif_transpose(source)
+
+            # Flatten transparency (draw pad PNGs) onto white
+            if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+                image = image.convert('RGBA')
+                background = Image.new('RGBA', image.size, (255, 255, 255, 255))
+                image = Image.alpha_composite(background, image)
+            image = image.convert('L')
+
+        # Crop to the ink plus a small margin
+        ink = image.point(lambda value: 255 if value < INK_THRESHOLD else 0)
+        box = ink.getbbox()
+        if box:
+            left, top, right, bottom = box
+            image = image.crop((max(left - CROP_MARGIN, 0), max(top - CROP_MARGIN, 0),
+                                min(right + CROP_MARGIN, image.width), min(bottom + CROP_MARGIN, image.height)))
+
+        image.thumbnail((MAX_WIDTH, MAX_HEIGHT), Image.LANCZOS)
+
+        partial = output + '.part'
+        image.save(partial, 'PNG', optimize=True)
+        os.replace(partial, output)
+    except Exception as e:
+        logger.error(f"Could not normalize signature {path}: {str(e)}")
+        return None
+
+    logger.info(f"Normalized signature {path} ({os.path.getsize(path)} -> {os.path.getsize(output)} bytes)")
+    return output
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=int(os.environ.get('SIGNATURE_WORKERS', 2)),
+                                       thread_name_prefix='signature')
+        return _pool
+
+
+def _run(path):
+    try:
+        return normalize_signature(path)
+    finally:
+        with _pool_lock:
+            _pending.pop(path, None)
+
+
+def normalize_async(path):
+    """
+    Queue a newly saved signature for normalization so the request that
+    uploaded it doesn't wait on Pillow.
+
+    Returns:
+        Future: The pending normalization, or None if there is nothing to do
+    """
+    if not path or is_derivative(path) or not os.path.isfile(path):
+        return None
+    path = os.path.abspath(path)
+    pool = _executor()
+    with _pool_lock:
+        future = _pending.get(path)
+        if future is None:
+            future = _pending[path] = pool.submit(_run, path)
+    return future
+
+
+def print_signature(path):
+    """
+    The file to embed for a signature image: the normalized copy, made now
+    if the pool hasn't got to it yet. Falls back to the original when the
+    image can't be normalized, and returns anything that isn't an image
+    file unchanged. Images uploaded on another node are fetched first.
+    """
+    if not path or not isinstance(path, str) or is_derivative(path):
+        return path
+    if not os.path.isfile(path):
+        from storage import fetch
+        fetched = fetch(path) if path.lower().endswith(IMAGE_EXTENSIONS) else None
+        if not fetched:
+            return path
+        path = fetched
+
+    with _pool_lock:
+        future = _pending.get(os.path.abspath(path))
+    if future is not None:
+        future.result()
+
+    return normalize_signature(path) or path
+
+
+def backfill_signatures(directory=SIGNATURES_DIR):
+    """
+    Normalize every signature image in a directory that has no fresh
+    normalized copy yet.
+
+    Returns:
+        dict: Counts of 'normalized', 'skipped' and 'failed' images
+    """
+    counts = {'normalized': 0, 'skipped': 0, 'failed': 0}
+    if not os.path.isdir(directory):
+        return counts
+
+    from storage_layout import list_files
+
+    for relative in list_files(directory):
+        name = os.path.basename(relative)
+        path = os.path.join(directory, relative)
+        if is_derivative(name) or name.endswith('.part') or not os.path.isfile(path):
+            continue
+        if _is_fresh(path, derivative_path(path)):
+            counts['skipped'] += 1
+        elif normalize_signature(path):
+            counts['normalized'] += 1
+        else:
+            counts['failed'] += 1
+    return counts
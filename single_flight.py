@@ -0,0 +1,129 @@
+"""
+Single-flight execution of expensive work such as regenerating a missing PDF.
+
+When several requests need the same result at once (two admins opening the
+same request, a double-click), only one of them does the work:
+
+- threads of one process wait on the first caller's flight and get its result
+- other processes wait on a file lock; once they hold it they call check(),
+  which finds the result the first process stored, and only do the work
+  themselves if there is still nothing there
+
+    pdf_path = single_flight.run(('ferpa', request.id, request.status), regenerate, check=existing_pdf)
+"""
+import os
+import time
+import zlib
+import logging
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: threads of one process are still coalesced
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+LOCK_DIR = os.environ.get('SINGLE_FLIGHT_LOCK_DIR', os.path.join(BASE_DIR, 'instance', 'locks'))
+# Keys are spread over this many lock files, so the directory doesn't grow
+LOCK_STRIPES = 256
+# Longest wait for another caller's work before doing it anyway
+TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 180))
+
+_flights = {}
+_flights_lock = threading.Lock()
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _lock_path(key):
+    stripe = zlib.crc32(repr(key).encode('utf-8')) % LOCK_STRIPES
+    return os.path.join(LOCK_DIR, f"flight-{stripe:03d}.lock")
+
+
+def _acquire(path, timeout):
+    """Open and flock a lock file, polling until timeout. Returns the file, or None."""
+    if fcntl is None:
+        return None
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    handle = open(path, 'a')
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    while True:
+        try:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return handle
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                handle.close()
+                return None
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+def _release(handle):
+    if handle is not None:
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        handle.close()
+
+
+def run(key, produce, check=None, timeout=TIMEOUT):
+    """
+    Call produce() at most once at a time for a key, across threads and
+    processes, and hand its result to every concurrent caller.
+
+    Args:
+        key: Hashable identifier of the work, e.g. (form_type, form_id, status)
+        produce: Function doing the work; its result is shared
+        check: Optional function returning the stored result of work another
+               process finished while we waited (None if there is none)
+        timeout: Seconds to wait for another caller before doing the work anyway
+
+    Returns:
+        The result of produce() (or of check())
+
+    Raises:
+        Whatever produce() raised, in every caller waiting on it
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+
+    if not leader:
+        # Another thread of this process is on it
+        if flight.done.wait(timeout):
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        logger.warning(f"Gave up waiting for {key} after {timeout:.0f}s, running it here")
+        return produce()
+
+    try:
+        handle = _acquire(_lock_path(key), timeout)
+        if handle is None and fcntl is not None:
+            logger.warning(f"Could not lock {key} within {timeout:.0f}s, running it anyway")
+        try:
+            result = check() if check else None
+            if result is None:
+                result = produce()
+            else:
+                logger.info(f"Reusing the result of a concurrent run for {key}")
+        finally:
+            _release(handle)
+        flight.result = result
+        return result
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _flights_lock:
+            _flights.pop(key, None)
+        flight.done.set()
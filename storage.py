@@ -0,0 +1,560 @@
+"""
+Where stored files are kept: local disk or an S3-compatible object store.
+
+Every upload, render and download goes through this module. Files are
+identified by their path relative to the app directory, as kept in the
+artifact index (e.g. 'static/pdfs/3f/a9/medical_withdrawal_12_...pdf').
+
+STORAGE_BACKEND=local (default) keeps files under static/ only.
+
+STORAGE_BACKEND=s3 (needs boto3, see requirements-s3.txt) also puts every
+file in a bucket so any web node can serve what another one rendered or
+received. Local files then act as a per-node cache that is filled from the
+bucket when a file is needed on disk (rendering, stamping, packets).
+Uploads are streamed to the bucket in multipart chunks, and downloads are
+redirects to presigned URLs (S3_PRESIGN=1, default) or streamed through
+the app (S3_PRESIGN=0).
+Names are collision-free (see storage_layout), so a key never comes to
+name another file and a key found in the bucket is trusted for
+S3_EXISTS_TTL seconds (the janitor and clean-storage delete keys from any
+node, so not for longer).
+
+When the store can't be reached or refuses a request, requests are not
+failed: the local copy is kept and served, and files that could not be
+uploaded are listed in STORAGE_PENDING_FILE until `flask publish-storage`
+(on the same node) uploads them.
+
+    S3_BUCKET          bucket name
+    S3_ENDPOINT_URL    e.g. http://minio:9000 for MinIO (unset for AWS)
+    S3_PUBLIC_URL      endpoint browsers reach for presigned URLs, when
+                       different from S3_ENDPOINT_URL
+    S3_PREFIX          key prefix inside the bucket
+    S3_EXISTS_TTL      seconds a key found in the bucket is not looked up
+                       again (default 60)
+    AWS_ACCESS_KEY_ID / AWS_SECRET_ACCESS_KEY / AWS_DEFAULT_REGION
+
+    storage.publish(pdf_path)          # after writing a file locally
+    storage.save_upload(file, path)    # an uploaded werkzeug FileStorage
+    return storage.send(artifact.path, etag=artifact.sha256)
+"""
+import os
+import shutil
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from storage_layout import BASE_DIR
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+
+S3_BUCKET = os.environ.get('S3_BUCKET', '')
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
+S3_PUBLIC_URL = os.environ.get('S3_PUBLIC_URL') or None
+S3_PREFIX = os.environ.get('S3_PREFIX', '').strip('/')
+S3_PRESIGN = os.environ.get('S3_PRESIGN', '1') == '1'
+# Lifetime of presigned download URLs, in seconds
+S3_URL_EXPIRES = int(os.environ.get('S3_URL_EXPIRES', 300))
+# Files larger than this are uploaded in parts of this size
+MULTIPART_CHUNK = int(os.environ.get('S3_MULTIPART_MB', 8)) * 1024 * 1024
+# Connections kept open to the store, per process
+POOL_SIZE = int(os.environ.get('S3_POOL_SIZE', 10))
+
+# Keys of local files that could not be uploaded, one per line, for publish-storage
+PENDING_FILE = os.environ.get('STORAGE_PENDING_FILE', os.path.join(BASE_DIR, 'instance', 'storage_pending.txt'))
+
+# Bytes per chunk when streaming a download through the app
+STREAM_CHUNK = 256 * 1024
+# Keys known to exist in the bucket, and for how long that is trusted
+EXISTS_CACHE_SIZE = 4096
+EXISTS_TTL = float(os.environ.get('S3_EXISTS_TTL', 60))
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def storage_key(path):
+    """
+    Key of a stored file: its path relative to the app directory, with
+    forward slashes. None for files outside the app directory (rows from
+    another checkout), which only exist on local disk.
+    """
+    if not path:
+        return None
+    path = path.replace('\\', '/')
+    absolute = path if os.path.isabs(path) else os.path.join(BASE_DIR, path)
+    absolute = os.path.abspath(absolute)
+    if not absolute.startswith(BASE_DIR + os.sep):
+        return None
+    return os.path.relpath(absolute, BASE_DIR).replace(os.sep, '/')
+
+
+def local_path(path):
+    """Absolute local path of a stored file (its cache location for the S3 backend)"""
+    key = storage_key(path)
+    if key is None:
+        return os.path.abspath(path)
+    return os.path.join(BASE_DIR, *key.split('/'))
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _store_errors():
+    """Exceptions raised when the object store can't be reached or refuses a request"""
+    from boto3.exceptions import Boto3Error
+    from botocore.exceptions import BotoCoreError, ClientError
+    return (Boto3Error, BotoCoreError, ClientError)
+
+
+def _not_found(error):
+    from botocore.exceptions import ClientError
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+
+def _locked(mode):
+    """Open PENDING_FILE with an exclusive lock (released on close)"""
+    os.makedirs(os.path.dirname(PENDING_FILE), exist_ok=True)
+    handle = open(PENDING_FILE, mode)
+    if fcntl is not None:
+        fcntl.flock(handle, fcntl.LOCK_EX)
+    return handle
+
+
+def mark_pending(key):
+    """Remember a local file to upload on the next publish-storage run"""
+    try:
+        with _locked('a') as f:
+            f.write(key + '\n')
+    except OSError as e:
+        logger.error(f"Could not record {key} as pending upload: {str(e)}")
+
+
+def take_pending():
+    """Keys of the files waiting for upload, clearing the list"""
+    if not os.path.exists(PENDING_FILE):
+        return []
+    with _locked('r+') as f:
+        keys = [line.strip() for line in f if line.strip()]
+        f.seek(0)
+        f.truncate()
+    return list(dict.fromkeys(keys))
+
+
+class LocalStorage:
+    """Files under static/ on this machine only"""
+
+    name = 'local'
+
+    def publish(self, path):
+        return path
+
+    def save_upload(self, file, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        file.save(path)
+        return path
+
+    def stored(self, path):
+        """Whether every node can get the file"""
+        return os.path.isfile(local_path(path))
+
+    def exists(self, path):
+        return os.path.isfile(local_path(path))
+
+    def fetch(self, path):
+        path = local_path(path)
+        return path if os.path.isfile(path) else None
+
+    def describe(self, path):
+        """(size, sha256) of a stored file, or None if it doesn't exist"""
+        path = local_path(path)
+        if not os.path.isfile(path):
+            return None
+        return os.path.getsize(path), file_sha256(path)
+
+    def delete(self, path):
+        path = local_path(path)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def send(self, path, etag=None, download_name=None, as_attachment=None, mimetype=None):
+        from file_serving import send_download
+        return send_download(local_path(path), etag=etag, download_name=download_name,
+                             as_attachment=as_attachment, mimetype=mimetype)
+
+
+class _TeeReader:
+    """File object that copies what is read from it into a local file"""
+
+    def __init__(self, source, copy):
+        self.source = source
+        self.copy = copy
+
+    def read(self, size=-1):
+        data = self.source.read(size)
+        self.copy.write(data)
+        return data
+
+
+class S3Storage(LocalStorage):
+    """Files in an S3-compatible bucket, cached on local disk"""
+
+    name = 's3'
+
+    def __init__(self, bucket=S3_BUCKET, endpoint_url=S3_ENDPOINT_URL, public_url=S3_PUBLIC_URL, prefix=S3_PREFIX):
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        try:
+            import boto3  # noqa: F401
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 needs boto3 (pip install -r requirements-s3.txt)")
+        self.bucket = bucket
+        self.endpoint_url = endpoint_url
+        self.public_url = public_url
+        self.prefix = prefix
+        self._clients = {}
+        self._clients_pid = None
+        self._clients_lock = threading.Lock()
+        self._known = OrderedDict()
+        self._known_lock = threading.Lock()
+
+    def _client(self, public=False):
+        """boto3 client of this process (rebuilt after a fork); public signs URLs for browsers"""
+        with self._clients_lock:
+            if self._clients_pid != os.getpid():
+                self._clients, self._clients_pid = {}, os.getpid()
+            endpoint_url = (self.public_url or self.endpoint_url) if public else self.endpoint_url
+            if endpoint_url not in self._clients:
+                import boto3
+                from botocore.config import Config
+
+                config = Config(max_pool_connections=POOL_SIZE, retries={'max_attempts': 3, 'mode': 'standard'},
+                                s3={'addressing_style': 'path' if endpoint_url else 'auto'})
+                self._clients[endpoint_url] = boto3.session.Session().client(
+                    's3', endpoint_url=endpoint_url, config=config)
+            return self._clients[endpoint_url]
+
+    def _transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(multipart_threshold=MULTIPART_CHUNK, multipart_chunksize=MULTIPART_CHUNK)
+
+    def object_key(self, path):
+        key = storage_key(path)
+        if key is None:
+            return None
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def _remember(self, key):
+        with self._known_lock:
+            self._known[key] = time.monotonic() + EXISTS_TTL
+            self._known.move_to_end(key)
+            while len(self._known) > EXISTS_CACHE_SIZE:
+                self._known.popitem(last=False)
+
+    def _is_known(self, key):
+        """Whether key was found in the bucket less than EXISTS_TTL ago"""
+        with self._known_lock:
+            expires = self._known.get(key)
+            if expires is not None and expires < time.monotonic():
+                del self._known[key]
+                expires = None
+            return expires is not None
+
+    def _forget(self, key):
+        with self._known_lock:
+            self._known.pop(key, None)
+
+    def upload(self, path):
+        """Upload a file written locally (multipart above MULTIPART_CHUNK); raises the store's errors"""
+        key = self.object_key(path)
+        source = local_path(path)
+        # Kept with the object so other nodes can index it without downloading it (see describe())
+        self._client().upload_file(source, self.bucket, key, ExtraArgs={'Metadata': {'sha256': file_sha256(source)}},
+                                   Config=self._transfer_config())
+        self._remember(key)
+
+    def publish(self, path):
+        """Upload a file written locally, or keep it for publish-storage if that fails. Returns path."""
+        key = self.object_key(path) if path else None
+        if key is None or not os.path.isfile(local_path(path)):
+            if path:
+                logger.warning(f"Not uploading {path}: not a file inside the app directory")
+            return path
+        try:
+            self.upload(path)
+        except _store_errors() as e:
+            logger.error(f"Could not upload {key}, keeping the local copy for publish-storage: {str(e)}")
+            mark_pending(key)
+        return path
+
+    def save_upload(self, file, path):
+        """
+        Stream an upload to the bucket in multipart chunks, keeping a local
+        copy written as the chunks go out. Returns path.
+        """
+        key = self.object_key(path)
+        if key is None:
+            return super().save_upload(file, path)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        partial_path = f"{path}.{os.getpid()}.part"
+        extra_args = {'ContentType': file.mimetype} if file.mimetype else None
+        uploaded = False
+        try:
+            with open(partial_path, 'wb') as copy:
+                try:
+                    self._client().upload_fileobj(_TeeReader(file.stream, copy), self.bucket, key,
+                                                  ExtraArgs=extra_args, Config=self._transfer_config())
+                    uploaded = True
+                except _store_errors() as e:
+                    logger.error(f"Could not upload {key}, keeping the local copy for publish-storage: {str(e)}")
+                    # The copy has what was read so far; finish it from the rest of the upload
+                    shutil.copyfileobj(file.stream, copy)
+            os.replace(partial_path, path)
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        if uploaded:
+            self._remember(key)
+        else:
+            mark_pending(key)
+        return path
+
+    def stored(self, path):
+        """Whether the file is in the bucket; False (logged) when the store can't be asked"""
+        key = self.object_key(path)
+        if key is None:
+            return False
+        if self._is_known(key):
+            return True
+        try:
+            self._client().head_object(Bucket=self.bucket, Key=key)
+        except _store_errors() as e:
+            if not _not_found(e):
+                logger.error(f"Could not look up {key} in the store: {str(e)}")
+            return False
+        self._remember(key)
+        return True
+
+    def exists(self, path):
+        return super().exists(path) or self.stored(path)
+
+    def describe(self, path):
+        """
+        (size, sha256) of a stored file from its local copy, or else from the
+        object's metadata (sha256 is None for objects stored without it, such
+        as streamed uploads). None if it doesn't exist.
+        """
+        described = super().describe(path)
+        key = self.object_key(path)
+        if described or key is None:
+            return described
+        try:
+            head = self._client().head_object(Bucket=self.bucket, Key=key)
+        except _store_errors() as e:
+            if _not_found(e):
+                self._forget(key)
+            else:
+                logger.error(f"Could not look up {key} in the store: {str(e)}")
+            return None
+        self._remember(key)
+        return head['ContentLength'], head.get('Metadata', {}).get('sha256')
+
+    def fetch(self, path):
+        """Local copy of a stored file, downloaded into the cache if needed; None if it isn't stored"""
+        cached = super().fetch(path)
+        key = self.object_key(path)
+        if cached or key is None:
+            return cached
+
+        target = local_path(path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        partial_path = f"{target}.{os.getpid()}.part"
+        try:
+            self._client().download_file(self.bucket, key, partial_path, Config=self._transfer_config())
+            os.replace(partial_path, target)
+        except _store_errors() as e:
+            if _not_found(e):
+                # Deleted from another node since it was last seen
+                self._forget(key)
+            else:
+                logger.error(f"Could not download {key}: {str(e)}")
+            return None
+        finally:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        return target
+
+    def delete(self, path):
+        key = self.object_key(path)
+        if key is not None:
+            self._forget(key)
+            try:
+                self._client().delete_object(Bucket=self.bucket, Key=key)
+            except _store_errors() as e:
+                logger.error(f"Could not delete {key} from the store: {str(e)}")
+        super().delete(path)
+
+    def send(self, path, etag=None, download_name=None, as_attachment=None, mimetype=None):
+        """Redirect to a presigned URL of the object, or stream it (S3_PRESIGN=0)"""
+        import mimetypes
+        from flask import request, redirect, abort, Response
+
+        key = self.object_key(path)
+        if key is None or not self.stored(path):
+            # Not in the bucket (e.g. written before the switch to S3, or the
+            # store can't be reached): serve the local copy if there is one
+            if not super().exists(path):
+                abort(404)
+            return super().send(path, etag=etag, download_name=download_name,
+                                as_attachment=as_attachment, mimetype=mimetype)
+
+        download_name = download_name or os.path.basename(key)
+        if as_attachment is None:
+            as_attachment = request.args.get('inline') != '1'
+        mimetype = mimetype or mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+        disposition = f"{'attachment' if as_attachment else 'inline'}; filename=\"{download_name}\""
+
+        if S3_PRESIGN:
+            url = self._client(public=True).generate_presigned_url('get_object', Params={
+                'Bucket': self.bucket, 'Key': key,
+                'ResponseContentDisposition': disposition, 'ResponseContentType': mimetype,
+            }, ExpiresIn=S3_URL_EXPIRES)
+            response = redirect(url, code=302)
+            response.cache_control.private = True
+            response.cache_control.no_store = True
+            return response
+
+        if etag and request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            params = {'Bucket': self.bucket, 'Key': key}
+            if request.headers.get('Range'):
+                params['Range'] = request.headers['Range']
+            try:
+                obj = self._client().get_object(**params)
+            except _store_errors() as e:
+                logger.error(f"Could not read {key} from the store: {str(e)}")
+                if _not_found(e):
+                    self._forget(key)
+                if not super().exists(path):
+                    abort(404 if _not_found(e) else 503)
+                return super().send(path, etag=etag, download_name=download_name,
+                                    as_attachment=as_attachment, mimetype=mimetype)
+            response = Response(obj['Body'].iter_chunks(STREAM_CHUNK),
+                                status=206 if obj.get('ContentRange') else 200, mimetype=mimetype)
+            response.headers['Content-Length'] = str(obj['ContentLength'])
+            if obj.get('ContentRange'):
+                response.headers['Content-Range'] = obj['ContentRange']
+            response.headers['Content-Disposition'] = disposition
+            response.last_modified = obj.get('LastModified')
+        response.headers['Accept-Ranges'] = 'bytes'
+        if etag:
+            response.set_etag(etag)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+
+BACKENDS = {
+    'local': LocalStorage,
+    's3': S3Storage,
+}
+
+
+def backend():
+    """The configured storage backend (STORAGE_BACKEND)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND not in BACKENDS:
+                raise RuntimeError(f"Unknown STORAGE_BACKEND: {BACKEND}")
+            _backend = BACKENDS[BACKEND]()
+        return _backend
+
+
+def publish(path):
+    """Make a file written locally available to every node. Returns path."""
+    return backend().publish(path) if path else path
+
+
+def save_upload(file, path):
+    """Store an uploaded file (werkzeug FileStorage) at path. Returns path."""
+    return backend().save_upload(file, path)
+
+
+def exists(path):
+    """Whether a stored file exists"""
+    return bool(path) and backend().exists(path)
+
+
+def fetch(path):
+    """Local path of a stored file, downloading it first if needed; None if it doesn't exist"""
+    if not path:
+        return None
+    try:
+        return backend().fetch(path)
+    except Exception as e:
+        logger.error(f"Could not fetch {path}: {str(e)}")
+        return None
+
+
+def describe(path):
+    """(size, sha256) of a stored file without downloading it; None if it doesn't exist"""
+    return backend().describe(path) if path else None
+
+
+def delete(path):
+    """Remove a stored file everywhere"""
+    backend().delete(path)
+
+
+def send(path, etag=None, download_name=None, as_attachment=None, mimetype=None):
+    """Download response for a stored file (see file_serving.send_download for the local one)"""
+    return backend().send(path, etag=etag, download_name=download_name, as_attachment=as_attachment,
+                          mimetype=mimetype)
+
+
+def _publish_one(store, path, counts):
+    if store.stored(path):
+        counts['present'] += 1
+    elif not os.path.isfile(local_path(path)):
+        counts['missing'] += 1
+    else:
+        try:
+            store.upload(path)
+            counts['uploaded'] += 1
+        except _store_errors() as e:
+            logger.error(f"Could not upload {path}: {str(e)}")
+            mark_pending(storage_key(path))
+            counts['failed'] += 1
+
+
+def publish_existing(artifact_model):
+    """
+    Upload the files that are not in the store yet: those whose upload
+    failed (PENDING_FILE) and indexed ones, e.g. after switching to
+    STORAGE_BACKEND=s3. Safe to re-run.
+
+    Returns:
+        dict: Counts of 'uploaded', 'present', 'missing' and 'failed' files
+    """
+    counts = {'uploaded': 0, 'present': 0, 'missing': 0, 'failed': 0}
+    store = backend()
+    for key in take_pending():
+        _publish_one(store, key, counts)
+    for (path,) in artifact_model.query.with_entities(artifact_model.path).yield_per(500):
+        _publish_one(store, path, counts)
+    return counts
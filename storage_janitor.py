@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import logging
+import threading
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import storage
+from artifacts import forget_path
+from pdf_stamp import PDF_NAME
+from render_queue import GENERATED_PDFS_FORMS
+from signature_utils import derivative_path
+from storage_layout import list_files
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+STATE_PATH = os.path.join(BASE_DIR, 'instance', 'storage_janitor.json')
+
+# Directories the janitor looks after (relative to BASE_DIR), including
+# their shard subdirectories (see storage_layout). Files in static/temp are
+# scratch files only; everything else is checked against the database
+# before it is removed.
+ROOTS = [
+    os.path.join('static', 'pdfs'),
+    os.path.join('static', 'forms'),
+    os.path.join('static', 'uploads', 'signatures'),
+    os.path.join('static', 'uploads', 'documentation'),
+    os.path.join('static', 'temp'),
+]
+SCRATCH_ROOTS = {os.path.join('static', 'temp')}
+
+# pdflatex leftovers and interrupted atomic writes
+BYPRODUCT_SUFFIXES = ('.aux', '.log', '.out', '.toc', '.tex', '.synctex.gz', '.part')
+
+# Columns that hold file names or JSON lists of file paths
+REFERENCE_COLUMNS = ['generated_pdfs', 'documentation_files', 'pdf_link', 'sig_link', 'signature']
+
+
+def _file_names(value):
+    """Base names of the files referenced by one column value"""
+    if not value or not isinstance(value, str) or value.startswith('data:'):
+        return []
+    if value.startswith('['):
+        try:
+            return [os.path.basename(path) for path in json.loads(value) if isinstance(path, str)]
+        except ValueError:
+            return []
+    return [os.path.basename(value)]
+
+
+def _status_of(pdf_path):
+    match = PDF_NAME.match(os.path.basename(pdf_path))
+    return match.group('status') if match else None
+
+
+def new_report():
+    return {
+        'files_checked': 0,
+        'rows_checked': 0,
+        'byproducts': 0,
+        'orphans_found': 0,
+        'orphans_deleted': 0,
+        'superseded': 0,
+        'reclaimed_bytes': 0,
+        'orphans': [],
+    }
+
+
+def merge_reports(total, report):
+    for key, value in report.items():
+        total[key] = total[key] + value
+    return total
+
+
+class StorageJanitor:
+    """
+    Incremental cleanup of the PDF, form and upload directories.
+
+    Every pass handles at most `batch_size` files and `batch_size` request
+    rows, continuing from a cursor saved in instance/storage_janitor.json,
+    so no pass walks the whole tree. A pass:
+
+    * deletes LaTeX byproducts (.aux, .log, .tex, ...) and stale scratch files
+    * finds files no request row references anymore (deleted only when
+      JANITOR_DELETE_ORPHANS is set, otherwise reported)
+    * applies the retention policy to superseded status PDFs: for each
+      request the newest PDF of every status is kept, older ones are removed
+      once they are JANITOR_RETENTION_DAYS old
+    """
+
+    def __init__(self, app, db, form_models, job_model=None, artifact_model=None):
+        self.app = app
+        self.db = db
+        self.form_models = form_models
+        self.job_model = job_model
+        # Index rows of removed files are dropped too (see artifacts.py)
+        self.artifact_model = artifact_model
+
+        self.interval = app.config.get('JANITOR_INTERVAL', 300)
+        self.batch_size = app.config.get('JANITOR_BATCH_SIZE', 500)
+        self.retention_days = app.config.get('JANITOR_RETENTION_DAYS', 30)
+        self.delete_orphans = app.config.get('JANITOR_DELETE_ORPHANS', False)
+        # Files younger than this are left alone: they may belong to a render
+        # or upload whose row is not committed yet
+        self.byproduct_grace = app.config.get('JANITOR_BYPRODUCT_GRACE', 3600)
+        self.orphan_grace = app.config.get('JANITOR_ORPHAN_GRACE', 7 * 24 * 3600)
+
+        self._lock = threading.Lock()
+        self._thread = None
+
+    # -------------------------------
+    # Cursor
+    # -------------------------------
+
+    def _load_state(self):
+        try:
+            with open(STATE_PATH, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'root': 0, 'after': '', 'form': 0, 'after_id': 0}
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+        partial_path = f"{STATE_PATH}.{os.getpid()}.part"
+        with open(partial_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(partial_path, STATE_PATH)
+
+    # -------------------------------
+    # Passes
+    # -------------------------------
+
+    def run_pass(self, dry_run=False, delete_orphans=None, state=None):
+        """
+        Clean the next batch of files and rows.
+
+        Args:
+            dry_run: Only report what would be removed
+            delete_orphans: Override JANITOR_DELETE_ORPHANS
+            state: Cursor to continue from instead of the saved one
+
+        Returns:
+            tuple: (report, files wrapped around, rows wrapped around)
+        """
+        if delete_orphans is None:
+            delete_orphans = self.delete_orphans
+
+        lock_file = self._acquire_lock()
+        if lock_file is False:
+            logger.info("Another janitor pass is running, skipping")
+            return new_report(), False, False
+
+        try:
+            if state is None:
+                state = self._load_state()
+            report = new_report()
+            files_wrapped = self._file_pass(state, report, dry_run, delete_orphans)
+            rows_wrapped = self._retention_pass(state, report, dry_run)
+            if not dry_run:
+                self.db.session.commit()
+                self._save_state(state)
+            return report, files_wrapped, rows_wrapped
+        finally:
+            if lock_file:
+                lock_file.close()
+
+    def run_cycle(self, dry_run=False, delete_orphans=None, max_passes=10000):
+        """Run passes until every directory and row has been visited once"""
+        total = new_report()
+        # Dry runs cannot move the saved cursor, so they step a copy of it
+        state = self._load_state()
+        files_done = rows_done = False
+        for _ in range(max_passes):
+            report, files_wrapped, rows_wrapped = self.run_pass(dry_run, delete_orphans, state)
+            merge_reports(total, report)
+            if not (files_wrapped or rows_wrapped or report['files_checked'] or report['rows_checked']):
+                # Another process holds the lock
+                break
+            files_done = files_done or files_wrapped
+            rows_done = rows_done or rows_wrapped
+            if files_done and rows_done:
+                break
+        return total
+
+    def _acquire_lock(self):
+        """Hold an exclusive lock so several app processes never overlap"""
+        if fcntl is None:
+            return None
+        os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+        lock_file = open(STATE_PATH + '.lock', 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        return lock_file
+
+    def referenced_files(self):
+        """Base names of every file a request row or render job points at"""
+        names = set()
+        for model in self.form_models.values():
+            columns = [getattr(model, name) for name in REFERENCE_COLUMNS if hasattr(model, name)]
+            for row in model.query.with_entities(*columns):
+                for value in row:
+                    names.update(_file_names(value))
+
+        if self.job_model is not None:
+            for (pdf_path,) in self.job_model.query.with_entities(self.job_model.pdf_path).filter(
+                    self.job_model.pdf_path.isnot(None)):
+                names.add(os.path.basename(pdf_path))
+
+        # Normalized signature copies live as long as their original
+        names.update([derivative_path(name) for name in names])
+        return names
+
+    def _file_pass(self, state, report, dry_run, delete_orphans):
+        """Check up to batch_size files, continuing after the saved cursor"""
+        budget = self.batch_size
+        referenced = None
+        now = time.time()
+
+        while budget > 0:
+            if state['root'] >= len(ROOTS):
+                state['root'], state['after'] = 0, ''
+                return True
+
+            root = ROOTS[state['root']]
+            directory = os.path.join(BASE_DIR, root)
+            if root in SCRATCH_ROOTS:
+                try:
+                    names = sorted(name for name in os.listdir(directory) if name > state['after'])
+                except FileNotFoundError:
+                    names = []
+            else:
+                # Paths relative to the root, shard directories included
+                names = list_files(directory, after=state['after'])
+
+            batch = names[:budget]
+            for relative in batch:
+                state['after'] = relative
+                budget -= 1
+                name = os.path.basename(relative)
+                path = os.path.join(directory, relative)
+                try:
+                    info = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                if not os.path.isfile(path):
+                    continue
+                report['files_checked'] += 1
+                age = now - info.st_mtime
+
+                if root in SCRATCH_ROOTS or name.endswith(BYPRODUCT_SUFFIXES):
+                    if age > self.byproduct_grace:
+                        report['byproducts'] += 1
+                        report['reclaimed_bytes'] += self._remove(path, info.st_size, dry_run)
+                    continue
+
+                if age <= self.orphan_grace:
+                    continue
+                if referenced is None:
+                    referenced = self.referenced_files()
+                if name in referenced:
+                    continue
+
+                report['orphans_found'] += 1
+                report['orphans'].append(os.path.join(root, relative))
+                if delete_orphans:
+                    report['orphans_deleted'] += 1
+                    report['reclaimed_bytes'] += self._remove(path, info.st_size, dry_run)
+
+            if len(batch) == len(names):
+                # Finished this directory, move on to the next
+                state['root'], state['after'] = state['root'] + 1, ''
+        return False
+
+    def _retention_pass(self, state, report, dry_run):
+        """Drop superseded status PDFs from up to batch_size request rows"""
+        budget = self.batch_size
+        cutoff = time.time() - self.retention_days * 24 * 3600
+        form_types = [form_type for form_type in GENERATED_PDFS_FORMS if form_type in self.form_models]
+
+        while budget > 0:
+            if state['form'] >= len(form_types):
+                state['form'], state['after_id'] = 0, 0
+                return True
+
+            model = self.form_models[form_types[state['form']]]
+            limit = budget
+            rows = model.query.filter(model.id > state['after_id'],
+                                      model.generated_pdfs.isnot(None)).order_by(model.id).limit(limit).all()
+
+            for row in rows:
+                state['after_id'] = row.id
+                budget -= 1
+                report['rows_checked'] += 1
+                kept = self._apply_retention(row, cutoff, report, dry_run)
+                if kept is not None and not dry_run:
+                    row.generated_pdfs = json.dumps(kept)
+
+            if not dry_run:
+                self.db.session.commit()
+
+            if len(rows) < limit:
+                # Finished this form type, move on to the next
+                state['form'], state['after_id'] = state['form'] + 1, 0
+        return False
+
+    def _apply_retention(self, row, cutoff, report, dry_run):
+        """
+        Remove this request's superseded PDFs that are past retention.
+
+        Returns:
+            list: The new generated_pdfs list, or None if nothing changed
+        """
+        try:
+            pdfs = json.loads(row.generated_pdfs)
+        except ValueError:
+            return None
+
+        # The last PDF of each status in the list is the current one
+        newest = {}
+        for index, pdf_path in enumerate(pdfs):
+            newest[_status_of(pdf_path)] = index
+
+        kept = []
+        for index, pdf_path in enumerate(pdfs):
+            if _status_of(pdf_path) is None or newest[_status_of(pdf_path)] == index:
+                kept.append(pdf_path)
+                continue
+            try:
+                info = os.stat(pdf_path)
+            except OSError:
+                kept.append(pdf_path)
+                continue
+            if info.st_mtime > cutoff:
+                kept.append(pdf_path)
+                continue
+
+            report['superseded'] += 1
+            report['reclaimed_bytes'] += self._remove(pdf_path, info.st_size, dry_run)
+
+        return kept if len(kept) != len(pdfs) else None
+
+    def _remove(self, path, size, dry_run):
+        if dry_run:
+            return size
+        try:
+            # From the object store too when there is one (see storage.py)
+            storage.delete(path)
+            if self.artifact_model is not None:
+                forget_path(self.artifact_model, path)
+            logger.info(f"Janitor removed {path} ({size} bytes)")
+            return size
+        except OSError as e:
+            logger.error(f"Janitor could not remove {path}: {str(e)}")
+            return 0
+
+    # -------------------------------
+    # Background thread
+    # -------------------------------
+
+    def ensure_started(self):
+        """Start the janitor thread in this process if it is not running yet"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self.run_forever, name='storage-janitor', daemon=True)
+            self._thread.start()
+            logger.info(f"Started storage janitor (every {self.interval}s, {self.batch_size} items per pass)")
+
+    def run_forever(self):
+        """Run one pass every `interval` seconds until the process exits"""
+        while True:
+            try:
+                with self.app.app_context():
+                    report, _, _ = self.run_pass()
+                if report['reclaimed_bytes'] or report['orphans_found']:
+                    logger.info(f"Janitor pass at {datetime.utcnow().isoformat()}: {format_report(report)}")
+            except Exception as e:
+                logger.error(f"Storage janitor error: {str(e)}")
+                import traceback
+                logger.error(traceback.format_exc())
+
+            time.sleep(self.interval)
+
+
+def format_report(report):
+    """One-line summary of a janitor report"""
+    return (f"{report['files_checked']} file(s) and {report['rows_checked']} request(s) checked, "
+            f"{report['byproducts']} byproduct(s), {report['superseded']} superseded PDF(s), "
+            f"{report['orphans_found']} orphan(s) found ({report['orphans_deleted']} deleted), "
+            f"{report['reclaimed_bytes'] / (1024.0 * 1024.0):.1f} MB reclaimed")
@@ -0,0 +1,267 @@
+"""
+Where stored files go.
+
+New files get collision-free names: a random token sits next to the parts
+the app reads back (form type, request ID, status), so two uploads or
+renders in the same second can't overwrite each other. Files are spread
+over two levels of hash-prefix subdirectories so no directory grows
+without bound:
+
+    static/pdfs/3f/a9/medical_withdrawal_12_pending_20250420002424_5c1e2f7a9b0d4e6f.pdf
+    static/uploads/signatures/07/c2/sig_4_9e0c4d1b7a2f6e38.png
+
+The shard of a file is derived from its name alone, so a name is enough to
+find it again. Files from before this layout are moved into their shards
+by `flask migrate-storage` (see migrate()).
+"""
+import os
+import json
+import hashlib
+import logging
+import secrets
+
+from werkzeug.utils import secure_filename
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
+PDF_DIR = os.path.join(BASE_DIR, 'static', 'pdfs')
+FORMS_DIR = os.path.join(BASE_DIR, 'static', 'forms')
+UPLOADS_DIR = os.path.join(BASE_DIR, 'static', 'uploads')
+SIGNATURES_DIR = os.path.join(UPLOADS_DIR, 'signatures')
+DOCUMENTATION_DIR = os.path.join(UPLOADS_DIR, 'documentation')
+
+SHARDED_DIRS = [PDF_DIR, FORMS_DIR, SIGNATURES_DIR, DOCUMENTATION_DIR]
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2  # hex characters per level: 256 directories per level
+TOKEN_BYTES = 8
+
+# Suffix of normalized signature copies, which live next to their original
+# (see signature_utils.DERIVATIVE_SUFFIX)
+_DERIVATIVE_SUFFIX = '_print.png'
+
+
+def new_token():
+    """Random hex token that makes a file name unique"""
+    return secrets.token_hex(TOKEN_BYTES)
+
+
+def shard(name):
+    """Relative shard directory of a file name, e.g. '3f/a9'"""
+    if name.endswith(_DERIVATIVE_SUFFIX):
+        # A normalized signature copy goes wherever its original went;
+        # any extension maps to the same shard (see _shard_key)
+        name = name[:-len(_DERIVATIVE_SUFFIX)]
+    digest = hashlib.sha256(_shard_key(name).encode('utf-8')).hexdigest()
+    return '/'.join(digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH] for level in range(SHARD_LEVELS))
+
+
+def _shard_key(name):
+    return os.path.splitext(name)[0]
+
+
+def sharded_path(directory, name, create=True):
+    """
+    Path of a file inside its shard of directory, in the same form as
+    directory (relative stays relative).
+
+    Args:
+        directory: One of the stored file directories
+        name: File name
+        create: Create the shard directory
+    """
+    shard_dir = os.path.join(directory, *shard(name).split('/'))
+    if create:
+        os.makedirs(shard_dir, exist_ok=True)
+    return os.path.join(shard_dir, name)
+
+
+def relative_path(directory, path):
+    """Path of a stored file relative to its directory, with forward slashes (for pdf_link, sig_link)"""
+    absolute = os.path.abspath(path)
+    directory = os.path.abspath(directory)
+    if absolute.startswith(directory + os.sep):
+        return os.path.relpath(absolute, directory).replace(os.sep, '/')
+    return os.path.basename(path)
+
+
+def upload_name(prefix, filename):
+    """
+    Collision-free name for an upload, keeping its extension.
+
+    Args:
+        prefix: e.g. 'sig_4' (empty for none)
+        filename: The name the file was uploaded with
+
+    Returns:
+        str: e.g. 'sig_4_9e0c4d1b7a2f6e38.png'
+    """
+    extension = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    return f"{prefix}_{new_token()}{extension}" if prefix else f"{new_token()}{extension}"
+
+
+def documentation_name(filename):
+    """Collision-free name for a documentation upload, keeping the original name readable"""
+    return f"{new_token()}_{secure_filename(filename or '') or 'upload'}"
+
+
+def pdf_name(form_type, form_id, status, file_id):
+    """Name of a status PDF, as matched by pdf_stamp.PDF_NAME"""
+    return f"{form_type}_{form_id}_{status}_{file_id}_{new_token()}.pdf"
+
+
+def list_files(directory, after=''):
+    """
+    Files in a stored file directory and its shards, as sorted relative
+    paths (forward slashes) greater than after.
+    """
+    paths = []
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        relative = os.path.relpath(root, directory).replace(os.sep, '/')
+        for name in filenames:
+            path = name if relative == '.' else f"{relative}/{name}"
+            if path > after:
+                paths.append(path)
+    return sorted(paths)
+
+
+def locate(name, directory):
+    """Path of a file in its shard of directory, or None if it isn't there"""
+    path = sharded_path(directory, name, create=False)
+    return path if os.path.isfile(path) else None
+
+
+# -------------------------------
+# Migration
+# -------------------------------
+
+def _move_flat_files(directory, dry_run):
+    """Move the files directly inside directory into their shards. Returns the number moved."""
+    if not os.path.isdir(directory):
+        return 0
+    moved = 0
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if name.startswith('.') or not os.path.isfile(path):
+            continue
+        target = sharded_path(directory, name, create=not dry_run)
+        if os.path.exists(target):
+            logger.warning(f"Not moving {path}: {target} exists")
+            continue
+        if not dry_run:
+            os.replace(path, target)
+        moved += 1
+    return moved
+
+
+def _new_location(value, directory):
+    """
+    Where a stored path points after migration, keeping its style (absolute
+    paths stay absolute, others become relative to the app directory).
+    Returns None when the value needs no change.
+    """
+    if not value or not isinstance(value, str) or value.startswith('data:'):
+        return None
+    normalized = value.replace('\\', '/')
+    current = normalized if os.path.isabs(normalized) else os.path.join(BASE_DIR, normalized)
+    if os.path.isfile(current):
+        return None
+    target = locate(os.path.basename(normalized), directory)
+    if target is None:
+        return None
+    if os.path.isabs(normalized):
+        return target
+    return os.path.relpath(target, BASE_DIR).replace(os.sep, '/')
+
+
+def _new_list(value, directory):
+    """_new_location for a JSON list of paths; returns the new JSON or None"""
+    try:
+        paths = json.loads(value) if value else []
+    except ValueError:
+        return None
+    changed = False
+    for index, path in enumerate(paths):
+        new_path = _new_location(path, directory)
+        if new_path:
+            paths[index] = new_path
+            changed = True
+    return json.dumps(paths) if changed else None
+
+
+def migrate(db, form_models, artifact_model=None, job_model=None, dry_run=False):
+    """
+    Move files from the flat directories into their shards and point the
+    database at the new locations. Stop the app (and render workers) first.
+    Safe to re-run: only flat files are moved and only paths that no
+    longer resolve are rewritten.
+
+    Args:
+        db: The SQLAlchemy instance (inside an app context)
+        form_models: Dict of form type -> request model
+        artifact_model: The GeneratedArtifact model
+        job_model: The RenderJob model
+        dry_run: Count what would change without moving or writing anything
+
+    Returns:
+        dict: {'files': files moved, 'rows': rows rewritten}
+    """
+    counts = {'files': 0, 'rows': 0}
+    for directory in SHARDED_DIRS:
+        counts['files'] += _move_flat_files(directory, dry_run)
+    if dry_run:
+        return counts
+
+    # Column -> (directory, holds a JSON list, holds a bare name relative to the directory)
+    columns = {
+        'generated_pdfs': (PDF_DIR, True, False),
+        'documentation_files': (DOCUMENTATION_DIR, True, False),
+        'signature': (SIGNATURES_DIR, False, False),
+        'pdf_link': (FORMS_DIR, False, True),
+        'sig_link': (SIGNATURES_DIR, False, True),
+    }
+
+    for form_type, model in form_models.items():
+        for record in model.query.yield_per(200):
+            changed = False
+            for column, (directory, is_list, is_bare) in columns.items():
+                value = getattr(record, column, None)
+                if not value:
+                    continue
+                if is_list:
+                    new_value = _new_list(value, directory)
+                elif is_bare:
+                    new_value = None
+                    if not os.path.isfile(os.path.join(directory, value)) and locate(os.path.basename(value), directory):
+                        new_value = shard(os.path.basename(value)) + '/' + os.path.basename(value)
+                else:
+                    new_value = _new_location(value, directory)
+                if new_value:
+                    setattr(record, column, new_value)
+                    changed = True
+            counts['rows'] += changed
+        db.session.commit()
+
+    if job_model is not None:
+        for job in job_model.query.filter(job_model.pdf_path.isnot(None)).yield_per(200):
+            new_path = _new_location(job.pdf_path, PDF_DIR) or _new_location(job.pdf_path, FORMS_DIR)
+            if new_path:
+                job.pdf_path = new_path
+                counts['rows'] += 1
+        db.session.commit()
+
+    if artifact_model is not None:
+        for artifact in artifact_model.query.yield_per(200):
+            directory = os.path.join(BASE_DIR, os.path.dirname(artifact.path))
+            if directory not in SHARDED_DIRS:
+                continue
+            new_path = _new_location(artifact.path, directory)
+            if new_path:
+                artifact.path = new_path
+                counts['rows'] += 1
+        db.session.commit()
+
+    return counts
@@ -0,0 +1,119 @@
+"""
+Compiling against precompiled formats, with a stand-in pdflatex (latex_formats.py).
+
+    python -m pytest tests
+"""
+import os
+import sys
+import stat
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import latex_formats  # noqa: E402
+
+# Builds a format with -ini, fails loading it when FAKE_MODE=badfmt, fails
+# every document when FAKE_MODE=docerror, and otherwise writes an empty PDF.
+# Each run is logged to FAKE_LOG.
+FAKE_PDFLATEX = r"""#!/bin/sh
+out=.; job=; fmt=; ini=; last=
+for arg in "$@"; do
+  case "$arg" in
+    --version) echo "pdfTeX 3.141592653 (stand-in)"; exit 0;;
+    -ini) ini=1;;
+    -jobname=*) job="${arg#-jobname=}";;
+    -output-directory=*) out="${arg#-output-directory=}";;
+    -fmt=*) fmt="${arg#-fmt=}";;
+  esac
+  last="$arg"
+done
+echo "$*" >> "$FAKE_LOG"
+if [ -n "$ini" ]; then : > "$job.fmt"; exit 0; fi
+if [ -n "$fmt" ] && [ "$FAKE_MODE" = badfmt ]; then echo "---! ./$fmt.fmt was written by tex"; exit 1; fi
+if [ "$FAKE_MODE" = docerror ]; then echo "! Undefined control sequence."; exit 1; fi
+[ -z "$job" ] && job=$(basename "$last" .tex)
+: > "$out/$job.pdf"
+"""
+
+SOURCE = "\\documentclass{article}\n\\usepackage{graphicx}\n\\begin{document}\nHello\n\\end{document}\n"
+
+pytestmark = pytest.mark.skipif(os.name != 'posix', reason='the stand-in pdflatex is a shell script')
+
+
+@pytest.fixture
+def tex(tmp_path, monkeypatch):
+    """(pdflatex, tex path, output dir, log path) with an empty format directory"""
+    pdflatex = tmp_path / 'pdflatex'
+    pdflatex.write_text(FAKE_PDFLATEX)
+    pdflatex.chmod(pdflatex.stat().st_mode | stat.S_IEXEC)
+    log = tmp_path / 'runs.log'
+    monkeypatch.setenv('FAKE_LOG', str(log))
+    monkeypatch.setenv('FAKE_MODE', 'ok')
+
+    monkeypatch.setattr(latex_formats, 'FORMAT_DIR', str(tmp_path / 'formats'))
+    monkeypatch.setattr(latex_formats, 'ENABLED', True)
+    monkeypatch.setattr(latex_formats, '_failed_formats', set())
+    monkeypatch.setattr(latex_formats, '_versions', {})
+
+    work = tmp_path / 'work'
+    work.mkdir()
+    tex_path = work / 'form_1.tex'
+    tex_path.write_text(SOURCE, encoding='utf-8')
+    return str(pdflatex), str(tex_path), str(work), log
+
+
+def runs(log):
+    return log.read_text().splitlines()
+
+
+def format_path(pdflatex):
+    name = latex_formats.format_name(pdflatex, latex_formats.split_preamble(SOURCE)[0])
+    return os.path.join(latex_formats.FORMAT_DIR, f"{name}.fmt")
+
+
+def test_split_preamble_keeps_deterministic_settings_in_body():
+    import render_cache
+    preamble, body = latex_formats.split_preamble(render_cache.make_deterministic(SOURCE))
+
+    assert preamble == "\\documentclass{article}\n\\usepackage{graphicx}\n"
+    assert body.startswith(render_cache.DETERMINISTIC_PREAMBLE + latex_formats.BEGIN_DOCUMENT)
+    assert latex_formats.split_preamble('no document') is None
+
+
+def test_compiles_against_built_format(tex):
+    pdflatex, tex_path, out, log = tex
+
+    process = latex_formats.run_pdflatex(pdflatex, tex_path, out, passes=1)
+
+    assert process.returncode == 0
+    assert os.path.exists(os.path.join(out, 'form_1.pdf'))
+    assert os.path.exists(format_path(pdflatex))
+    assert ['-ini' in run for run in runs(log)] == [True, False]
+    assert '-fmt=' in runs(log)[1]
+
+
+def test_format_that_fails_to_load_is_discarded(tex, monkeypatch):
+    pdflatex, tex_path, out, log = tex
+    monkeypatch.setenv('FAKE_MODE', 'badfmt')
+
+    process = latex_formats.run_pdflatex(pdflatex, tex_path, out, passes=1)
+
+    # Compiled again without the format, which is not used again
+    assert process.returncode == 0
+    assert '-fmt=' not in runs(log)[-1]
+    assert not os.path.exists(format_path(pdflatex))
+    assert latex_formats.ensure_format(pdflatex, latex_formats.split_preamble(SOURCE)[0]) is None
+
+
+def test_document_error_keeps_format(tex, monkeypatch):
+    pdflatex, tex_path, out, log = tex
+    monkeypatch.setenv('FAKE_MODE', 'docerror')
+
+    process = latex_formats.run_pdflatex(pdflatex, tex_path, out, passes=2)
+
+    assert process.returncode == 1
+    assert not latex_formats.format_failed(process)
+    # No plain retry and no second pass of a document that can't compile
+    assert len(runs(log)) == 2
+    assert os.path.exists(format_path(pdflatex))
@@ -0,0 +1,116 @@
+"""
+Failure classification and the per-template circuit breaker (latex_limits.py).
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+import signal
+import subprocess
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import latex_limits  # noqa: E402
+
+
+def finished(returncode=1, stdout='', timed_out=False):
+    process = subprocess.CompletedProcess(['pdflatex'], returncode, stdout, '')
+    process.timed_out = timed_out
+    return process
+
+
+@pytest.fixture(autouse=True)
+def breakers(tmp_path, monkeypatch):
+    """A fresh breaker file and a threshold of 3"""
+    monkeypatch.setattr(latex_limits, 'BREAKER_STATE', str(tmp_path / 'latex_breakers.json'))
+    monkeypatch.setattr(latex_limits, 'BREAKER_THRESHOLD', 3)
+    monkeypatch.setattr(latex_limits, 'BREAKER_COOLDOWN', 300)
+    latex_limits.clear_failure()
+
+
+@pytest.mark.parametrize('process, reason', [
+    (finished(timed_out=True), latex_limits.REASON_TIMEOUT),
+    (finished(-signal.SIGKILL), latex_limits.REASON_KILLED),
+    (finished(stdout='! TeX capacity exceeded, sorry [main memory size=5000000].'), latex_limits.REASON_CAPACITY),
+    (finished(stdout='! Out of memory'), latex_limits.REASON_MEMORY_LIMIT),
+    (finished(stdout="! LaTeX Error: File `fancyhdr.sty' not found."), latex_limits.REASON_MISSING_FILE),
+    (finished(stdout='! LaTeX Error: Unknown graphics extension: .gif.'), latex_limits.REASON_IMAGE),
+    (finished(stdout='! Undefined control sequence.\nl.12 \\foo'), latex_limits.REASON_LATEX),
+])
+def test_classify(process, reason):
+    assert latex_limits.classify(process)[0] == reason
+
+
+@pytest.mark.skipif(latex_limits.resource is None, reason='rlimits need the resource module')
+def test_classify_cpu_limit():
+    assert latex_limits.classify(finished(-signal.SIGXCPU))[0] == latex_limits.REASON_CPU_LIMIT
+    # Reported by the sh wrapper of _limited_command
+    assert latex_limits.classify(finished(128 + signal.SIGXCPU))[0] == latex_limits.REASON_CPU_LIMIT
+
+
+def test_classify_keeps_first_error():
+    reason, detail = latex_limits.classify(finished(stdout='This is pdfTeX\n! Undefined control sequence.\nl.12 \\foo\n'))
+    assert detail == '! Undefined control sequence. l.12 \\foo'
+
+
+def test_breaker_opens_after_threshold_of_machine_failures():
+    for _ in range(2):
+        latex_limits.record_failure('ferpa', latex_limits.REASON_TIMEOUT)
+    assert latex_limits.allow('ferpa')
+
+    latex_limits.record_failure('ferpa', latex_limits.REASON_MEMORY_LIMIT)
+    assert not latex_limits.allow('ferpa')
+    assert latex_limits.paused_templates() == ['ferpa']
+    assert latex_limits.breaker_status() == {'ferpa': {'failures': 3, 'open': True}}
+    # Other templates are unaffected
+    assert latex_limits.allow('infochange')
+
+
+def test_request_errors_do_not_count():
+    for reason in (latex_limits.REASON_LATEX, latex_limits.REASON_MISSING_FILE, latex_limits.REASON_IMAGE,
+                   latex_limits.REASON_NO_LATEX, latex_limits.REASON_CIRCUIT_OPEN):
+        for _ in range(3):
+            latex_limits.record_failure('ferpa', reason)
+    assert latex_limits.allow('ferpa')
+    assert latex_limits.breaker_status() == {}
+
+
+def test_failure_counted_elsewhere_is_only_recorded():
+    for _ in range(3):
+        latex_limits.record_failure('ferpa', latex_limits.REASON_TIMEOUT, count=False)
+    assert latex_limits.allow('ferpa')
+    assert latex_limits.last_failure()['reason'] == latex_limits.REASON_TIMEOUT
+
+
+def test_success_closes_breaker():
+    for _ in range(2):
+        latex_limits.record_failure('ferpa', latex_limits.REASON_KILLED)
+    latex_limits.record_success('ferpa')
+    assert latex_limits.last_failure() is None
+    latex_limits.record_failure('ferpa', latex_limits.REASON_KILLED)
+    assert latex_limits.breaker_status() == {'ferpa': {'failures': 1, 'open': False}}
+
+
+def test_one_trial_after_cooldown(monkeypatch):
+    for _ in range(3):
+        latex_limits.record_failure('ferpa', latex_limits.REASON_TIMEOUT)
+    assert not latex_limits.allow('ferpa')
+
+    monkeypatch.setattr(latex_limits, 'BREAKER_COOLDOWN', 0.2)
+    time.sleep(0.25)
+    assert latex_limits.allow('ferpa')  # the trial
+    assert not latex_limits.allow('ferpa')  # held off while it runs
+
+    latex_limits.record_success('ferpa')
+    assert latex_limits.allow('ferpa')
+    assert latex_limits.paused_templates() == []
+
+
+def test_breaker_state_is_shared_through_the_file():
+    for _ in range(3):
+        latex_limits.record_failure('ferpa', latex_limits.REASON_TIMEOUT)
+    with open(latex_limits.BREAKER_STATE) as f:
+        assert '"ferpa"' in f.read()
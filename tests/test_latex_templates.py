@@ -0,0 +1,69 @@
+"""
+Escaping and filling of LaTeX templates (latex_templates.py).
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from latex_templates import (CompiledTemplate, BRACE_PLACEHOLDER, latex_escape,  # noqa: E402
+                             load_template)
+
+
+@pytest.mark.parametrize('value, escaped', [
+    ('R&D 50% off $5 #1', 'R\\&D 50\\% off \\$5 \\#1'),
+    ('first_name {x}', 'first\\_name \\{x\\}'),
+    ('~^', '\\textasciitilde{}\\textasciicircum{}'),
+    # A backslash is escaped once; the braces it expands to are not escaped again
+    ('C:\\temp', 'C:\\textbackslash{}temp'),
+    ('\\&', '\\textbackslash{}\\&'),
+    (None, ''),
+    (12, '12'),
+])
+def test_latex_escape(value, escaped):
+    assert latex_escape(value) == escaped
+
+
+def test_render_escapes_values_but_not_raw_ones():
+    template = CompiledTemplate('Name: ##NAME## \\includegraphics{##SIGNATURE##} ##SECTION##')
+
+    rendered = template.render({'NAME': 'Jo_Doe & Co', 'SIGNATURE': 'static/uploads/sig_1.png',
+                                'SECTION': '\\section*{Approval}'}, raw=('SIGNATURE', 'SECTION'))
+
+    assert rendered == ('Name: Jo\\_Doe \\& Co \\includegraphics{static/uploads/sig_1.png} '
+                        '\\section*{Approval}')
+
+
+def test_render_leaves_missing_fields_empty_and_repeats_slots():
+    template = CompiledTemplate('##A##-##B##-##A##')
+
+    assert template.fields == {'A', 'B'}
+    assert template.render({'A': 'x'}) == 'x--x'
+
+
+def test_value_with_placeholder_text_is_not_filled_again():
+    template = CompiledTemplate('##A## ##B##')
+
+    assert template.render({'A': '##B##', 'B': 'b'}) == '\\#\\#B\\#\\# b'
+
+
+def test_brace_placeholders():
+    template = CompiledTemplate('\\textbf{{{NAME}}}', BRACE_PLACEHOLDER)
+
+    assert template.render({'NAME': '50%'}) == '\\textbf{50\\%}'
+
+
+def test_load_template_reparses_changed_file(tmp_path):
+    path = tmp_path / 'form.tex'
+    path.write_text('Old ##NAME##', encoding='utf-8')
+    first = load_template(str(path))
+    assert load_template(str(path)) is first
+
+    path.write_text('New ##NAME##', encoding='utf-8')
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 1_000_000))
+
+    assert load_template(str(path)).render({'NAME': 'x'}) == 'New x'
@@ -0,0 +1,80 @@
+"""
+Stamping a status change onto a pending PDF (pdf_stamp.py).
+
+    python -m pytest tests
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('pypdf')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import direct_pdf  # noqa: E402
+import pdf_stamp  # noqa: E402
+from pypdf import PdfReader, PdfWriter  # noqa: E402
+
+BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+# Rendered by pdflatex from static/templates/medical_withdrawal_template.tex
+LATEX_PENDING_PDF = os.path.join(BASE_DIR, 'static', 'pdfs', 'medical_withdrawal_1_pending_20250420002424.pdf')
+
+
+def page_texts(path):
+    return [page.extract_text() for page in PdfReader(path).pages]
+
+
+@pytest.fixture
+def direct_pending_pdf(tmp_path):
+    """A pending student drop PDF from the direct backend, whose reason mentions PENDING"""
+    path = str(tmp_path / 'student_drop_9_pending_20250419000000.pdf')
+    direct_pdf.render_student_drop({
+        'FORMID': '9', 'STATUS': 'PENDING', 'FULLNAME': 'Jo Doe', 'MYUHID': '1234567',
+        'COURSE_TITLE': 'MATH 1314', 'REASON': 'Waiting on PENDING transfer credit',
+        'DROP_DATE': '2025-04-19', 'SIGNATURE': {'text': 'Jo Doe'}, 'CREATED_DATE': 'April 19, 2025',
+    }, path)
+    return path
+
+
+def test_replaces_status_in_direct_pdf(direct_pending_pdf, tmp_path):
+    snapshot = SimpleNamespace(id=9, status='rejected', created_at=None)
+    out = pdf_stamp.stamp_pdf(direct_pending_pdf, str(tmp_path / 'stamped.pdf'), 'student_drop',
+                              snapshot, 'rejected')
+
+    first_page, approval_page = page_texts(out)
+    assert 'Status: PENDING' not in first_page
+    assert 'REJECTED' in first_page
+    # The same word typed by the student is not a status
+    assert 'Waiting on PENDING transfer credit' in first_page
+    assert 'Status: REJECTED' in approval_page
+
+
+def test_replaces_status_in_latex_pdf(tmp_path):
+    snapshot = SimpleNamespace(id=1, status='approved', created_at=None)
+    out = pdf_stamp.stamp_pdf(LATEX_PENDING_PDF, str(tmp_path / 'stamped.pdf'), 'medical_withdrawal',
+                              snapshot, 'approved', approvers=['Ada Admin'])
+
+    texts = page_texts(out)
+    assert len(texts) == len(PdfReader(LATEX_PENDING_PDF).pages) + 1
+    assert not any('PENDING' in text for text in texts)
+    assert 'APPROVED' in texts[0] and 'APPROVED' in texts[1]
+    assert 'Ada Admin' in texts[-1]
+
+
+def test_remove_text_reports_positions():
+    page = PdfWriter(clone_from=LATEX_PENDING_PDF).pages[0]
+    [(x, baseline, width, size)] = pdf_stamp.remove_text(page, 'PENDING', 'Status:')
+
+    assert 72 < x < 540 and 600 < baseline < 720
+    assert width > 0 and size == pytest.approx(11.9552)
+    assert 'PENDING' not in page.extract_text()
+
+
+def test_pdf_without_status_needs_full_render(tmp_path):
+    path = str(tmp_path / 'student_drop_9_pending_20250419000000.pdf')
+    direct_pdf.render_student_drop({'FORMID': '9', 'STATUS': '', 'SIGNATURE': {'text': 'Jo Doe'}}, path)
+    snapshot = SimpleNamespace(id=9, status='approved', created_at=None)
+
+    assert pdf_stamp.stamp_pdf(path, str(tmp_path / 'stamped.pdf'), 'student_drop', snapshot, 'approved') is None
@@ -0,0 +1,93 @@
+"""
+Content addressing of rendered PDFs (render_cache.py).
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import render_cache  # noqa: E402
+
+SOURCE = "\\documentclass{article}\\begin{document}Jo Doe\\includegraphics[width=2in]{%s}\\end{document}"
+
+
+def write(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    """An empty cache with its own template directory"""
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    write(templates / 'form.tex', b'\\documentclass{article}')
+    monkeypatch.setattr(render_cache, 'CACHE_DIR', str(tmp_path / 'render_cache'))
+    monkeypatch.setattr(render_cache, 'TEMPLATE_DIRS', [str(templates)])
+    monkeypatch.setattr(render_cache, 'ENABLED', True)
+    monkeypatch.setattr(render_cache, '_active_namespace', None)
+    return tmp_path
+
+
+def test_same_image_under_another_name_has_same_key(tmp_path):
+    first = write(tmp_path / 'sig_1.png', b'signature')
+    second = write(tmp_path / 'sig_2.png', b'signature')
+
+    assert render_cache.cache_key(SOURCE % first) == render_cache.cache_key(SOURCE % second)
+
+
+def test_changed_image_changes_key(tmp_path):
+    path = write(tmp_path / 'sig.png', b'signature')
+    before = render_cache.cache_key(SOURCE % path)
+    write(path, b'another signature')
+
+    assert render_cache.cache_key(SOURCE % path) != before
+
+
+def test_relative_and_extensionless_paths_resolve_against_base_dir(tmp_path):
+    write(tmp_path / 'sig.png', b'signature')
+
+    assert (render_cache.cache_key(SOURCE % 'sig', base_dir=str(tmp_path))
+            == render_cache.cache_key(SOURCE % str(tmp_path / 'sig.png')))
+
+
+def test_missing_image_never_shares_a_key(tmp_path):
+    write(tmp_path / 'sig.png', b'signature')
+    missing = render_cache.cache_key(SOURCE % str(tmp_path / 'gone.png'))
+
+    assert missing != render_cache.cache_key(SOURCE % str(tmp_path / 'sig.png'))
+    assert missing != render_cache.cache_key(SOURCE % str(tmp_path / 'other.png'))
+
+
+def test_text_changes_key(tmp_path):
+    path = write(tmp_path / 'sig.png', b'signature')
+
+    assert render_cache.cache_key(SOURCE % path) != render_cache.cache_key((SOURCE % path).replace('Jo', 'Al'))
+
+
+def test_store_and_fetch(cache):
+    pdf = write(cache / 'out.pdf', b'%PDF-1.4 rendered')
+    key = render_cache.cache_key(SOURCE % 'none')
+    dest = str(cache / 'copy.pdf')
+
+    assert not render_cache.fetch(key, dest)
+    render_cache.store(key, pdf)
+    assert render_cache.fetch(key, dest)
+    with open(dest, 'rb') as f:
+        assert f.read() == b'%PDF-1.4 rendered'
+
+
+def test_template_change_drops_cache(cache):
+    pdf = write(cache / 'out.pdf', b'%PDF-1.4 rendered')
+    key = render_cache.cache_key(SOURCE % 'none')
+    render_cache.store(key, pdf)
+
+    write(cache / 'templates' / 'form.tex', b'\\documentclass[12pt]{article}')
+
+    assert not render_cache.fetch(key, str(cache / 'copy.pdf'))
+    assert os.listdir(render_cache.CACHE_DIR) == [render_cache.template_fingerprint()]
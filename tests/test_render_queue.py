@@ -0,0 +1,190 @@
+"""
+RenderQueue claiming and the stale job sweep, on an in-memory SQLite table.
+
+    python -m pytest tests
+"""
+import os
+import sys
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import latex_limits  # noqa: E402
+import render_queue  # noqa: E402
+from render_queue import QUEUED, RUNNING, FAILED, KIND_FINAL, KIND_SPECULATIVE, RenderQueue  # noqa: E402
+
+app = Flask(__name__)
+app.config.update(SQLALCHEMY_DATABASE_URI='sqlite://', RENDER_POOL_SIZE=2, RENDER_JOB_TIMEOUT=600)
+db = SQLAlchemy(app)
+
+
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    form_type = db.Column(db.String(50), nullable=False)
+    form_id = db.Column(db.Integer, nullable=False)
+    form_status = db.Column(db.String(20), nullable=False)
+    state = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, default=0)
+    pdf_path = db.Column(db.String(300))
+    error = db.Column(db.Text)
+    failure_reason = db.Column(db.String(30))
+    kind = db.Column(db.String(20), nullable=False, default='final')
+    content_hash = db.Column(db.String(64))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+
+class Form(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    status = db.Column(db.String(20), default='pending')
+    generated_pdfs = db.Column(db.Text)
+    reason = db.Column(db.String(100))
+
+
+class RecordingExecutor:
+    """Stands in for the worker pool; keeps what was submitted"""
+
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, fn, form_type, snapshot):
+        self.submitted.append((form_type, snapshot))
+        return Future()
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    monkeypatch.setattr(latex_limits, 'paused_templates', lambda: set())
+    with app.app_context():
+        db.create_all()
+        q = RenderQueue(app, db, Job, {'student_drop': Form, 'ferpa': Form})
+        q._executor = RecordingExecutor()
+        yield q
+        db.session.remove()
+        db.drop_all()
+
+
+def add_job(form, form_type='student_drop', **values):
+    job = Job(form_type=form_type, form_id=form.id, form_status=form.status, **values)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def add_form(**values):
+    form = Form(**values)
+    db.session.add(form)
+    db.session.commit()
+    return form
+
+
+def test_claims_queued_job_and_submits_snapshot(queue):
+    form = add_form(reason='Moving')
+    job = add_job(form)
+
+    queue._claim_and_submit()
+
+    db.session.refresh(job)
+    assert job.state == RUNNING
+    assert job.attempts == 1
+    assert job.started_at is not None
+    assert job.id in queue._in_flight
+    form_type, snapshot = queue._executor.submitted[0]
+    assert form_type == 'student_drop'
+    assert snapshot.reason == 'Moving'
+
+
+def test_claims_no_more_than_free_slots_and_finals_first(queue):
+    form = add_form()
+    speculative = add_job(form, kind=KIND_SPECULATIVE, content_hash=render_queue.content_hash(form),
+                          created_at=datetime.utcnow() - timedelta(minutes=5))
+    finals = [add_job(form, kind=KIND_FINAL) for _ in range(2)]
+
+    queue._claim_and_submit()
+
+    assert set(queue._in_flight) == {job.id for job in finals}
+    assert db.session.get(Job, speculative.id).state == QUEUED
+
+    # Full pool: nothing else is claimed
+    queue._claim_and_submit()
+    assert len(queue._executor.submitted) == 2
+
+
+def test_skips_paused_form_types(queue, monkeypatch):
+    monkeypatch.setattr(latex_limits, 'paused_templates', lambda: {'ferpa'})
+    form = add_form()
+    paused = add_job(form, form_type='ferpa')
+    running = add_job(form, form_type='student_drop')
+
+    queue._claim_and_submit()
+
+    assert db.session.get(Job, paused.id).state == QUEUED
+    assert list(queue._in_flight) == [running.id]
+
+
+def test_job_already_claimed_elsewhere_is_left_alone(queue):
+    form = add_form()
+    job = add_job(form)
+    Job.query.filter_by(id=job.id).update({'state': RUNNING})
+    db.session.commit()
+
+    queue._claim_and_submit()
+
+    assert queue._executor.submitted == []
+
+
+def test_missing_request_fails_the_job(queue):
+    form = add_form()
+    job = add_job(form)
+    db.session.delete(form)
+    db.session.commit()
+
+    queue._claim_and_submit()
+
+    assert db.session.get(Job, job.id).state == FAILED
+    assert queue._executor.submitted == []
+
+
+def test_changed_draft_drops_speculative_job(queue):
+    form = add_form(reason='Moving')
+    job_id = add_job(form, kind=KIND_SPECULATIVE, content_hash=render_queue.content_hash(form)).id
+    form.reason = 'Health'
+    db.session.commit()
+
+    queue._claim_and_submit()
+
+    assert db.session.get(Job, job_id) is None
+    assert queue._executor.submitted == []
+
+
+def test_stale_sweep_requeues_orphans_but_not_own_renders(queue):
+    form = add_form()
+    long_ago = datetime.utcnow() - timedelta(hours=1)
+    orphan = add_job(form, state=RUNNING, started_at=long_ago)
+    own = add_job(form, state=RUNNING, started_at=long_ago)
+    recent = add_job(form, state=RUNNING, started_at=datetime.utcnow())
+    queue._in_flight[own.id] = Future()
+
+    queue._requeue_stale_jobs()
+
+    assert db.session.get(Job, orphan.id).state == QUEUED
+    assert db.session.get(Job, own.id).state == RUNNING
+    assert db.session.get(Job, recent.id).state == RUNNING
+
+
+def test_content_hash_ignores_bookkeeping_columns(queue):
+    form = add_form(reason='Moving')
+    before = render_queue.content_hash(form)
+
+    form.status = 'approved'
+    form.generated_pdfs = '["static/pdfs/a.pdf"]'
+    assert render_queue.content_hash(form) == before
+
+    form.reason = 'Health'
+    assert render_queue.content_hash(form) != before
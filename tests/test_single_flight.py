@@ -0,0 +1,120 @@
+"""
+Coalescing concurrent regenerations (single_flight.py).
+
+    python -m pytest tests
+"""
+import os
+import sys
+import time
+import threading
+import multiprocessing
+
+import pytest
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import single_flight  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def lock_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(single_flight, 'LOCK_DIR', str(tmp_path / 'locks'))
+    return tmp_path
+
+
+def test_concurrent_threads_share_one_run():
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def produce():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'static/pdfs/ferpa_1.pdf'
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(single_flight.run(('ferpa', 1), produce)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(single_flight.run(('ferpa', 1), produce)))
+                 for _ in range(4)]
+    for thread in followers:
+        thread.start()
+    time.sleep(0.2)  # let them join the flight
+    release.set()
+    for thread in [leader] + followers:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ['static/pdfs/ferpa_1.pdf'] * 5
+
+
+def test_error_reaches_every_waiter():
+    started, release = threading.Event(), threading.Event()
+
+    def produce():
+        started.set()
+        release.wait(5)
+        raise RuntimeError('render failed')
+
+    errors = []
+
+    def call():
+        try:
+            single_flight.run(('ferpa', 2), produce)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait(5)
+    follower = threading.Thread(target=call)
+    follower.start()
+    time.sleep(0.2)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert errors == ['render failed', 'render failed']
+
+
+def test_stored_result_skips_the_work():
+    assert single_flight.run(('ferpa', 3), lambda: pytest.fail('produced again'), check=lambda: 'done') == 'done'
+
+
+def test_different_keys_do_not_wait():
+    assert single_flight.run(('ferpa', 4), lambda: 'a') == 'a'
+    assert single_flight.run(('ferpa', 5), lambda: 'b') == 'b'
+    assert single_flight._flights == {}
+
+
+def _hold_lock(key, lock_dir, locked, release):
+    single_flight.LOCK_DIR = lock_dir
+    handle = single_flight._acquire(single_flight._lock_path(key), 5)
+    locked.set()
+    release.wait(5)
+    single_flight._release(handle)
+
+
+@pytest.mark.skipif(single_flight.fcntl is None, reason='processes are only coalesced with fcntl')
+def test_other_process_result_is_reused(lock_dir):
+    key = ('ferpa', 6)
+    context = multiprocessing.get_context('fork')
+    locked, release = context.Event(), context.Event()
+    holder = context.Process(target=_hold_lock, args=(key, single_flight.LOCK_DIR, locked, release))
+    holder.start()
+    locked.wait(5)
+
+    stored = []
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(
+        single_flight.run(key, lambda: 'rendered here', check=lambda: stored[0] if stored else None)))
+    waiter.start()
+
+    # The other process finishes its render and lets go of the lock
+    stored.append('rendered there')
+    release.set()
+    waiter.join(5)
+    holder.join(5)
+
+    assert result == ['rendered there']
@@ -0,0 +1,161 @@
+"""
+Round trip of a file through S3Storage against an in-process S3 (moto).
+
+    pip install -r requirements-s3.txt moto pytest
+    python -m pytest tests
+"""
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip('boto3')
+moto = pytest.importorskip('moto')
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import storage  # noqa: E402
+
+BUCKET = 'edmonton-test'
+PDF_PATH = 'static/pdfs/3f/a9/ferpa_1_pending_20250420002424_5c1e2f7a9b0d4e6f.pdf'
+CONTENT = b'%PDF-1.4\n' + os.urandom(64 * 1024)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """S3Storage on a mocked bucket, with tmp_path as the app directory"""
+    for name, value in {'AWS_ACCESS_KEY_ID': 'test', 'AWS_SECRET_ACCESS_KEY': 'test',
+                        'AWS_DEFAULT_REGION': 'us-east-1'}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.setattr(storage, 'BASE_DIR', str(tmp_path))
+    monkeypatch.setattr(storage, 'PENDING_FILE', str(tmp_path / 'instance' / 'storage_pending.txt'))
+    with moto.mock_aws():
+        import boto3
+        boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=BUCKET)
+        yield storage.S3Storage(bucket=BUCKET, endpoint_url=None, public_url=None, prefix='')
+
+
+def write_local(path, data=CONTENT):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def test_round_trip(store, monkeypatch):
+    from flask import Flask
+
+    local = storage.local_path(PDF_PATH)
+    write_local(local)
+    assert store.publish(PDF_PATH) == PDF_PATH
+    assert store.stored(PDF_PATH)
+
+    # Another node: no local copy, fetched from the bucket
+    os.remove(local)
+    store._known.clear()
+    assert store.exists(PDF_PATH)
+    assert store.fetch(PDF_PATH) == local
+    with open(local, 'rb') as f:
+        assert f.read() == CONTENT
+
+    app = Flask(__name__)
+    with app.test_request_context('/'):
+        response = store.send(PDF_PATH, etag='abc')
+        assert response.status_code == 302
+        assert BUCKET in response.location and 'Signature' in response.location
+
+    monkeypatch.setattr(storage, 'S3_PRESIGN', False)
+    with app.test_request_context('/', headers={'Range': 'bytes=0-8'}):
+        response = store.send(PDF_PATH)
+        assert response.status_code == 206
+        assert b''.join(response.response) == CONTENT[:9]
+
+    store.delete(PDF_PATH)
+    assert not os.path.exists(local)
+    assert not store.stored(PDF_PATH)
+    assert store.fetch(PDF_PATH) is None
+
+
+class NoArtifacts:
+    """Stands in for GeneratedArtifact with an empty index"""
+
+    class query:
+        @staticmethod
+        def with_entities(*columns):
+            return NoArtifacts.query
+
+        @staticmethod
+        def yield_per(count):
+            return []
+
+    path = None
+
+
+def test_failed_upload_is_kept_for_publish_storage(store, monkeypatch):
+    from botocore.exceptions import EndpointConnectionError
+
+    def unreachable(*args, **kwargs):
+        raise EndpointConnectionError(endpoint_url='http://store')
+
+    local = storage.local_path(PDF_PATH)
+    write_local(local)
+    with monkeypatch.context() as patch:
+        patch.setattr(store._client(), 'upload_file', unreachable)
+        assert store.publish(PDF_PATH) == PDF_PATH
+    assert os.path.isfile(local)
+    assert not store.stored(PDF_PATH)
+
+    monkeypatch.setattr(storage, '_backend', store)
+    counts = storage.publish_existing(NoArtifacts)
+    assert counts == {'uploaded': 1, 'present': 0, 'missing': 0, 'failed': 0}
+    assert store.stored(PDF_PATH)
+    assert storage.take_pending() == []
+
+
+def test_key_deleted_by_another_node_is_looked_up_again(store, monkeypatch):
+    import boto3
+
+    local = storage.local_path(PDF_PATH)
+    write_local(local)
+    store.publish(PDF_PATH)
+    os.remove(local)
+
+    # Another node's janitor removes the object
+    boto3.client('s3', region_name='us-east-1').delete_object(Bucket=BUCKET, Key=store.object_key(PDF_PATH))
+    assert store.stored(PDF_PATH)  # still trusted within S3_EXISTS_TTL
+
+    # A failed download forgets the key at once
+    assert store.fetch(PDF_PATH) is None
+    assert not store.stored(PDF_PATH)
+
+    # Otherwise it is looked up again once the TTL has passed
+    write_local(local)
+    store.publish(PDF_PATH)
+    boto3.client('s3', region_name='us-east-1').delete_object(Bucket=BUCKET, Key=store.object_key(PDF_PATH))
+    monkeypatch.setattr(storage, 'EXISTS_TTL', 0)
+    store._remember(store.object_key(PDF_PATH))
+    assert not store.stored(PDF_PATH)
+
+
+def test_index_file_from_another_node_without_downloading(store, monkeypatch):
+    import hashlib
+    import artifacts
+
+    class Session(list):
+        add = list.append
+
+    local = storage.local_path(PDF_PATH)
+    write_local(local)
+    store.publish(PDF_PATH)
+    os.remove(local)
+
+    monkeypatch.setattr(storage, '_backend', store)
+    monkeypatch.setattr(artifacts, 'BASE_DIR', storage.BASE_DIR)
+    monkeypatch.setattr(store, 'fetch', lambda path: pytest.fail('downloaded to index'))
+    artifact = artifacts.register_artifact(Session(), lambda **values: SimpleNamespace(**values),
+                                           'ferpa', 1, artifacts.KIND_PDF, PDF_PATH)
+
+    assert artifact.path == PDF_PATH
+    assert artifact.size == len(CONTENT)
+    assert artifact.sha256 == hashlib.sha256(CONTENT).hexdigest()
+    assert not os.path.exists(local)